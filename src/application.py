@@ -3,6 +3,7 @@
 from utils import *
 from client import client
 from server import server
+from supervisor import Supervisor
 
 # ---------------- MAIN FUNCTION ----------------
 # This function parses and validates command-line arguments, then starts the client or server as specified
@@ -19,6 +20,8 @@ def main():
     # Start the client or server based on the arguments
     if args.client:
         client(args)
+    elif args.server and args.workers > 1:
+        Supervisor(args).run()
     elif args.server:
         server(args)
     else:
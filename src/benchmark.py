@@ -0,0 +1,345 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities and the modules used to run and compare the benchmark
+from utils import *
+import csv
+import filecmp
+import glob
+import json
+import shlex
+import signal
+import subprocess
+import sys
+import tempfile
+
+# ---------------- LOOPBACK BENCHMARK ---------------- 
+# Runs the real client and server over loopback, through impair.py, for every combination of
+# impairment profile, file size, window size and mode. It prints tables of throughput, completion
+# time and retransmissions, writes every run to a CSV file, and compares the throughput with a
+# baseline file so that regressions show up. The baseline is machine-specific: record one with
+# --save-baseline on the machine the comparisons run on.
+
+# Impairment profiles, as impair.py arguments: delay and jitter in milliseconds, rate in Mbps
+PROFILES = {
+    'clean': {},
+    'lan': {'delay': 0.5, 'jitter': 0.1, 'rate': 1000},
+    'wan': {'delay': 20, 'jitter': 2, 'loss': 0.001, 'rate': 100},
+    'lossy': {'delay': 10, 'loss': 0.02, 'rate': 50},
+    'reordering': {'delay': 5, 'jitter': 3, 'reorder': 0.02, 'duplicate': 0.01},
+    'satellite': {'delay': 300, 'loss': 0.005, 'rate': 10},
+}
+
+SRC_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BASELINE = os.path.join(SRC_DIR, 'benchmark-baseline.json')
+SIZE_UNITS = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3}
+READY_TIMEOUT = 5.0  # seconds the server and the proxy may take to start
+
+
+def parse_size(text):
+    """
+    Parses a file size such as 512K or 8M.
+    Args:
+        text (str): The size, in bytes or with a K, M or G suffix.
+    Returns:
+        int: The size in bytes.
+    """
+    text = text.strip().upper()
+    if text[-1:] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def format_size(size):
+    """
+    Returns:
+        str: The size with the largest suffix that divides it, as parse_size reads it.
+    """
+    for unit, factor in sorted(SIZE_UNITS.items(), key=lambda item: -item[1]):
+        if size % factor == 0:
+            return f'{size // factor}{unit}'
+    return str(size)
+
+
+def free_port():
+    """
+    Returns:
+        int: A UDP port on loopback that is not in use.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start(command, log_path, ready_text):
+    """
+    Starts a process and waits until it prints the line that says it is ready.
+    Args:
+        command (list): The command line.
+        log_path (str): Where the output of the process goes.
+        ready_text (str): The text the process prints once it is ready.
+    Returns:
+        subprocess.Popen: The process.
+    """
+    log = open(log_path, 'w')
+    process = subprocess.Popen(command, cwd=SRC_DIR, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline and process.poll() is None:
+        with open(log_path) as output:
+            if ready_text in output.read():
+                return process
+        time.sleep(0.05)
+    stop(process)
+    raise RuntimeError(f"{' '.join(command)} did not start, see {log_path}")
+
+
+def stop(process):
+    """
+    Interrupts a process the way Ctrl-C does and waits for it to exit.
+    """
+    if process.poll() is None:
+        process.send_signal(signal.SIGINT)
+        try:
+            process.wait(READY_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def read_metrics(metrics_path):
+    """
+    Adds up the last metrics line of every client process, of which there are several with --streams.
+    Args:
+        metrics_path (str): The --metrics-file given to the client.
+    Returns:
+        dict: The retransmissions, timeouts and transfer time, None if there are no metrics.
+    """
+    stem, extension = os.path.splitext(metrics_path)
+    totals = None
+    for path in sorted(glob.glob(f'{stem}*{extension}')):
+        with open(path) as lines:
+            last = None
+            for line in lines:
+                last = line
+        if last is None:
+            continue
+        snapshot = json.loads(last)
+        totals = totals or {'retransmissions': 0, 'timeouts': 0, 'elapsed': 0.0}
+        totals['retransmissions'] += snapshot['retransmissions']
+        totals['timeouts'] += snapshot['timeouts']
+        totals['elapsed'] = max(totals['elapsed'], snapshot['elapsed'])
+    return totals
+
+
+def run_once(args, workdir, input_path, profile, size, window, mode, number):
+    """
+    Transfers a file once through the proxy.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        workdir (str): The directory for the output, logs and metrics of the run.
+        input_path (str): The file to send.
+        profile (str): The name of the impairment profile.
+        size (int): The size of the file.
+        window (int): The window size of the client.
+        mode (str): gbn or sr.
+        number (int): The number of the run, which names its files.
+    Returns:
+        dict: The result of the run.
+    """
+    run_dir = os.path.join(workdir, f'run{number}')
+    os.makedirs(run_dir)
+    output_path = os.path.join(run_dir, 'received.bin')
+    metrics_path = os.path.join(run_dir, 'metrics.jsonl')
+    server_port, proxy_port = free_port(), free_port()
+    result = {'profile': profile, 'size': format_size(size), 'window': window, 'mode': mode, 'status': 'ok',
+              'completion_time': None, 'throughput_mbps': None, 'retransmissions': None, 'timeouts': None,
+              'wall_time': None}
+
+    server = start([sys.executable, 'application.py', '-s', '-i', '127.0.0.1', '-p', str(server_port),
+                    '-o', output_path, *shlex.split(args.server_args)],
+                   os.path.join(run_dir, 'server.log'), 'Server started')
+    proxy_command = [sys.executable, 'impair.py', '--listen', f'127.0.0.1:{proxy_port}',
+                     '--target', f'127.0.0.1:{server_port}', '--seed', str(args.seed + number)]
+    for option, value in PROFILES[profile].items():
+        proxy_command += [f'--{option}', str(value)]
+    try:
+        proxy = start(proxy_command, os.path.join(run_dir, 'proxy.log'), 'Proxy forwarding')
+    except RuntimeError:
+        stop(server)
+        raise
+    started = time.monotonic()
+    try:
+        with open(os.path.join(run_dir, 'client.log'), 'w') as log:
+            subprocess.run([sys.executable, 'application.py', '-c', '-i', '127.0.0.1', '-p', str(proxy_port),
+                            '-f', input_path, '-w', str(window), '-m', mode, '--metrics-file', metrics_path,
+                            *shlex.split(args.client_args)],
+                           cwd=SRC_DIR, stdout=log, stderr=subprocess.STDOUT, timeout=args.timeout)
+        result['wall_time'] = round(time.monotonic() - started, 3)
+        # The server may still be writing the last chunks when the client exits
+        deadline = time.monotonic() + READY_TIMEOUT
+        while time.monotonic() < deadline and (not os.path.exists(output_path) or os.path.getsize(output_path) < size):
+            time.sleep(0.05)
+    except subprocess.TimeoutExpired:
+        result['status'] = 'timeout'
+    finally:
+        stop(proxy)
+        stop(server)
+
+    metrics = read_metrics(metrics_path)
+    if metrics is not None:
+        result['retransmissions'] = metrics['retransmissions']
+        result['timeouts'] = metrics['timeouts']
+        if result['status'] == 'ok' and metrics['elapsed'] > 0:
+            result['completion_time'] = round(metrics['elapsed'], 3)
+            result['throughput_mbps'] = round(size * 8 / metrics['elapsed'] / 1000000, 2)
+    if result['status'] == 'ok' and not (os.path.exists(output_path) and filecmp.cmp(input_path, output_path, shallow=False)):
+        result['status'] = 'corrupt'
+    return result
+
+
+def median_result(results):
+    """
+    Returns:
+        dict: The run with the median throughput, so repeats smooth out noise without averaging failures away.
+    """
+    failed = [result for result in results if result['status'] != 'ok' or result['throughput_mbps'] is None]
+    if failed:
+        return failed[0]
+    return sorted(results, key=lambda result: result['throughput_mbps'])[len(results) // 2]
+
+
+def result_key(result):
+    return f"{result['profile']}/{result['size']}/{result['window']}/{result['mode']}"
+
+
+def print_table(results, field, title):
+    """
+    Prints one value of every run as a table with a row per profile, size and mode and a column per window.
+    """
+    windows = sorted({result['window'] for result in results})
+    rows = {}
+    for result in results:
+        value = result[field] if result['status'] == 'ok' else result['status']
+        rows.setdefault((result['profile'], result['size'], result['mode']), {})[result['window']] = value
+    print(f"\n{title}")
+    print(f"{'profile':<12}{'size':>8}{'mode':>6}" + ''.join(f"{f'w={window}':>12}" for window in windows))
+    for (profile, size, mode), values in rows.items():
+        cells = ''.join(f"{'-' if values.get(window) is None else values[window]:>12}" for window in windows)
+        print(f"{profile:<12}{size:>8}{mode:>6}{cells}")
+
+
+def compare(results, baseline, tolerance):
+    """
+    Compares the throughput of every run with the baseline.
+    Args:
+        results (list): The results of the runs.
+        baseline (dict): The baseline results by key.
+        tolerance (float): The fraction the throughput may drop by.
+    Returns:
+        list: A line describing every regression.
+    """
+    regressions = []
+    for result in results:
+        expected = baseline.get(result_key(result))
+        if expected is None:
+            continue
+        if result['status'] != 'ok':
+            regressions.append(f"{result_key(result)}: {result['status']}")
+        elif result['throughput_mbps'] < expected['throughput_mbps'] * (1 - tolerance):
+            change = (result['throughput_mbps'] / expected['throughput_mbps'] - 1) * 100
+            regressions.append(f"{result_key(result)}: {result['throughput_mbps']} Mbps, "
+                               f"baseline {expected['throughput_mbps']} Mbps ({change:+.0f}%)")
+    return regressions
+
+
+def main():
+    """
+    Runs the benchmark sweep given on the command line.
+    """
+    parser = argparse.ArgumentParser(description='Benchmark the DRTP client and server over loopback through an impairment proxy')
+    parser.add_argument('--profiles', default='clean,wan,lossy', help=f"Comma-separated impairment profiles out of {', '.join(PROFILES)}, default is clean,wan,lossy")
+    parser.add_argument('--sizes', default='1M,8M', help='Comma-separated file sizes, default is 1M,8M')
+    parser.add_argument('--windows', default='3,64,512', help='Comma-separated window sizes, default is 3,64,512')
+    parser.add_argument('--modes', default='sr', help='Comma-separated modes out of gbn and sr, default is sr')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of every combination, of which the median is kept, default is 3')
+    parser.add_argument('--timeout', type=float, default=BENCHMARK_TIMEOUT, help=f'Seconds a run may take, default is {BENCHMARK_TIMEOUT}')
+    parser.add_argument('--client-args', default='', help='Extra arguments for the client, such as "--cc cubic"')
+    parser.add_argument('--server-args', default='', help='Extra arguments for the server, such as "--writer-thread"')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the random impairments')
+    parser.add_argument('--results', default='benchmark-results.csv', help='CSV file every run is written to, default is benchmark-results.csv')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE, help='Baseline file to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Write the results to the baseline file instead of comparing with it')
+    parser.add_argument('--tolerance', type=float, default=BENCHMARK_TOLERANCE, help=f'Fraction the throughput may drop below the baseline, default is {BENCHMARK_TOLERANCE}')
+    args = parser.parse_args()
+
+    profiles = args.profiles.split(',')
+    for profile in profiles:
+        if profile not in PROFILES:
+            print(f"Error: unknown profile {profile}, choose from {', '.join(PROFILES)}")
+            sys.exit(1)
+    modes = args.modes.split(',')
+    if any(mode not in ('gbn', 'sr') for mode in modes):
+        print("Error: modes must be gbn or sr")
+        sys.exit(1)
+    try:
+        sizes = [parse_size(size) for size in args.sizes.split(',')]
+        windows = [int(window) for window in args.windows.split(',')]
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix='drtp-benchmark-') as workdir:
+        number = 0
+        for size in sizes:
+            input_path = os.path.join(workdir, f'input-{format_size(size)}.bin')
+            with open(input_path, 'wb') as data:
+                data.write(os.urandom(size))
+            for profile in profiles:
+                for mode in modes:
+                    for window in windows:
+                        repeats = []
+                        for _ in range(args.repeat):
+                            number += 1
+                            try:
+                                repeats.append(run_once(args, workdir, input_path, profile, size, window, mode, number))
+                            except RuntimeError as e:
+                                print(f"Error: {e}")
+                                sys.exit(1)
+                        result = median_result(repeats)
+                        print(f"{result_key(result)}: {result['status']}, {result['throughput_mbps']} Mbps, "
+                              f"{result['completion_time']} s, {result['retransmissions']} retransmissions", flush=True)
+                        results.append(result)
+
+    print_table(results, 'throughput_mbps', 'Throughput (Mbps)')
+    print_table(results, 'completion_time', 'Completion time (s)')
+    print_table(results, 'retransmissions', 'Retransmissions')
+    with open(args.results, 'w', newline='') as output:
+        writer = csv.DictWriter(output, fieldnames=list(results[0]))
+        writer.writeheader()
+        writer.writerows(results)
+    print(f"\nResults written to {args.results}")
+
+    if args.save_baseline:
+        baseline = {result_key(result): {field: result[field] for field in ('throughput_mbps', 'completion_time', 'retransmissions')}
+                    for result in results if result['status'] == 'ok'}
+        with open(args.baseline, 'w') as output:
+            json.dump(baseline, output, indent=2, sort_keys=True)
+            output.write('\n')
+        print(f"Baseline written to {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, run with --save-baseline to record one")
+        return
+    with open(args.baseline) as data:
+        baseline = json.load(data)
+    regressions = compare(results, baseline, args.tolerance)
+    if regressions:
+        print(f"\n{len(regressions)} regressions against {args.baseline}:")
+        for regression in regressions:
+            print(f"  {regression}")
+        sys.exit(1)
+    print(f"No regressions against {args.baseline}")
+
+# ---------------- SCRIPT ENTRY POINT ---------------- 
+if __name__ == "__main__":
+    main()
@@ -1,152 +1,583 @@
 # ---------------- IMPORTS ---------------- 
 # Import necessary utilities
 from utils import *
+from protocol import *
+from sender import WindowSender
+from rto import RTTEstimator
+from congestion import CONGESTION_CONTROLLERS
+from pmtu import probe_path_mtu
+from tracing import open_tracer
+from metrics import ClientMetrics, open_reporter
+from compress import CODECS, ChunkCompressor, choose_codec
+from resume import file_identity
+from integrity import CRC_OPTION_SIZE, FileDigest, choose_checksum
+from delta import CHUNK_HASH_SIZE, index_file, write_delta
+from fec import FecEncoder, parity_header
+from tree import Tree, TreeChunks, is_tree
+import hashlib
+import multiprocessing
+import queue
+import random
+import tempfile
 
 # ---------------- UTILITY FUNCTIONS FOR CLIENT ---------------- 
 # Functions for file reading, server connection, and client operations
 
-def read_file_data(file_path):
+class FileChunks:
     """
-    Reads and returns the data from a file.
+    Memory-maps a file and exposes it, or a byte range of it, as a sequence of fixed-size chunks.
+    Each chunk is a zero-copy memoryview slice of the mapping, so the file is never
+    copied into memory and only the pages of the current window need to stay resident.
     Args:
         file_path (str): The path to the file.
-    Returns:
-        bytes: The data read from the file.
+        chunk_size (int): The number of file bytes carried by each packet.
+        offset (int): Where the range to send starts.
+        length (int): The length of the range to send, None for the rest of the file.
     """
-    if not os.path.isfile(file_path):
-        print(f"Error: File {file_path} does not exist.")
-        exit(1)
-    try:
-        with open(file_path, 'rb') as file:
-            file_data = file.read()
-        return file_data
-    except Exception as e:
-        print(f"An error occurred while opening the file: {e}")
-        exit(1)
 
+    def __init__(self, file_path, chunk_size, offset=0, length=None):
+        try:
+            self.file = open(file_path, 'rb')
+            file_size = os.fstat(self.file.fileno()).st_size
+            self.size = file_size - offset if length is None else length
+            if file_size > 0:
+                self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+                if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                    self.map.madvise(mmap.MADV_SEQUENTIAL)
+                self.whole = memoryview(self.map)
+            else:
+                # mmap cannot map an empty file
+                self.map = None
+                self.whole = memoryview(b'')
+            self.view = self.whole[offset:offset + self.size]
+        except Exception as e:
+            print(f"An error occurred while opening the file: {e}")
+            exit(1)
+        self.chunk_size = chunk_size
+        self.offset = offset
+        self.released = offset // mmap.PAGESIZE * mmap.PAGESIZE
+
+    def __len__(self):
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+    def __getitem__(self, index):
+        start = index * self.chunk_size
+        return self.view[start:start + self.chunk_size]
+
+    def release(self, count):
+        """
+        Tells the kernel that the first `count` chunks are no longer needed, so their pages
+        can be dropped from the resident set once they are acknowledged.
+        Args:
+            count (int): The number of leading chunks that will not be sent again.
+        """
+        end = (self.offset + count * self.chunk_size) // mmap.PAGESIZE * mmap.PAGESIZE
+        if self.map is None or end <= self.released or not hasattr(mmap, 'MADV_DONTNEED'):
+            return
+        self.map.madvise(mmap.MADV_DONTNEED, self.released, end - self.released)
+        self.released = end
+
+    def close(self):
+        """
+        Releases the memoryviews and unmaps the file.
+        All chunk slices handed out must have been dropped before calling this.
+        """
+        self.view.release()
+        self.whole.release()
+        if self.map is not None:
+            self.map.close()
+        self.file.close()
 
-def handle_connection(sock, buffer_size, server_ip, server_port):
+
+def handle_connection(sock, buffer_size, server_ip, server_port, file_path, wanted_features=0, segment_size=None,
+                      extra_options=None, compression='none', integrity=True, tree=None, window=DEFAULT_WINDOW):
     """
-    Handles the connection setup with the server.
+    Handles the connection setup with the server and negotiates the DRTP version.
+    The SYN is a version 1 header that carries the highest DRTP version the client speaks in its
+    acknowledgment number, and it is sent again until the SYN-ACK arrives. A version 1 server answers the SYN with a 6-byte SYN-ACK, a version 2 server with a
+    version 2 SYN-ACK that offers its optional features and the largest datagram it accepts.
+    With a version 2 server the segment size is then found by probing the path MTU, unless
+    it was given, and announced in the ACK. If resuming is negotiated, the ACK identifies the
+    file and the server answers with the chunks it already has; if delta sync is, the server
+    answers with the size of the index of its copy, whose pages the client then fetches, and if a
+    directory transfer is, the server confirms it. The ACK is sent again until that answer arrives.
     Args:
         sock (socket): The socket to receive data from and send data to.
         buffer_size (int): The maximum amount of data to be received at once.
         server_ip (str): The IP address of the server.
         server_port (int): The port number of the server.
+        file_path (str): The file to send; its name and size are announced to version 2 servers.
+        wanted_features (int): The optional features the client wants to use.
+        segment_size (int): The datagram size to use, or None to probe the path MTU.
+        extra_options (dict): More options to send to a version 2 server in the ACK.
+        compression (str): The --compress argument, matched against the codecs the server offers.
+        integrity (bool): Whether to send a CRC in every data packet and verify the digest of the
+            file, if the server offers a checksum the client has.
+        tree (Tree): The files to send instead of file_path; the name and size of their stream are announced.
+        window (int): The largest number of packets in flight, announced so the server does not wait
+            for more packets to acknowledge together than the window lets the client send.
     Returns:
-        bool: True if the connection is established, False otherwise.
+        tuple: The header codec of the negotiated version, the negotiated feature bits, the
+        segment size, the compression codec or None, the (start, end) ranges of the sequence
+        numbers the server already has, the checksum or None, the set of chunk hashes of the
+        server's copy or None if delta sync was not negotiated and the longest time the server
+        delays an ACK in seconds, or (None, 0, 0, None, [], None, None, 0.0) if the connection
+        could not be established.
     """
+    if tree is None:
+        file_size = os.path.getsize(file_path)
+        file_name = os.path.basename(file_path)
+    else:
+        file_size = tree.size
+        file_name = tree.name
+    syn_header = struct.pack(header_format, 0, DRTP_VERSION, SYN_FLAG)
     try:
-        data, _ = sock.recvfrom(buffer_size)
-        _, _, flags = struct.unpack('!HHH', data)  # Unpack the flags
-        if flags == (SYN_FLAG | ACK_FLAG):         # Check for SYN-ACK flag
-            print("SYN-ACK packet is received")
-            ack_header = struct.pack(header_format, 0, 0, ACK_FLAG)
-            sock.sendto(ack_header, (server_ip, server_port))
-            print("ACK packet is sent")
-            print("Connection established\n")
-            return True
+        for attempt in range(SYN_RETRIES):
+            start_time = time.monotonic()
+            sock.sendto(syn_header, (server_ip, server_port))
+            print("SYN packet is sent")
+            try:
+                data, _ = sock.recvfrom(buffer_size)
+                break
+            except socket.timeout:
+                if attempt == SYN_RETRIES - 1:
+                    raise
+        if len(data) == HEADER_V1.size:
+            _, _, flags = struct.unpack(header_format, data)  # Unpack the flags
+            if flags == (SYN_FLAG | ACK_FLAG):                # Check for SYN-ACK flag
+                print("SYN-ACK packet is received (DRTP version 1)")
+                sock.sendto(HEADER_V1.control_packet(ACK_FLAG), (server_ip, server_port))
+                print("ACK packet is sent")
+                print("Connection established\n")
+                return HEADER_V1, 0, MAX_PACKET_SIZE, None, [], None, None, 0.0
+        else:
+            packet = HEADER_V2.parse(data)
+            if packet is not None and packet[2] == (SYN_FLAG | ACK_FLAG):
+                # Every later packet carries the connection ID the server assigned in the SYN-ACK
+                proto = HeaderV2(HeaderV2.connection_id_of(data))
+                print(f"SYN-ACK packet is received (DRTP version 2, connection {proto.connection_id})")
+
+                # Use the largest segment the path and the server allow
+                max_segment = option_int(packet[3], OPT_MAX_SEGMENT, MAX_PACKET_SIZE)
+                if segment_size is None:
+                    segment_size = probe_path_mtu(sock, (server_ip, server_port), proto, max_segment, time.monotonic() - start_time)
+                    print(f"Path MTU probing chose {segment_size}-byte segments")
+                segment_size = min(segment_size, max_segment)
+                # Servers that do not tell acknowledge every packet at once
+                ack_delay = option_int(packet[3], OPT_ACK_DELAY) / 1e6
+
+                # Use the wanted features both sides support and tell the server what was chosen
+                features = option_int(packet[3], OPT_FEATURES) & SUPPORTED_FEATURES & wanted_features
+                options = {OPT_FEATURES: features.to_bytes(4, 'big'), OPT_FILE_SIZE: file_size.to_bytes(8, 'big'),
+                           OPT_SEGMENT_SIZE: segment_size.to_bytes(4, 'big'), OPT_FILE_NAME: file_name.encode()[:255],
+                           OPT_WINDOW: window.to_bytes(4, 'big')}
+                codec = choose_codec(compression, packet[3].get(OPT_COMPRESSION, b''))
+                if codec is not None:
+                    options[OPT_COMPRESSION] = bytes([codec.codec_id])
+                checksum = choose_checksum(packet[3].get(OPT_CHECKSUM, b'')) if integrity else None
+                if checksum is not None:
+                    options[OPT_CHECKSUM] = bytes([checksum.checksum_id])
+                if features & FEATURE_RESUME:
+                    options[OPT_FILE_ID] = file_identity(file_path)
+                options.update(extra_options or {})
+                sock.settimeout(RETRANSMISSION_TIMEOUT)
+                ack = proto.control_packet(ACK_FLAG, options)
+                sock.sendto(ack, (server_ip, server_port))
+                print("ACK packet is sent")
+                received = []
+                index = None
+                if features & FEATURE_RESUME:
+                    received = decode_resume(wait_for_answer(sock, buffer_size, (server_ip, server_port), proto, ack, RESUME_FLAG))
+                elif features & FEATURE_DELTA:
+                    summary = wait_for_answer(sock, buffer_size, (server_ip, server_port), proto, ack, DELTA_FLAG)
+                    index = fetch_index(sock, (server_ip, server_port), proto, segment_size, summary)
+                elif features & FEATURE_TREE:
+                    wait_for_answer(sock, buffer_size, (server_ip, server_port), proto, ack, TREE_FLAG)
+                print("Connection established\n")
+                return proto, features, segment_size, codec, received, checksum, index, ack_delay
     except socket.timeout:
         print("Connection failed. The server is not responding.")
         sock.close()
         exit()
-    return False
+    return None, 0, 0, None, [], None, None, 0.0
+
+
+def wait_for_answer(sock, buffer_size, addr, proto, ack, flag):
+    """
+    Waits for the server's answer to the ACK, which lists the chunks it already has, tells the
+    size of its index or confirms a directory transfer, and sends the ACK again whenever the answer does not come within the
+    retransmission timeout. A packet with only the flag set means the server is still working
+    on the answer, and the client waits for it as long as such packets keep coming.
+    Args:
+        sock (socket): The client socket.
+        buffer_size (int): The maximum amount of data to be received at once.
+        addr (tuple): The address of the server.
+        proto (HeaderV2): The header codec of the connection.
+        ack (bytes): The ACK packet.
+        flag (int): The flag of the answer, RESUME_FLAG, DELTA_FLAG or TREE_FLAG.
+    Returns:
+        bytes: The payload of the answer.
+    Raises:
+        socket.timeout: If the server does not answer after RESUME_RETRIES ACKs.
+    """
+    attempt = 0
+    while attempt < RESUME_RETRIES:
+        if attempt:
+            sock.sendto(ack, addr)
+            print("ACK packet is sent again")
+        attempt += 1
+        deadline = time.monotonic() + RETRANSMISSION_TIMEOUT
+        try:
+            # Late path MTU probe answers and repeated SYN-ACKs are skipped
+            while True:
+                sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                data, _ = sock.recvfrom(buffer_size)
+                packet = proto.parse(data)
+                if packet is not None and packet[2] == flag | ACK_FLAG:
+                    return packet[4]
+                if packet is not None and packet[2] == flag:
+                    attempt = 0
+        except socket.timeout:
+            continue
+    raise socket.timeout()
+
+
+def fetch_index(sock, addr, proto, segment_size, summary):
+    """
+    Fetches the chunk hashes of the server's copy of the file, asking for as many pages at once
+    as the socket's receive buffer holds and asking again for the pages that do not arrive.
+    Args:
+        sock (socket): The client socket.
+        addr (tuple): The address of the server.
+        proto (HeaderV2): The header codec of the connection.
+        segment_size (int): The size of the datagrams, which is also the size of the pages.
+        summary (bytes): The server's answer to the ACK.
+    Returns:
+        set: The chunk hashes.
+    Raises:
+        socket.timeout: If the server stops answering.
+    """
+    count, per_page = struct.unpack(index_summary_format, summary)
+    missing = set(range(1, (count + per_page - 1) // max(per_page, 1) + 1))
+    pages = {}
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+    # Linux reports twice the buffer it grants, half of which holds the datagrams
+    window = max(1, min(SYNC_INDEX_WINDOW, sock.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF) // 2 // segment_size))
+    attempt = 0
+    while missing:
+        if attempt == RESUME_RETRIES:
+            raise socket.timeout()
+        attempt += 1
+        requested = sorted(missing)[:window]
+        for page in requested:
+            sock.sendto(proto.control_packet(DELTA_FLAG, acknowledgment_number=page), addr)
+        deadline = time.monotonic() + RETRANSMISSION_TIMEOUT
+        try:
+            while any(page in missing for page in requested):
+                sock.settimeout(max(deadline - time.monotonic(), 0.001))
+                data, _ = sock.recvfrom(segment_size)
+                packet = proto.parse(data)
+                if packet is not None and packet[2] == DELTA_FLAG | ACK_FLAG and packet[0] in missing:
+                    missing.discard(packet[0])
+                    pages[packet[0]] = packet[4]
+                    attempt = 0
+        except socket.timeout:
+            continue
+    sock.settimeout(RETRANSMISSION_TIMEOUT)
+    index = b''.join(pages[page] for page in sorted(pages))
+    return {index[offset:offset + CHUNK_HASH_SIZE] for offset in range(0, len(index), CHUNK_HASH_SIZE)}
+
+
+# ---------------- STRIPED TRANSFERS ---------------- 
+# With --streams N the file is split into N byte ranges that are sent at the same time over N
+# connections, each by its own process with its own socket and sliding window, so the transfer
+# is not limited to what one Python process can send. The streams share a session ID, and the
+# server writes every range at its offset in the same output file.
+
+class StreamProgress:
+    """
+    Reports the progress of a stream to the parent process in steps of ten percent.
+    Args:
+        queue (multiprocessing.Queue): Where the progress is reported.
+        index (int): The number of the stream.
+    """
+
+    def __init__(self, queue, index):
+        self.queue = queue
+        self.index = index
+        self.reported = -1
+
+    def __call__(self, acked, total):
+        step = acked * 10 // max(total, 1)
+        if step > self.reported:
+            self.reported = step
+            self.queue.put((self.index, acked, total))
+
+
+def stream_main(args, stream, queue):
+    """
+    The entry point of a stream process.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        stream (tuple): The session ID, stream index, stream count, byte offset and byte length of the stream.
+        queue (multiprocessing.Queue): Where the progress is reported.
+    """
+    exit(0 if send_file(args, stream, StreamProgress(queue, stream[1])) else 1)
+
+
+def send_striped(args):
+    """
+    Sends the file over args.streams connections at once and reports the progress of every stream.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+    """
+    file_size = os.path.getsize(args.file)
+    count = min(args.streams, max(file_size, 1))
+    session_id = random.getrandbits(32)
+    reports = multiprocessing.Queue()
+    processes = []
+    print(f"Sending {args.file} over {count} streams, session {session_id:08x}")
+    start_time = time.monotonic()
+    for index in range(count):
+        offset = file_size * index // count
+        length = file_size * (index + 1) // count - offset
+        process = multiprocessing.Process(target=stream_main, args=(args, (session_id, index, count, offset, length), reports),
+                                          name=f'drtp-stream-{index}')
+        process.start()
+        processes.append(process)
 
+    while any(process.is_alive() for process in processes) or not reports.empty():
+        try:
+            index, acked, total = reports.get(timeout=SUPERVISOR_INTERVAL)
+        except queue.Empty:
+            continue
+        print(f"Stream {index + 1}: {acked * 100 // max(total, 1)}% ({acked}/{total} packets)")
+    elapsed_time = time.monotonic() - start_time
+
+    failed = [index for index, process in enumerate(processes) if process.exitcode != 0]
+    if failed:
+        print(f"Error: Streams {failed} failed, the file was not sent completely.")
+        exit(1)
+    print(f"Sent {file_size} bytes over {count} streams in {elapsed_time:.3f} seconds, "
+          f"{round(file_size * 8 / elapsed_time / 1000000, 2)} Mbps")
 
 # ---------------- MAIN CLIENT FUNCTION ---------------- 
-# This function starts a UDP client and handles file transfer to a server
+# These functions start a UDP client and handle file transfer to a server
 
-def client(args):
+def send_file(args, stream=None, progress=None):
     """
-    Starts a UDP client and handles file transfer to a server.
+    Sends the file, or one byte range of it, over a new connection.
     Args:
         args (argparse.Namespace): The command line arguments.
+        stream (tuple): The session ID, stream index, stream count, byte offset and byte length of
+            a striped stream, or None to send the whole file.
+        progress (callable): Called with the number of acknowledged packets and the total.
+    Returns:
+        bool: True if the file was sent, False if an error occurred.
     """
     
     # Extract the IP, port, and window size from the argument parser
     UDP_IP = args.ip
     UDP_PORT = args.port
     WINDOW_SIZE = args.window
+    send_path = args.file
+    tree = None
 
     try:
         print('Client started...')
         
         # Create a UDP socket and set a timeout
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        sock.settimeout(0.5)  # GBN timeout (500ms)
-
-        # Read the file data and create chunks to send  
-        file_data = read_file_data(args.file)
-        header_size = struct.calcsize(header_format)
-        chunk_size = MAX_PACKET_SIZE - header_size
-        file_chunks = [file_data[i:i+chunk_size] for i in range(0, len(file_data), chunk_size)]
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.settimeout(RETRANSMISSION_TIMEOUT)
 
         # Begin the connection establishment phase
         print("Connection Establishment Phase:\n")
-        syn_header = struct.pack(header_format, 0, 0, SYN_FLAG)
-        sock.sendto(syn_header, (UDP_IP, UDP_PORT))
-        print("SYN packet is sent")
 
-        # Handle the connection with the server
-        connection_established = handle_connection(sock, BUFFER_SIZE, UDP_IP, UDP_PORT)
-        if not connection_established:
+        # Handle the connection with the server. A stream tells the server which range it carries
+        # The streams of a striped transfer cannot be resumed, as they are split anew every time,
+        # a delta is not resumed, as it depends on the server's copy, and neither is a tree
+        wanted_features = FEATURE_SACK if args.mode == 'sr' else 0
+        if args.fec != 'off':
+            wanted_features |= FEATURE_FEC
+        extra_options = None
+        if is_tree(args.file):
+            wanted_features |= FEATURE_TREE
+            try:
+                tree = Tree(args.file)
+            except (OSError, ValueError) as e:
+                print(f"Error: Cannot list the files of {args.file}: {e}")
+                exit(1)
+            print(f"Sending {len(tree.files)} files, {tree.size - len(tree.manifest)} bytes and a "
+                  f"{len(tree.manifest)}-byte manifest, as {tree.name}")
+        elif stream is not None:
+            wanted_features |= FEATURE_STREAMS
+            extra_options = encode_stream(*stream[:4])
+        elif args.sync:
+            wanted_features |= FEATURE_DELTA
+            # Cut the file into chunks before connecting, so the server does not wait for it, and hash
+            # it whole, as the digest in the FIN is of the file the server rebuilds and not of the delta
+            start_time = time.monotonic()
+            source_hash = hashlib.sha256()
+            sync_chunks = index_file(args.file, source_hash)
+            print(f"Cut {args.file} into {len(sync_chunks)} chunks in {time.monotonic() - start_time:.3f} seconds")
+        elif not args.no_resume:
+            wanted_features |= FEATURE_RESUME
+        proto, features, segment_size, codec, received, checksum, index, ack_delay = handle_connection(
+            sock, BUFFER_SIZE, UDP_IP, UDP_PORT, args.file, wanted_features, args.segment_size, extra_options,
+            args.compress, not args.no_integrity, tree, WINDOW_SIZE)
+        if proto is None:
             print("Error: Failed to establish connection.")
             exit(1)
+        if tree is not None and not features & FEATURE_TREE:
+            print("Error: The server does not accept directory transfers; its --output must be a directory, "
+                  "or send the files one by one.")
+            exit(1)
+        if stream is not None and not features & FEATURE_STREAMS:
+            print("Error: The server does not support striped transfers, use --streams 1.")
+            exit(1)
+        if args.compress != 'none':
+            print(f"Compressing with {codec.name}" if codec is not None else "The server offers no codec we can use, sending uncompressed")
+
+        # To sync, send the delta against the server's copy instead of the file
+        if args.sync and index is None:
+            print("The server does not support delta sync, sending the whole file")
+        elif index is not None:
+            with tempfile.NamedTemporaryFile(prefix='drtp-', suffix=DELTA_SUFFIX, delete=False) as delta:
+                send_path = delta.name
+                count, matched, literal_bytes = write_delta(delta, args.file, sync_chunks, index)
+            file_size = os.path.getsize(args.file)
+            print(f"The server has {matched} of {count} chunks, sending {literal_bytes} of {file_size} bytes "
+                  f"in a {os.path.getsize(send_path)}-byte delta")
+
+        # Map the file and split it into chunks to send, without reading it into memory.
+        # The CRC option takes room from every chunk, and so does the header of the parity packets,
+        # which are as long as the longest packet of their block
+        chunk_size = segment_size - proto.size - (CRC_OPTION_SIZE if checksum is not None else 0)
+        if features & FEATURE_FEC:
+            chunk_size -= parity_header.size
+        if tree is not None:
+            file_chunks = TreeChunks(tree, chunk_size)
+        elif stream is None:
+            file_chunks = FileChunks(send_path, chunk_size)
+        else:
+            file_chunks = FileChunks(args.file, chunk_size, stream[3], stream[4])
+        if len(file_chunks) > proto.max_sequence:
+            print(f"Error: The file needs {len(file_chunks)} packets, but DRTP version {proto.version} numbers at most {proto.max_sequence}.")
+            exit(1)
+        if received:
+            print(f"Resuming, the server already has {sum(end - start for start, end in received)} of {len(file_chunks)} packets")
 
         print("\nData Transfer:\n")
 
         # Begin the data transfer phase
-        base = 1
-        nextseqnum = 1
-        frame_buffer = [None] * WINDOW_SIZE
-        window_packets = []
-
-        # While there are chunks left to send
-        while base <= len(file_chunks):
-            # Send all the chunks within the window
-            while nextseqnum < base + WINDOW_SIZE and nextseqnum <= len(file_chunks):
-                # Create packet and send it
-                flags = FIN_FLAG if nextseqnum == len(file_chunks) else ACK_FLAG 
-                header = struct.pack(header_format, nextseqnum, 0, flags)
-                packet = header + file_chunks[nextseqnum - 1]
-                frame_buffer[(nextseqnum - 1) % WINDOW_SIZE] = packet
-                window_packets.append(nextseqnum)
-                sock.sendto(packet, (UDP_IP, UDP_PORT))
-                print(f"{datetime.now().strftime('%H:%M:%S.%f')} -- packet with seq = {nextseqnum} is sent, sliding window = {window_packets}")
-                nextseqnum += 1
-
-            # Wait for acknowledgements
-            try:
-                data, _ = sock.recvfrom(BUFFER_SIZE)
-                ack, _, _ = struct.unpack('!HHH', data)  
-                print(f"{datetime.now().strftime('%H:%M:%S.%f')} -- ACK for packet {ack} received")
-
-                # If the ack is within the window, move the base of the window
-                if ack >= base and ack < nextseqnum:
-                    window_packets = [seq for seq in window_packets if seq > ack]
-                    base = ack + 1
-            except socket.timeout:
-                # If a timeout occurs, retransmit all unacknowledged frames
-                print(f"{datetime.now().strftime('%H:%M:%S.%f')} -- RTO occurred")
-                for i in range(base, nextseqnum):
-                    sock.sendto(frame_buffer[(i - 1) % WINDOW_SIZE], (UDP_IP, UDP_PORT))
-                    print(f"{datetime.now().strftime('%H:%M:%S.%f')} -- retransmitting packet with seq = {i}")
+        selective = bool(features & FEATURE_SACK)
+        if args.mode == 'sr' and not selective:
+            print("The server does not support Selective Repeat, falling back to Go-Back-N\n")
+        rtt = RTTEstimator(INITIAL_RTO, args.min_rto, args.max_rto, ack_delay)
+        cc = CONGESTION_CONTROLLERS[args.cc](WINDOW_SIZE)
+        tag = None if stream is None else f'stream{stream[1] + 1}'
+        tracer = open_tracer(args, tag)
+        metrics = ClientMetrics()
+        if send_path != args.file:
+            metrics.sync_matched_bytes = file_size - literal_bytes
+        reporter = open_reporter(args, metrics, tag)
+        compressor = None if codec is None else ChunkCompressor(codec, file_chunks, args.compress_workers, metrics)
+        digest = None if checksum is None or send_path != args.file else FileDigest()
+        fec = None
+        if features & FEATURE_FEC:
+            fec = FecEncoder(FEC_MAX_BLOCK if args.fec == 'auto' else int(args.fec), adaptive=args.fec == 'auto')
+        elif args.fec != 'off':
+            print("The server does not support forward error correction, sending without parity\n")
+        sender = WindowSender(sock, (UDP_IP, UDP_PORT), proto, file_chunks, WINDOW_SIZE, selective, rtt, cc,
+                              not args.no_pacing, args.fastpath, progress, tracer, metrics, compressor, received,
+                              checksum, digest, fec)
+        sender.run()
+        tracer.close()
+        if reporter is not None:
+            reporter.close()
+
+        # Drop the last chunk references so the file can be unmapped; the digest thread holds some too
+        sender.close()
+        if checksum is None:
+            fin_options = None
+        else:
+            fin_options = {OPT_DIGEST: digest.digest() if digest is not None else source_hash.digest()}
+        file_chunks.close()
 
         print("\nDATA Finished")
+        stats = sender.stats()
+        print(f"RTT: {stats['samples']} samples, min/avg/max = {stats['min_rtt_ms']}/{stats['avg_rtt_ms']}/{stats['max_rtt_ms']} ms, "
+              f"SRTT = {stats['srtt_ms']} ms, RTTVAR = {stats['rttvar_ms']} ms, RTO = {stats['rto_ms']} ms")
+        print(f"Retransmissions: {stats['retransmissions']} packets after {stats['timeouts']} timeouts")
+        if fec is not None:
+            print(f"Forward error correction: {metrics.parity_packets_sent} parity packets, final block size = {fec.block_size}")
+        print(f"Congestion control: {args.cc}, final cwnd = {stats['cwnd']} packets, ssthresh = {stats['ssthresh']} packets")
         print("\nConnection Teardown Phase:")
 
-        # After all packets are sent, begin the connection teardown phase
-        fin_header = struct.pack(header_format, 0, 0, FIN_FLAG)
-        sock.sendto(fin_header, (UDP_IP, UDP_PORT))
-        print(f"{datetime.now().strftime('%H:%M:%S.%f')} -- FIN packet is sent")
+        # After all packets are sent, begin the connection teardown phase.
+        # The FIN carries the digest of the file and the FIN ACK the server's.
+        # A server that rebuilds the file from a delta asks the client to wait until it is done
+        sock.settimeout(RETRANSMISSION_TIMEOUT)
+        fin_ack = None
+        attempt = 0
+        while attempt < FIN_RETRIES:
+            attempt += 1
+            sock.sendto(proto.control_packet(FIN_FLAG, fin_options), (UDP_IP, UDP_PORT))
+            print(f"{datetime.now().strftime('%H:%M:%S.%f')} -- FIN packet is sent")
 
-        # Wait for the final acknowledgement, then close the connection
-        data, _ = sock.recvfrom(BUFFER_SIZE)
-        if data == b'ACK':
+            # Wait for the final acknowledgement, skipping late ACKs of data packets
+            try:
+                while True:
+                    data, _ = sock.recvfrom(BUFFER_SIZE)
+                    packet = proto.parse(data)
+                    if packet is not None and packet[2] == proto.fin_ack_flags:
+                        fin_ack = packet
+                        break
+                    if packet is not None and packet[2] == DELTA_FLAG:
+                        attempt = 0
+            except socket.timeout:
+                continue
             print("ACK packet is received")
-            print("Connection terminated")
-            sock.close()
+            break
+        print("Connection terminated")
+        sock.close()
+        if fin_ack is None:
+            print(f"Error: The server did not acknowledge the FIN after {FIN_RETRIES} attempts, the transfer may be incomplete")
+            return False
+        if fin_options is not None:
+            server_digest = fin_ack[3].get(OPT_DIGEST)
+            if server_digest is None:
+                # The server leaves the digest out when it could not write, hash or rebuild the file,
+                # or when its file does not match the digest of ours
+                print("Error: The server did not report the digest of the file, it is not verified")
+                return False
+            elif server_digest != fin_options[OPT_DIGEST]:
+                print(f"Error: The file is corrupt, its digest is {fin_options[OPT_DIGEST].hex()} here "
+                      f"and {server_digest.hex()} on the server")
+                return False
+            else:
+                print(f"File digest verified: {server_digest.hex()}")
+        return True
         
     except Exception as e:
         print(f"An error occurred: {e}")
-    pass
\ No newline at end of file
+    finally:
+        if send_path != args.file:
+            os.unlink(send_path)
+    return False
+
+
+def client(args):
+    """
+    Starts a UDP client and handles file transfer to a server.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+    """
+    if args.compress not in ('none', 'auto') and args.compress not in CODECS:
+        print(f"Error: The {args.compress} codec is not installed, choose from {', '.join(CODECS)}")
+        exit(1)
+    if args.streams > 1:
+        send_striped(args)
+    elif not send_file(args):
+        exit(1)
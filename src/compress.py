@@ -0,0 +1,225 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities, the codecs and the modules used by the compression workers
+from utils import *
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import zlib
+
+# zstd and lz4 are used when their packages are installed
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+try:
+    import lz4.block
+except ImportError:
+    lz4 = None
+
+# ---------------- COMPRESSION ---------------- 
+# Every chunk is compressed on its own, so the server can decompress and write it at its offset
+# no matter in which order the chunks arrive. The server offers the codecs it has in the SYN-ACK
+# and the client names the one it chose in the ACK; compressed payloads carry COMPRESSED_FLAG.
+# Chunks that do not shrink by COMPRESSION_MIN_SAVING are sent as they are, and after every such
+# chunk the client skips compressing twice as many chunks as before, up to COMPRESSION_MAX_SKIP,
+# so incompressible files such as JPEGs cost almost no CPU.
+CODEC_ZLIB = 1
+CODEC_ZSTD = 2
+CODEC_LZ4 = 3
+
+
+class Codec:
+    """
+    A compression algorithm. Compression may run on several threads at once.
+    Attributes:
+        name (str): The name used on the command line.
+        codec_id (int): The number sent in OPT_COMPRESSION.
+    """
+    name = None
+    codec_id = None
+
+    def compress(self, data):
+        """
+        Args:
+            data (bytes-like): The chunk.
+        Returns:
+            bytes: The compressed chunk.
+        """
+        raise NotImplementedError
+
+    def decompress(self, data, max_length):
+        """
+        Args:
+            data (bytes-like): The compressed chunk.
+            max_length (int): The size of a chunk; a payload that decompresses to more is rejected.
+        Returns:
+            bytes: The chunk.
+        Raises:
+            ValueError: If the payload is corrupt or decompresses to more than max_length bytes.
+        """
+        raise NotImplementedError
+
+
+class ZlibCodec(Codec):
+    name = 'zlib'
+    codec_id = CODEC_ZLIB
+
+    def compress(self, data):
+        return zlib.compress(data, ZLIB_LEVEL)
+
+    def decompress(self, data, max_length):
+        decompressor = zlib.decompressobj()
+        try:
+            chunk = decompressor.decompress(data, max_length)
+        except zlib.error as e:
+            raise ValueError(str(e))
+        if decompressor.unconsumed_tail or not decompressor.eof:
+            raise ValueError(f'payload does not decompress to at most {max_length} bytes')
+        return chunk
+
+
+class ZstdCodec(Codec):
+    name = 'zstd'
+    codec_id = CODEC_ZSTD
+
+    def __init__(self):
+        # Compressor objects must not be shared between threads
+        self.local = threading.local()
+
+    def compress(self, data):
+        compressor = getattr(self.local, 'compressor', None)
+        if compressor is None:
+            compressor = self.local.compressor = zstandard.ZstdCompressor(level=ZSTD_LEVEL)
+        return compressor.compress(data)
+
+    def decompress(self, data, max_length):
+        try:
+            return zstandard.ZstdDecompressor().decompress(data, max_output_size=max_length)
+        except zstandard.ZstdError as e:
+            raise ValueError(str(e))
+
+
+class Lz4Codec(Codec):
+    name = 'lz4'
+    codec_id = CODEC_LZ4
+
+    def compress(self, data):
+        return lz4.block.compress(data, store_size=False)
+
+    def decompress(self, data, max_length):
+        try:
+            return lz4.block.decompress(data, uncompressed_size=max_length)
+        except lz4.block.LZ4BlockError as e:
+            raise ValueError(str(e))
+
+
+# The codecs that are installed, fastest first, which is the order auto picks them in
+CODECS = {codec.name: codec for codec in ([Lz4Codec()] if lz4 else []) + ([ZstdCodec()] if zstandard else []) + [ZlibCodec()]}
+CODECS_BY_ID = {codec.codec_id: codec for codec in CODECS.values()}
+
+
+def offered_codecs():
+    """
+    Returns:
+        bytes: The IDs of the installed codecs, the value of OPT_COMPRESSION in the SYN-ACK.
+    """
+    return bytes(codec.codec_id for codec in CODECS.values())
+
+
+def choose_codec(wanted, offered):
+    """
+    Chooses the codec to compress with.
+    Args:
+        wanted (str): The --compress argument: none, auto or the name of a codec.
+        offered (bytes): The codec IDs the server offered, empty if it offered none.
+    Returns:
+        Codec: The codec, or None to send the chunks uncompressed.
+    """
+    if wanted == 'none':
+        return None
+    for codec in CODECS.values():
+        if codec.codec_id in offered and wanted in ('auto', codec.name):
+            return codec
+    return None
+
+
+class ChunkCompressor:
+    """
+    Compresses the chunks of a file in a pool of threads, a few chunks ahead of the sender.
+    zlib, zstd and lz4 release the GIL while they compress, so the threads run in parallel.
+    Args:
+        codec (Codec): The codec to compress with.
+        file_chunks (FileChunks): The chunks of the file.
+        workers (int): The number of compression threads.
+        metrics (ClientMetrics): Where the compressed and bypassed chunks are counted, None for no metrics.
+    """
+
+    def __init__(self, codec, file_chunks, workers, metrics=None):
+        self.codec = codec
+        self.file_chunks = file_chunks
+        self.pool = ThreadPoolExecutor(workers, thread_name_prefix='drtp-compress')
+        self.lookahead = COMPRESSION_LOOKAHEAD * workers
+        self.metrics = metrics
+        self.futures = {}         # chunk index -> Future of the compressed chunk
+        self.submitted = 0        # Chunks before this index have been submitted or skipped
+        self.skip = 0             # Chunks to send uncompressed after the last poor result
+        self.skip_until = 0       # Chunks before this index are sent uncompressed
+        self.next_index = 0       # The chunk the sender is expected to ask for next
+
+    def get(self, index):
+        """
+        Returns a chunk ready to send, and starts compressing the chunks after it.
+        Args:
+            index (int): The index of the chunk.
+        Returns:
+            tuple: The payload and whether it is compressed.
+        """
+        if index != self.next_index:
+            # The sender skipped the chunks a resumed transfer already delivered
+            self.submitted = max(self.submitted, index)
+            for skipped in [skipped for skipped in self.futures if skipped < index]:
+                self.futures.pop(skipped).cancel()
+        self.next_index = index + 1
+        self.prefetch(min(index + self.lookahead, len(self.file_chunks)))
+        chunk = self.file_chunks[index]
+        future = self.futures.pop(index, None)
+        if future is None:
+            if self.metrics is not None:
+                self.metrics.bypassed_chunks += 1
+            return chunk, False
+        compressed = future.result()
+        if len(compressed) > len(chunk) * (1 - COMPRESSION_MIN_SAVING):
+            # Not worth it: back off before trying again
+            self.skip = min(max(self.skip * 2, 1), COMPRESSION_MAX_SKIP)
+            self.skip_until = max(self.skip_until, index + 1 + self.skip)
+            if self.metrics is not None:
+                self.metrics.bypassed_chunks += 1
+            return chunk, False
+        self.skip = 0
+        if self.metrics is not None:
+            self.metrics.compressed_chunks += 1
+            self.metrics.compression_saved_bytes += len(chunk) - len(compressed)
+        return compressed, True
+
+    def prefetch(self, end):
+        """
+        Submits the chunks up to end to the workers, except the ones in the bypass window.
+        While backing off, only the first chunk after the bypass window is compressed, to probe
+        whether the data became compressible, and the chunks after it wait for its result.
+        """
+        while self.submitted < end:
+            if self.submitted < self.skip_until:
+                self.submitted += 1
+                continue
+            if self.skip and self.submitted > self.skip_until:
+                break
+            self.futures[self.submitted] = self.pool.submit(self.codec.compress, self.file_chunks[self.submitted])
+            self.submitted += 1
+
+    def close(self):
+        """
+        Stops the workers and drops the chunks they hold, so the file can be unmapped.
+        """
+        for future in self.futures.values():
+            future.cancel()
+        self.pool.shutdown(wait=True)
+        self.futures.clear()
@@ -0,0 +1,228 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities
+from utils import *
+
+# ---------------- CONGESTION CONTROL ---------------- 
+# Congestion controllers decide how many packets may be in flight. They all implement the
+# CongestionController interface, so new algorithms only have to be added to CONGESTION_CONTROLLERS.
+# Windows are counted in packets.
+
+class CongestionController:
+    """
+    Base class of the congestion controllers. The sender reports acknowledged packets with on_ack()
+    and congestion events with on_congestion(), at most once per window of data, and asks window()
+    how many packets may be in flight. The --window argument is only an upper bound.
+    Args:
+        max_window (int): The largest window the controller may open.
+    """
+    name = None
+
+    def __init__(self, max_window):
+        self.max_window = max_window
+        self.cwnd = float(min(INITIAL_CWND, max_window))
+        self.ssthresh = float(max_window)
+
+    def window(self):
+        """
+        Returns:
+            int: The number of packets that may be in flight.
+        """
+        return max(1, min(int(self.cwnd), self.max_window))
+
+    def in_slow_start(self):
+        return self.cwnd < self.ssthresh
+
+    def on_ack(self, acked, now, rtt):
+        """
+        Called when packets are acknowledged for the first time.
+        Args:
+            acked (int): The number of newly acknowledged packets.
+            now (float): The current time.monotonic() value.
+            rtt (RTTEstimator): The RTT estimator of the connection.
+        """
+        raise NotImplementedError
+
+    def on_congestion(self, now, timeout):
+        """
+        Called when loss is detected, at most once per window of data.
+        Args:
+            now (float): The current time.monotonic() value.
+            timeout (bool): True if the loss was detected by a retransmission timeout.
+        """
+        raise NotImplementedError
+
+    def state(self):
+        """
+        Returns:
+            dict: A copy of the state of the controller, taken before a reduction that may be undone.
+        """
+        return dict(vars(self))
+
+    def undo(self, state):
+        """
+        Reverts a reduction that turned out to be caused by reordering rather than loss, keeping
+        whatever the window has grown since.
+        Args:
+            state (dict): The state returned by state() before the reduction.
+        """
+        cwnd = self.cwnd
+        vars(self).update(state)
+        self.cwnd = max(self.cwnd, cwnd)
+
+    def pacing_rate(self, rtt):
+        """
+        Returns the rate at which packets should be paced out: the window spread over one smoothed
+        RTT, with some headroom so the window can still grow.
+        Args:
+            rtt (RTTEstimator): The RTT estimator of the connection.
+        Returns:
+            float: Packets per second, or None if the sender should not pace.
+        """
+        if rtt.srtt is None or rtt.srtt <= 0:
+            return None
+        gain = SLOW_START_PACING_GAIN if self.in_slow_start() else PACING_GAIN
+        return gain * self.window() / rtt.srtt
+
+
+class FixedWindow(CongestionController):
+    """
+    No congestion control: the window is always --window packets, as in the original DRTP.
+    """
+    name = 'fixed'
+
+    def __init__(self, max_window):
+        super().__init__(max_window)
+        self.cwnd = float(max_window)
+
+    def on_ack(self, acked, now, rtt):
+        pass
+
+    def on_congestion(self, now, timeout):
+        pass
+
+    def pacing_rate(self, rtt):
+        return None
+
+
+class Reno(CongestionController):
+    """
+    Slow start followed by additive increase, multiplicative decrease (RFC 5681).
+    The window grows by one packet per acknowledged packet until it reaches ssthresh, then by one
+    packet per window. A loss halves the window, a timeout collapses it to one packet.
+    """
+    name = 'reno'
+
+    def on_ack(self, acked, now, rtt):
+        if self.in_slow_start():
+            self.cwnd += acked
+        else:
+            self.cwnd += acked / self.cwnd
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    def on_congestion(self, now, timeout):
+        self.ssthresh = max(self.cwnd * RENO_BETA, MIN_CWND)
+        self.cwnd = 1.0 if timeout else self.ssthresh
+
+
+class Cubic(CongestionController):
+    """
+    CUBIC (RFC 8312): after a loss the window follows a cubic function of the time since the loss,
+    which plateaus around the window where the loss happened and then probes beyond it. It never
+    grows slower than Reno would (the TCP-friendly region).
+    """
+    name = 'cubic'
+
+    def __init__(self, max_window):
+        super().__init__(max_window)
+        self.w_max = 0.0
+        self.w_est = self.cwnd
+        self.epoch_start = None
+        self.k = 0.0
+        self.origin = 0.0
+
+    def on_ack(self, acked, now, rtt):
+        if self.in_slow_start():
+            self.cwnd = min(self.cwnd + acked, self.max_window)
+            return
+        if self.epoch_start is None:
+            # First ACK after a loss: start a new cubic epoch around the window of the last loss
+            self.epoch_start = now
+            self.w_est = self.cwnd
+            if self.cwnd < self.w_max:
+                self.k = ((self.w_max - self.cwnd) / CUBIC_C) ** (1 / 3)
+                self.origin = self.w_max
+            else:
+                self.k = 0.0
+                self.origin = self.cwnd
+        t = now - self.epoch_start + (rtt.srtt or 0.0)
+        target = self.origin + CUBIC_C * (t - self.k) ** 3
+
+        # Never grow slower than Reno with the same multiplicative decrease
+        self.w_est += 3 * (1 - CUBIC_BETA) / (1 + CUBIC_BETA) * acked / self.cwnd
+        target = max(target, self.w_est)
+        if target > self.cwnd:
+            self.cwnd += (target - self.cwnd) / self.cwnd * acked
+        else:
+            self.cwnd += 0.01 * acked / self.cwnd
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    def on_congestion(self, now, timeout):
+        self.epoch_start = None
+        # Fast convergence: release bandwidth faster if the window keeps shrinking
+        if self.cwnd < self.w_max:
+            self.w_max = self.cwnd * (1 + CUBIC_BETA) / 2
+        else:
+            self.w_max = self.cwnd
+        self.ssthresh = max(self.cwnd * CUBIC_BETA, MIN_CWND)
+        self.cwnd = 1.0 if timeout else self.ssthresh
+
+
+CONGESTION_CONTROLLERS = {controller.name: controller for controller in (FixedWindow, Reno, Cubic)}
+
+
+# ---------------- PACING ---------------- 
+# Spreads the packets of a window over the RTT instead of sending them back-to-back
+
+class Pacer:
+    """
+    A token bucket that releases packets at the pacing rate, allowing bursts of `burst` packets.
+    Args:
+        burst (int): The number of packets that may leave back-to-back.
+    """
+
+    def __init__(self, burst=PACING_BURST):
+        self.rate = None
+        self.burst = burst
+        self.tokens = float(burst)
+        self.last = None
+
+    def set_rate(self, rate):
+        """
+        Args:
+            rate (float): Packets per second, or None to stop pacing.
+        """
+        self.rate = rate
+
+    def delay(self, now):
+        """
+        Refills the bucket and tells how long the next packet has to wait.
+        Args:
+            now (float): The current time.monotonic() value.
+        Returns:
+            float: The time in seconds until the next packet may be sent, 0 if it may be sent now.
+        """
+        if self.rate is None:
+            return 0.0
+        if self.last is not None:
+            self.tokens = min(self.tokens + (now - self.last) * self.rate, self.burst)
+        self.last = now
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self):
+        """
+        Takes a token for a packet that is being sent.
+        """
+        if self.rate is not None:
+            self.tokens -= 1
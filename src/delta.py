@@ -0,0 +1,308 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities and the hash that identifies chunks
+from utils import *
+import hashlib
+
+# ---------------- DELTA SYNC ---------------- 
+# With --sync the client sends only what the server's copy of the file lacks. Both sides cut their
+# copy into content-defined chunks, whose boundaries depend on the bytes around them rather than on
+# their offset, so an insertion only changes the chunks it touches instead of shifting every chunk
+# after it. The server keeps the hashes of its copy's chunks in an index file next to it, which is
+# rebuilt when the copy's size, modification time or change time changes, and hands them to the client. The
+# client then sends a delta: a recipe that lists the chunks of the new file in order, each either
+# copied from the server's copy or sent as it is, followed by the chunks the server does not have.
+# The delta goes over the ordinary data path, and the server rebuilds the file from it and its copy,
+# checking every chunk of the result against the recipe, so a copy that changed behind the back of
+# its index fails the rebuild instead of producing a wrong file.
+#
+# Every byte is mapped to one of four symbols with a fixed table that gives each symbol to 64 byte
+# values, and a chunk ends after the first place where six symbols in a row match a fixed pattern,
+# which happens once in 4096 bytes of random data, but it is at least SYNC_MIN_CHUNK and at most
+# SYNC_MAX_CHUNK bytes long. The mapping and the search run in C, with bytes.translate and
+# bytes.find, which is much faster than a rolling hash computed byte by byte in Python; with only
+# two symbols bytes.find skips too little to keep up with the hashing.
+SYMBOL_TABLE = bytes(byte % 4 for byte in sorted(range(256), key=lambda byte: hashlib.sha256(bytes([byte])).digest()))
+BOUNDARY_PATTERN = bytes([0, 1, 2, 3, 1, 2])
+CHUNK_HASH_SIZE = 16
+
+# The index file starts with a magic string and the size, modification time and change time of the
+# file it describes, followed by the hash and length of every chunk. The change time cannot be set
+# back, so a copy rewritten with its old size and modification time is indexed again
+index_header = struct.Struct('!8sQqqI')
+index_entry = struct.Struct(f'!{CHUNK_HASH_SIZE}sI')
+INDEX_MAGIC = b'DRTPIDX2'
+
+# The delta starts with a magic string, the size of the new file and the number of chunks in the
+# recipe, followed by the recipe and then by the chunks that are sent
+delta_header = struct.Struct('!8sQI')
+delta_entry = struct.Struct(f'!B{CHUNK_HASH_SIZE}sI')
+DELTA_MAGIC = b'DRTPDLT1'
+CHUNK_COPY = 0       # The chunk is in the server's copy
+CHUNK_LITERAL = 1    # The chunk follows the recipe
+
+
+def content_chunks(data):
+    """
+    Cuts data into content-defined chunks.
+    Args:
+        data (bytes-like): The data, a memoryview of a mapped file for large files.
+    Returns:
+        generator: (offset, length) of every chunk, in order.
+    """
+    size = len(data)
+    offset = 0
+    block_start, symbols = 0, b''
+    while offset < size:
+        end = min(offset + SYNC_MAX_CHUNK, size)
+        start = offset + SYNC_MIN_CHUNK - len(BOUNDARY_PATTERN)
+        cut = end
+        if start + len(BOUNDARY_PATTERN) < end:
+            # Map the next block to symbols when the chunk may end past the mapped one
+            if end > block_start + len(symbols):
+                block_start = start
+                symbols = bytes(data[start:min(start + SYNC_READ_SIZE, size)]).translate(SYMBOL_TABLE)
+            found = symbols.find(BOUNDARY_PATTERN, start - block_start, end - block_start)
+            if found >= 0:
+                cut = block_start + found + len(BOUNDARY_PATTERN)
+        yield offset, cut - offset
+        offset = cut
+
+
+def chunk_hash(data):
+    """
+    Args:
+        data (bytes-like): A chunk.
+    Returns:
+        bytes: The CHUNK_HASH_SIZE-byte hash that identifies the chunk.
+    """
+    return hashlib.sha256(data).digest()[:CHUNK_HASH_SIZE]
+
+
+def index_file(path, file_hash=None):
+    """
+    Cuts a file into content-defined chunks and hashes them.
+    Args:
+        path (str): The file.
+        file_hash (hashlib hash): Also fed the whole file, if given, so it is read only once.
+    Returns:
+        list: (hash, length) of every chunk, in order.
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    with open(path, 'rb') as file:
+        if os.fstat(file.fileno()).st_size == 0:
+            # mmap cannot map an empty file
+            return []
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapping:
+            if hasattr(mmap, 'MADV_SEQUENTIAL'):
+                mapping.madvise(mmap.MADV_SEQUENTIAL)
+            view = memoryview(mapping)
+            try:
+                chunks = []
+                for offset, length in content_chunks(view):
+                    with view[offset:offset + length] as chunk:
+                        chunks.append((chunk_hash(chunk), length))
+                        if file_hash is not None:
+                            file_hash.update(chunk)
+                return chunks
+            finally:
+                view.release()
+
+
+def load_index(path):
+    """
+    Returns the chunks of the server's copy of a file, from its index file if that still describes
+    the copy, or else by indexing the copy and saving the index file for the next transfer.
+    Args:
+        path (str): The server's copy. It may not exist, in which case it has no chunks.
+    Returns:
+        list: (hash, length) of every chunk of the copy, in order.
+    Raises:
+        OSError: If the copy cannot be read.
+    """
+    try:
+        status = os.stat(path)
+    except FileNotFoundError:
+        return []
+    try:
+        with open(path + INDEX_SUFFIX, 'rb') as index:
+            data = index.read()
+        magic, size, mtime_ns, ctime_ns, count = index_header.unpack_from(data)
+        if (magic == INDEX_MAGIC and size == status.st_size and mtime_ns == status.st_mtime_ns
+                and ctime_ns == status.st_ctime_ns and len(data) == index_header.size + count * index_entry.size):
+            chunks = list(index_entry.iter_unpack(data[index_header.size:]))
+            if sum(length for _, length in chunks) == size:
+                return chunks
+    except (OSError, struct.error):
+        pass
+    chunks = index_file(path)
+    try:
+        save_index(path, chunks, status)
+    except OSError:
+        # The index is only a cache; it is computed again next time
+        pass
+    return chunks
+
+
+def save_index(path, chunks, status=None):
+    """
+    Replaces the index file of a file atomically.
+    Args:
+        path (str): The file.
+        chunks (list): (hash, length) of every chunk of the file, in order.
+        status (os.stat_result): The status of the file when it was indexed, None to read it now.
+    """
+    if status is None:
+        status = os.stat(path)
+    temporary = path + INDEX_SUFFIX + '.tmp'
+    with open(temporary, 'wb') as index:
+        index.write(index_header.pack(INDEX_MAGIC, status.st_size, status.st_mtime_ns, status.st_ctime_ns, len(chunks)))
+        index.write(b''.join(index_entry.pack(digest, length) for digest, length in chunks))
+    os.replace(temporary, path + INDEX_SUFFIX)
+
+
+def write_delta(output, path, chunks, have):
+    """
+    Writes the delta that turns the server's copy into a file: the recipe of the file's chunks,
+    then the chunks the server does not have.
+    Args:
+        output (file): Where to write the delta, opened for binary writing.
+        path (str): The file to send.
+        chunks (list): (hash, length) of every chunk of the file, in order, from index_file.
+        have (set): The hashes of the chunks of the server's copy.
+    Returns:
+        tuple: The number of chunks, the number of them the server has and the number of bytes
+        of the file that are sent in the delta.
+    Raises:
+        OSError: If the file cannot be read.
+    """
+    size = sum(length for _, length in chunks)
+    output.write(delta_header.pack(DELTA_MAGIC, size, len(chunks)))
+    output.write(b''.join(delta_entry.pack(CHUNK_COPY if digest in have else CHUNK_LITERAL, digest, length)
+                          for digest, length in chunks))
+    literal_bytes = 0
+    matched = 0
+    with open(path, 'rb') as file:
+        offset = 0
+        for digest, length in chunks:
+            if digest in have:
+                matched += 1
+            else:
+                output.write(os.pread(file.fileno(), length, offset))
+                literal_bytes += length
+            offset += length
+    return len(chunks), matched, literal_bytes
+
+
+def apply_delta(delta_path, base_path, base_chunks, output_path, sync=False):
+    """
+    Rebuilds a file from a delta and the server's copy, then reads it back to check every chunk
+    against the hash in the recipe and to hash the whole file.
+    Args:
+        delta_path (str): The delta the client sent.
+        base_path (str): The server's copy.
+        base_chunks (list): (hash, length) of every chunk of the copy, in order.
+        output_path (str): Where to write the rebuilt file.
+        sync (bool): Whether to sync the rebuilt file to disk.
+    Returns:
+        tuple: (hash, length) of every chunk of the rebuilt file, in order, for its index file, and
+        the SHA-256 digest of the rebuilt file.
+    Raises:
+        ValueError: If the delta is malformed, refers to a chunk the copy does not have, or the
+        rebuilt file does not match it, because the copy changed since it was indexed.
+        OSError: If a file cannot be read or written.
+    """
+    locations = {}
+    offset = 0
+    for digest, length in base_chunks:
+        locations.setdefault(digest, (offset, length))
+        offset += length
+
+    with open(delta_path, 'rb') as delta:
+        try:
+            magic, size, count = delta_header.unpack(delta.read(delta_header.size))
+            recipe = list(delta_entry.iter_unpack(delta.read(count * delta_entry.size)))
+        except struct.error:
+            raise ValueError('the delta is truncated')
+        if magic != DELTA_MAGIC or len(recipe) != count or sum(entry[2] for entry in recipe) != size:
+            raise ValueError('the delta is malformed')
+
+        # Copy runs of chunks that follow each other in the copy or in the delta with one call each
+        runs = []
+        delta_offset = delta.tell()
+        for kind, digest, length in recipe:
+            if kind == CHUNK_COPY:
+                location = locations.get(digest)
+                if location is None or location[1] != length:
+                    raise ValueError(f'the delta refers to chunk {digest.hex()}, which {base_path} does not have')
+                source = (False, location[0])
+            elif kind == CHUNK_LITERAL:
+                source = (True, delta_offset)
+                delta_offset += length
+            else:
+                raise ValueError(f'the delta has a chunk of unknown kind {kind}')
+            if runs and runs[-1][0] == source[0] and runs[-1][1] + runs[-1][2] == source[1]:
+                runs[-1][2] += length
+            else:
+                runs.append([source[0], source[1], length])
+
+        base_fd = os.open(base_path, os.O_RDONLY) if os.path.exists(base_path) else None
+        output_fd = os.open(output_path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            position = 0
+            for literal, source_offset, length in runs:
+                copy_range(delta.fileno() if literal else base_fd, output_fd, source_offset, position, length)
+                position += length
+
+            # The copy is trusted only as far as its index, so check what was copied from it; the
+            # file is still in the page cache, and this also hashes it for the digest of the transfer
+            file_hash = hashlib.sha256()
+            position = 0
+            for number, (_, digest, length) in enumerate(recipe):
+                data = os.pread(output_fd, length, position)
+                if chunk_hash(data) != digest:
+                    raise ValueError(f'chunk {number} of the rebuilt file does not match the delta, '
+                                     f'{base_path} changed since it was indexed')
+                file_hash.update(data)
+                position += length
+            if sync:
+                os.fsync(output_fd)
+        finally:
+            os.close(output_fd)
+            if base_fd is not None:
+                os.close(base_fd)
+    return [(digest, length) for _, digest, length in recipe], file_hash.digest()
+
+
+def copy_range(source_fd, output_fd, source_offset, output_offset, length):
+    """
+    Copies a byte range between files, inside the kernel with copy_file_range where the platform
+    and the file systems support it, and through a buffer otherwise.
+    Args:
+        source_fd (int): The file to copy from.
+        output_fd (int): The file to copy to.
+        source_offset (int): Where the range starts in the source.
+        output_offset (int): Where to write it.
+        length (int): The length of the range.
+    Raises:
+        ValueError: If the source ends before the range.
+    """
+    while length > 0:
+        copied = 0
+        if hasattr(os, 'copy_file_range'):
+            try:
+                copied = os.copy_file_range(source_fd, output_fd, length, source_offset, output_offset)
+            except OSError:
+                # Not supported between these file systems; the loop below copies the range
+                pass
+        if not copied:
+            block = os.pread(source_fd, min(length, SYNC_READ_SIZE), source_offset)
+            copied = len(block)
+            if copied == 0:
+                raise ValueError(f'a file ends {length} bytes before the range to copy')
+            written = 0
+            while written < copied:
+                written += os.pwrite(output_fd, block[written:], output_offset + written)
+        source_offset += copied
+        output_offset += copied
+        length -= copied
@@ -0,0 +1,169 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities
+from utils import *
+import asyncio
+import sys
+
+# ---------------- LINUX UDP OFFLOAD ---------------- 
+# UDP generic segmentation offload (GSO) lets the sender hand the kernel many equally sized
+# datagrams in one sendmsg call, and UDP generic receive offload (GRO) lets the receiver read
+# many coalesced datagrams in one recvmsg call. Both are Linux-only; everything here falls back
+# to one datagram per system call when the kernel does not support them.
+SOL_UDP = getattr(socket, 'SOL_UDP', 17)
+UDP_SEGMENT = getattr(socket, 'UDP_SEGMENT', 103)
+UDP_GRO = getattr(socket, 'UDP_GRO', 104)
+UDP_MAX_SEGMENTS = 64          # Kernel limit on the segments of one GSO send
+MAX_UDP_PAYLOAD = 65507        # Largest IPv4 UDP payload
+GRO_BUFFER_SIZE = 65535        # Largest coalesced datagram GRO can deliver
+READS_PER_WAKEUP = 64          # Datagrams read per event loop wakeup, so one busy sender cannot starve the loop
+
+
+def enable_gso(sock):
+    """
+    Checks whether the kernel supports UDP GSO on a socket.
+    Args:
+        sock (socket): The UDP socket.
+    Returns:
+        bool: True if segments can be sent with UDP_SEGMENT.
+    """
+    if not sys.platform.startswith('linux'):
+        return False
+    try:
+        # A GSO size of 0 keeps the default behaviour; it only fails if UDP_SEGMENT is unknown
+        sock.setsockopt(SOL_UDP, UDP_SEGMENT, 0)
+        return True
+    except OSError:
+        return False
+
+
+def send_segments(sock, addr, packets, segment_size):
+    """
+    Sends several packets with one system call. The kernel splits the buffer into datagrams of
+    segment_size bytes, so every packet but the last must be exactly segment_size bytes long.
+    Args:
+        sock (socket): The UDP socket.
+        addr (tuple): The address of the recipient.
+        packets (list): The packets, each a list of buffers (header and payload).
+        segment_size (int): The size of every datagram but the last.
+    Raises:
+        OSError: If the kernel or the network device rejects the GSO send.
+    """
+    buffers = [part for packet in packets for part in packet]
+    sock.sendmsg(buffers, [(SOL_UDP, UDP_SEGMENT, struct.pack('=H', segment_size))], 0, addr)
+
+
+class DatagramReader:
+    """
+    Receives datagrams one at a time into a preallocated buffer, reading them in batches when
+    UDP GRO is available. Datagrams are handed out as memoryviews of the buffer, so receiving
+    allocates no new buffer and copies nothing; a datagram is only valid until the next one is
+    read, so whoever keeps part of it must copy that part. With GRO, one recvmsg_into call fills
+    the buffer with a run of coalesced datagrams from the same sender, and the kernel reports the
+    segment size in a control message so the run can be split back into datagrams.
+    Args:
+        sock (socket): The bound UDP socket.
+        buffer_size (int): The largest datagram to receive without GRO.
+        gro (bool): Whether to try to enable UDP GRO.
+    """
+
+    def __init__(self, sock, buffer_size, gro=False):
+        self.sock = sock
+        self.buffer_size = buffer_size
+        self.pending = []
+        self.addr = None
+        self.gro = gro and sys.platform.startswith('linux')
+        if self.gro:
+            try:
+                sock.setsockopt(SOL_UDP, UDP_GRO, 1)
+            except OSError:
+                print("UDP GRO is not supported by the kernel, receiving one datagram per system call")
+                self.gro = False
+        if self.gro:
+            self.ancillary_size = socket.CMSG_SPACE(struct.calcsize('i'))
+        self.buffer = bytearray(GRO_BUFFER_SIZE if self.gro else buffer_size)
+        self.view = memoryview(self.buffer)
+
+    def recv(self):
+        """
+        Returns the next datagram.
+        Returns:
+            tuple: The datagram, a memoryview of the buffer that is valid until the next call,
+            and the sender's address.
+        """
+        if self.pending:
+            return self.pending.pop(), self.addr
+        if not self.gro:
+            nbytes, addr = self.sock.recvfrom_into(self.buffer)
+            return self.view[:nbytes], addr
+
+        nbytes, ancdata, _, self.addr = self.sock.recvmsg_into([self.buffer], self.ancillary_size)
+        segment_size = nbytes
+        for level, kind, value in ancdata:
+            if level == SOL_UDP and kind == UDP_GRO:
+                segment_size = struct.unpack('i', value[:struct.calcsize('i')])[0]
+        datagrams = [self.view[offset:min(offset + segment_size, nbytes)] for offset in range(0, nbytes, segment_size)] or [self.view[:0]]
+        # Keep the rest in reverse order so they can be popped from the end
+        self.pending = datagrams[:0:-1]
+        return datagrams[0], self.addr
+
+
+class ReaderTransport(asyncio.DatagramTransport):
+    """
+    An asyncio datagram transport that receives through a DatagramReader.
+    The transports of asyncio read with recvfrom, which allocates a new bytes object for every
+    datagram and would hand GRO-coalesced runs to the protocol as one datagram, so the socket is
+    watched with add_reader instead and every datagram is delivered separately, as a memoryview
+    of the reader's buffer that the protocol must not keep.
+    Args:
+        loop (asyncio.AbstractEventLoop): The running event loop.
+        sock (socket): The bound, non-blocking UDP socket.
+        protocol (asyncio.DatagramProtocol): The protocol that receives the datagrams.
+        reader (DatagramReader): The reader of the socket.
+    """
+
+    def __init__(self, loop, sock, protocol, reader):
+        super().__init__()
+        self.loop = loop
+        self.sock = sock
+        self.protocol = protocol
+        self.reader = reader
+        self.closed = False
+        loop.add_reader(sock.fileno(), self._read_ready)
+        protocol.connection_made(self)
+
+    def sendto(self, data, addr=None):
+        try:
+            self.sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            # The send buffer is full; the datagram is lost like any other and the peer retransmits
+            pass
+
+    def get_extra_info(self, name, default=None):
+        return self.sock if name == 'socket' else default
+
+    def is_closing(self):
+        return self.closed
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.protocol.connection_lost(None)
+
+    def _read_ready(self):
+        if self.closed:
+            return
+        for _ in range(READS_PER_WAKEUP):
+            try:
+                data, addr = self.reader.recv()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                self.protocol.error_received(e)
+                return
+            self.protocol.datagram_received(data, addr)
+        if self.reader.pending:
+            # The rest of a coalesced run is already read, so the socket will not wake the loop for it
+            self.loop.call_soon(self._read_ready)
@@ -0,0 +1,166 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities
+from utils import *
+
+# ---------------- FORWARD ERROR CORRECTION ---------------- 
+# With --fec the client follows every block of data packets with a parity packet, the XOR of their
+# payloads, so the server can rebuild one lost packet per block without waiting a round trip for
+# the retransmission. Blocks are runs of consecutive sequence numbers sent for the first time;
+# parity packets carry FEC_FLAG and the first sequence number of their block, and use no sequence
+# number of their own. The payloads of a block are XORed as big integers, which Python does in C
+# over the whole payload at once, so the parity costs about as much as copying the block.
+#
+# With a fixed block size the redundancy is one packet in --fec. With auto the client estimates the
+# loss rate from its retransmissions and the packets the server reports it rebuilt, and sizes the
+# blocks so that a block loses FEC_LOSSES_PER_BLOCK packets on average, which one parity packet
+# can usually repair.
+
+# The parity payload starts with the number of packets in the block and the XOR of their payload
+# lengths and flags, followed by the XOR of their payloads, zero-padded to the longest
+parity_header = struct.Struct('!HHH')
+
+
+def xor_payloads(payloads):
+    """
+    XORs payloads of any lengths, the shorter ones padded with zeros at the end.
+    Args:
+        payloads (iterable): The payloads, bytes-like.
+    Returns:
+        bytes: The XOR, as long as the longest payload.
+    """
+    value = 0
+    length = 0
+    for payload in payloads:
+        # Little-endian, so the zero padding of a shorter payload is at its end
+        value ^= int.from_bytes(payload, 'little')
+        length = max(length, len(payload))
+    return value.to_bytes(length, 'little')
+
+
+def parity_payload(packets):
+    """
+    Builds the payload of the parity packet of a block.
+    Args:
+        packets (list): The flags and payload of every data packet of the block, in order.
+    Returns:
+        bytes: The parity payload.
+    """
+    length_xor = 0
+    flags_xor = 0
+    for flags, payload in packets:
+        length_xor ^= len(payload)
+        flags_xor ^= flags
+    return parity_header.pack(len(packets), length_xor, flags_xor) + xor_payloads(payload for _, payload in packets)
+
+
+def recover_packet(parity, packets):
+    """
+    Rebuilds the one missing data packet of a block.
+    Args:
+        parity (bytes): The payload of the parity packet.
+        packets (list): The flags and payload of every other data packet of the block.
+    Returns:
+        tuple: The flags and payload of the missing packet.
+    Raises:
+        ValueError: If the parity payload is malformed or does not match the packets.
+    """
+    try:
+        count, length, flags = parity_header.unpack_from(parity)
+    except struct.error:
+        raise ValueError('the parity packet is truncated')
+    if count != len(packets) + 1:
+        raise ValueError(f'the parity covers {count} packets, not {len(packets) + 1}')
+    for packet_flags, payload in packets:
+        length ^= len(payload)
+        flags ^= packet_flags
+    data = xor_payloads([memoryview(parity)[parity_header.size:]] + [payload for _, payload in packets])
+    if length > len(data):
+        raise ValueError('the parity packet is shorter than the missing packet')
+    return flags, data[:length]
+
+
+class FecEncoder:
+    """
+    Groups the data packets into blocks as they are first sent and builds the parity of every block.
+    Args:
+        block_size (int): The number of data packets per parity packet, the starting value if adaptive.
+        adaptive (bool): Whether to size the blocks after the loss rate.
+    """
+
+    def __init__(self, block_size, adaptive=False):
+        self.block_size = block_size
+        self.adaptive = adaptive
+        self.block = []           # The flags and payload of the packets of the current block
+        self.first = None         # The sequence number of the first packet of the block
+        self.loss_rate = 0.0
+        self.sent = 0             # Packets sent since the loss rate was last updated
+        self.losses = 0           # Losses seen since then
+        self.recovered = 0        # The number of rebuilt packets the server last reported
+
+    def add(self, seq, flags, payload, last=False):
+        """
+        Adds a data packet sent for the first time to the current block.
+        Args:
+            seq (int): The sequence number of the packet.
+            flags (int): Its flags.
+            payload (bytes-like): Its payload, as sent.
+            last (bool): Whether it is the last packet of the file, which ends the block.
+        Returns:
+            list: (first sequence number, parity payload) of the blocks this packet completed: the
+            previous one if the packet does not follow it, because the chunks in between were
+            already received, and its own.
+        """
+        parities = []
+        if self.block and seq != self.first + len(self.block):
+            parities.append(self.flush())
+        if not self.block:
+            self.first = seq
+        self.block.append((flags, payload))
+        self.sent += 1
+        if len(self.block) >= self.block_size or last:
+            parities.append(self.flush())
+        return parities
+
+    def flush(self):
+        """
+        Ends the current block.
+        Returns:
+            tuple: The first sequence number of the block and its parity payload.
+        """
+        parity = (self.first, parity_payload(self.block))
+        self.block = []
+        if self.adaptive:
+            self.adapt()
+        return parity
+
+    def on_loss(self, count=1):
+        """
+        Counts packets that were lost, retransmitted or rebuilt.
+        Args:
+            count (int): The number of packets.
+        """
+        self.losses += count
+
+    def on_recovered(self, recovered):
+        """
+        Counts the packets the server rebuilt from parity as losses.
+        Args:
+            recovered (int): The number of rebuilt packets the server reports in an ACK, in total.
+        """
+        if recovered > self.recovered:
+            self.on_loss(recovered - self.recovered)
+            self.recovered = recovered
+
+    def adapt(self):
+        """
+        Updates the loss rate with the packets of the last block and resizes the blocks.
+        """
+        if self.sent == 0:
+            return
+        sample = min(self.losses / self.sent, 1.0)
+        self.loss_rate += FEC_GAIN * (sample - self.loss_rate)
+        self.sent = self.losses = 0
+        if self.loss_rate > 0:
+            self.block_size = int(min(max(FEC_LOSSES_PER_BLOCK / self.loss_rate, FEC_MIN_BLOCK), FEC_MAX_BLOCK))
+        else:
+            self.block_size = FEC_MAX_BLOCK
@@ -0,0 +1,247 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities and the modules used by the proxy loop
+from utils import *
+import heapq
+import random
+import select
+import signal
+import sys
+
+# ---------------- IMPAIRMENT PROXY ---------------- 
+# A userspace stand-in for Mininet and netem: a UDP proxy that forwards datagrams between clients
+# and a server and impairs them on the way, with delay, jitter, loss, duplication, reordering and
+# a bandwidth limit with a drop-tail queue, and bit errors. Every client gets its own upstream socket, so several
+# connections (--streams, concurrent clients) can share one proxy. It needs neither root nor
+# Linux, so the real client and server can be tested over loopback on any machine.
+
+
+class Link:
+    """
+    One direction of the impaired path. Packets are first dropped at random, then wait in the
+    queue of the bandwidth limit, then are delayed.
+    Args:
+        rng (random.Random): The random number generator, seeded so runs can be repeated.
+        delay (float): One-way delay in seconds.
+        jitter (float): Each packet's delay varies uniformly by up to this many seconds.
+        loss (float): Probability that a packet is dropped.
+        duplicate (float): Probability that a packet is sent twice.
+        reorder (float): Probability that a packet is held back by reorder_delay, so later packets overtake it.
+        reorder_delay (float): How long a reordered packet is held back, in seconds.
+        rate (float): The bandwidth in bits per second, None for no limit.
+        queue (int): Bytes that may wait for the bandwidth limit before packets are dropped.
+        corrupt (float): Probability that one random bit of a packet is flipped.
+    """
+
+    def __init__(self, rng, delay=0.0, jitter=0.0, loss=0.0, duplicate=0.0, reorder=0.0,
+                 reorder_delay=IMPAIR_REORDER_DELAY, rate=None, queue=IMPAIR_QUEUE_BYTES, corrupt=0.0):
+        self.rng = rng
+        self.delay = delay
+        self.jitter = jitter
+        self.loss = loss
+        self.duplicate = duplicate
+        self.reorder = reorder
+        self.reorder_delay = reorder_delay
+        self.rate = rate / 8 if rate else None  # bytes per second
+        self.queue = queue
+        self.corrupt = corrupt
+        self.busy_until = 0.0
+        self.stats = {'forwarded': 0, 'lost': 0, 'queue_drops': 0, 'duplicated': 0, 'reordered': 0, 'corrupted': 0}
+
+    def schedule(self, now, size):
+        """
+        Decides what happens to a packet.
+        Args:
+            now (float): When the packet arrived, from time.monotonic.
+            size (int): The size of the packet in bytes.
+        Returns:
+            list: The times to send the packet at: none if it is dropped, two if it is duplicated.
+        """
+        if self.loss and self.rng.random() < self.loss:
+            self.stats['lost'] += 1
+            return []
+        departure = now
+        if self.rate:
+            # The packet waits for the ones queued before it to be serialized
+            backlog = max(self.busy_until - now, 0.0) * self.rate
+            if backlog + size > self.queue:
+                self.stats['queue_drops'] += 1
+                return []
+            self.busy_until = max(self.busy_until, now) + size / self.rate
+            departure = self.busy_until
+        copies = 1
+        if self.duplicate and self.rng.random() < self.duplicate:
+            self.stats['duplicated'] += 1
+            copies = 2
+        times = []
+        for _ in range(copies):
+            delay = self.delay
+            if self.jitter:
+                delay = max(delay + self.rng.uniform(-self.jitter, self.jitter), 0.0)
+            if self.reorder and self.rng.random() < self.reorder:
+                self.stats['reordered'] += 1
+                delay += self.reorder_delay
+            times.append(departure + delay)
+        self.stats['forwarded'] += 1
+        return times
+
+    def damage(self, data):
+        """
+        Flips a random bit of a packet, with the probability of corruption.
+        Args:
+            data (bytes): The packet.
+        Returns:
+            bytes: The packet as it is forwarded.
+        """
+        if not self.corrupt or not data or self.rng.random() >= self.corrupt:
+            return data
+        self.stats['corrupted'] += 1
+        damaged = bytearray(data)
+        bit = self.rng.randrange(len(damaged) * 8)
+        damaged[bit >> 3] ^= 1 << (bit & 7)
+        return bytes(damaged)
+
+
+class ImpairmentProxy:
+    """
+    Forwards datagrams between the clients and the server through two impaired links.
+    Args:
+        listen (tuple): The address the clients send to.
+        target (tuple): The address of the server.
+        uplink (Link): The link from the clients to the server.
+        downlink (Link): The link from the server to the clients.
+    """
+
+    def __init__(self, listen, target, uplink, downlink):
+        self.target = target
+        self.uplink = uplink
+        self.downlink = downlink
+        self.listener = self.open_socket(listen)
+        self.upstreams = {}  # client address -> socket towards the server
+        self.clients = {}    # socket towards the server -> client address
+        self.pending = []    # heap of (time, order, socket, data, address)
+        self.order = 0
+        self.stopped = False
+
+    @staticmethod
+    def open_socket(address):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        # A large receive buffer keeps the kernel from dropping packets the proxy did not mean to drop
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        sock.bind(address)
+        sock.setblocking(False)
+        return sock
+
+    def upstream(self, client):
+        """
+        Returns:
+            socket.socket: The socket that forwards the packets of a client to the server.
+        """
+        sock = self.upstreams.get(client)
+        if sock is None:
+            sock = self.open_socket((self.listener.getsockname()[0], 0))
+            self.upstreams[client] = sock
+            self.clients[sock] = client
+        return sock
+
+    def forward(self, link, now, data, sock, address):
+        times = link.schedule(now, len(data))
+        if times:
+            data = link.damage(data)
+        for departure in times:
+            heapq.heappush(self.pending, (departure, self.order, sock, data, address))
+            self.order += 1
+
+    def run(self):
+        """
+        Forwards packets until stop is called.
+        """
+        while not self.stopped:
+            now = time.monotonic()
+            while self.pending and self.pending[0][0] <= now:
+                _, _, sock, data, address = heapq.heappop(self.pending)
+                try:
+                    sock.sendto(data, address)
+                except OSError:
+                    # A full send buffer is a loss like any other
+                    pass
+            timeout = max(self.pending[0][0] - now, 0.0) if self.pending else IMPAIR_POLL_INTERVAL
+            try:
+                ready, _, _ = select.select([self.listener, *self.clients], [], [], min(timeout, IMPAIR_POLL_INTERVAL))
+            except InterruptedError:
+                continue
+            now = time.monotonic()
+            for sock in ready:
+                # Drain a burst at once, but come back to send what is due
+                for _ in range(IMPAIR_READS_PER_WAKEUP):
+                    try:
+                        data, address = sock.recvfrom(MAX_SEGMENT_SIZE + BUFFER_SIZE)
+                    except (BlockingIOError, InterruptedError):
+                        break
+                    except OSError:
+                        continue
+                    if sock is self.listener:
+                        self.forward(self.uplink, now, data, self.upstream(address), self.target)
+                    else:
+                        self.forward(self.downlink, now, data, self.listener, self.clients[sock])
+
+    def stop(self, *_):
+        self.stopped = True
+
+    def close(self):
+        self.listener.close()
+        for sock in self.clients:
+            sock.close()
+
+
+def parse_address(text):
+    """
+    Parses an address written as host:port.
+    Args:
+        text (str): The address.
+    Returns:
+        tuple: The host and the port.
+    """
+    host, _, port = text.rpartition(':')
+    return host or '127.0.0.1', int(port)
+
+
+def main():
+    """
+    Runs the proxy with the impairments given on the command line until it is interrupted.
+    """
+    parser = argparse.ArgumentParser(description='Forward UDP datagrams with netem-like impairments')
+    parser.add_argument('--listen', type=parse_address, required=True, help='host:port the clients send to')
+    parser.add_argument('--target', type=parse_address, required=True, help='host:port of the server')
+    parser.add_argument('--delay', type=float, default=0.0, help='One-way delay in milliseconds, in each direction')
+    parser.add_argument('--jitter', type=float, default=0.0, help='Uniform variation of the delay in milliseconds')
+    parser.add_argument('--loss', type=float, default=0.0, help='Probability that a packet is dropped, in each direction')
+    parser.add_argument('--duplicate', type=float, default=0.0, help='Probability that a packet is sent twice')
+    parser.add_argument('--reorder', type=float, default=0.0, help='Probability that a packet is held back')
+    parser.add_argument('--reorder-delay', type=float, default=IMPAIR_REORDER_DELAY * 1000, help='How long a reordered packet is held back, in milliseconds')
+    parser.add_argument('--rate', type=float, help='Bandwidth limit in Mbps, in each direction')
+    parser.add_argument('--queue', type=int, default=IMPAIR_QUEUE_BYTES, help=f'Bytes queued behind the bandwidth limit before packets are dropped, default is {IMPAIR_QUEUE_BYTES}')
+    parser.add_argument('--corrupt', type=float, default=0.0, help='Probability that a bit of a packet is flipped, in each direction')
+    parser.add_argument('--seed', type=int, default=1, help='Seed of the random impairments')
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    links = [Link(rng, args.delay / 1000, args.jitter / 1000, args.loss, args.duplicate, args.reorder,
+                  args.reorder_delay / 1000, args.rate * 1000000 if args.rate else None, args.queue, args.corrupt)
+             for _ in range(2)]
+    try:
+        proxy = ImpairmentProxy(args.listen, args.target, *links)
+    except OSError as e:
+        print(f"Error creating/binding socket: {e}")
+        sys.exit(1)
+    signal.signal(signal.SIGTERM, proxy.stop)
+    signal.signal(signal.SIGINT, proxy.stop)
+    print(f"Proxy forwarding {args.listen[0]}:{args.listen[1]} to {args.target[0]}:{args.target[1]}", flush=True)
+    proxy.run()
+    proxy.close()
+    for name, link in (('uplink', links[0]), ('downlink', links[1])):
+        print(f"{name}: " + ', '.join(f"{key} {value}" for key, value in link.stats.items()))
+
+# ---------------- SCRIPT ENTRY POINT ---------------- 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities, the checksums and the modules used by the digest thread
+from utils import *
+from protocol import OPT_CRC
+import hashlib
+import queue
+import threading
+import zlib
+
+# CRC32C is used when the crc32c package is installed
+try:
+    import crc32c
+except ImportError:
+    crc32c = None
+
+# ---------------- INTEGRITY ---------------- 
+# Two checks on top of the optional UDP checksum. Every data packet carries a CRC of its header
+# and payload in an OPT_CRC option; the server drops a packet whose CRC does not match and NACKs
+# it, so the client sends it again at once instead of waiting for its timer. And both sides hash
+# the file as it goes by, the client as it sends the chunks for the first time and the server as
+# it writes them in order, each on a background thread, so no second pass over the file is
+# needed. The client sends its digest in the FIN and the server answers with its own in the
+# FIN ACK, so both sides learn whether the file arrived intact.
+CHECKSUM_CRC32C = 1
+CHECKSUM_CRC32 = 2
+
+# The CRC option: type, length and the 32-bit CRC
+CRC_OPTION_SIZE = 6
+
+
+class Checksum:
+    """
+    A 32-bit CRC of the packets of a connection.
+    Attributes:
+        name (str): The name printed in the log.
+        checksum_id (int): The number sent in OPT_CHECKSUM.
+    """
+    name = None
+    checksum_id = None
+
+    def crc(self, data, value=0):
+        """
+        Args:
+            data (bytes-like): The data.
+            value (int): The CRC of the data before it, to continue from.
+        Returns:
+            int: The CRC.
+        """
+        raise NotImplementedError
+
+    def seal(self, header, payload):
+        """
+        Appends the CRC option to the header of a data packet.
+        Args:
+            header (bytes): The header, built with room for CRC_OPTION_SIZE bytes of options.
+            payload (bytes-like): The payload.
+        Returns:
+            bytes: The header and the CRC option.
+        """
+        return header + bytes((OPT_CRC, 4)) + self.crc(payload, self.crc(header)).to_bytes(4, 'big')
+
+    def verify(self, data, header_size):
+        """
+        Checks the CRC of a received data packet.
+        Args:
+            data (bytes-like): The datagram.
+            header_size (int): The size of the fixed header.
+        Returns:
+            bool: True if the packet carries a CRC option that matches its header and payload.
+        """
+        view = memoryview(data)
+        option = view[header_size:header_size + CRC_OPTION_SIZE]
+        if len(option) != CRC_OPTION_SIZE or option[0] != OPT_CRC or option[1] != 4:
+            return False
+        expected = int.from_bytes(option[2:], 'big')
+        return self.crc(view[header_size + CRC_OPTION_SIZE:], self.crc(view[:header_size])) == expected
+
+
+class Crc32cChecksum(Checksum):
+    name = 'crc32c'
+    checksum_id = CHECKSUM_CRC32C
+
+    def crc(self, data, value=0):
+        return crc32c.crc32c(data, value)
+
+
+class Crc32Checksum(Checksum):
+    name = 'crc32'
+    checksum_id = CHECKSUM_CRC32
+
+    def crc(self, data, value=0):
+        return zlib.crc32(data, value)
+
+
+# The checksums that are installed, preferred first. CRC32C is the stronger one, with
+# hardware support on most CPUs; zlib's CRC-32 is always there
+CHECKSUMS = ([Crc32cChecksum()] if crc32c else []) + [Crc32Checksum()]
+CHECKSUMS_BY_ID = {checksum.checksum_id: checksum for checksum in CHECKSUMS}
+
+
+def offered_checksums():
+    """
+    Returns:
+        bytes: The IDs of the installed checksums, the value of OPT_CHECKSUM in the SYN-ACK.
+    """
+    return bytes(checksum.checksum_id for checksum in CHECKSUMS)
+
+
+def choose_checksum(offered):
+    """
+    Chooses the checksum of the connection.
+    Args:
+        offered (bytes): The checksum IDs the server offered, empty if it offered none.
+    Returns:
+        Checksum: The checksum, or None if the server checks no CRCs.
+    """
+    for checksum in CHECKSUMS:
+        if checksum.checksum_id in offered:
+            return checksum
+    return None
+
+
+class FileDigest:
+    """
+    Hashes the bytes of a transfer in order with SHA-256, on a background thread. hashlib
+    releases the GIL while it hashes, so the thread runs alongside the sender or the event loop.
+    SHA-256 is used rather than BLAKE2b because most CPUs hash it in hardware.
+    Args:
+        path (str): The file to read the ranges passed to update_from_file from, None if there are none.
+        queue_size (int): The maximum number of chunks waiting for the thread.
+    """
+
+    def __init__(self, path=None, queue_size=WRITER_QUEUE_SIZE):
+        self.path = path
+        self.hash = hashlib.sha256()
+        self.error = None
+        # The queue is bounded so a slow thread applies back-pressure instead of using up memory
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        self.value = None
+
+    def update(self, data):
+        """
+        Hashes the next bytes.
+        Args:
+            data (bytes-like): The bytes. They must not change until the digest is finished.
+        """
+        self.queue.put(data)
+
+    def update_view(self, data):
+        """
+        Hashes the next bytes, which are only valid until this call returns, such as a view of the
+        receive buffer. One copy is queued, so the caller never waits for the hash.
+        Args:
+            data (bytes-like): The bytes.
+        """
+        self.queue.put(bytes(data))
+
+    def update_from_file(self, offset, length):
+        """
+        Hashes the next bytes from the file, for chunks an earlier connection wrote.
+        Args:
+            offset (int): Where the bytes start in the file.
+            length (int): How many bytes to hash.
+        """
+        self.queue.put((offset, length))
+
+    def digest(self):
+        """
+        Waits for the queued bytes to be hashed.
+        Returns:
+            bytes: The digest of all the bytes.
+        Raises:
+            OSError: If a range could not be read from the file.
+        """
+        if self.value is None:
+            self.queue.put(None)
+            self.thread.join()
+            if self.error:
+                raise self.error
+            self.value = self.hash.digest()
+        return self.value
+
+    def close(self):
+        """
+        Stops the thread once it has hashed the queued bytes, without waiting for it.
+        """
+        if self.value is None:
+            self.value = b''
+            self.queue.put(None)
+
+    def _run(self):
+        fd = None
+        try:
+            while True:
+                item = self.queue.get()
+                if item is None:
+                    return
+                if self.error is not None:
+                    continue
+                if not isinstance(item, tuple):
+                    self.hash.update(item)
+                    continue
+                try:
+                    if fd is None:
+                        fd = os.open(self.path, os.O_RDONLY)
+                    offset, length = item
+                    while length > 0:
+                        block = os.pread(fd, min(length, DIGEST_READ_SIZE), offset)
+                        if not block:
+                            raise OSError(f"{self.path} ends before byte {offset + length}")
+                        self.hash.update(block)
+                        offset += len(block)
+                        length -= len(block)
+                except OSError as e:
+                    # Keep draining the queue so the caller is never blocked, and report the error later
+                    self.error = e
+        finally:
+            if fd is not None:
+                os.close(fd)
@@ -0,0 +1,241 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities and the modules used by the reporter thread
+from utils import *
+import json
+import select
+import sys
+import threading
+
+# ---------------- LIVE METRICS ---------------- 
+# The client and the server keep counters, gauges and histograms of the transfer while it runs.
+# They are cheap enough to always be collected. A MetricsReporter thread writes them as JSON lines
+# every --metrics-interval seconds to --metrics-file, and answers every connection to the Unix
+# socket --metrics-socket with the current values, so a transfer can be watched and alerted on.
+
+# Histogram bucket upper bounds; values above the last bound fall into an overflow bucket
+RTT_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+PACKET_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768, 65536)
+
+
+class Histogram:
+    """
+    Counts values in fixed buckets.
+    Args:
+        bounds (tuple): The upper bounds of the buckets, in increasing order.
+    """
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+
+    def record(self, value):
+        index = 0
+        while index < len(self.bounds) and value > self.bounds[index]:
+            index += 1
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: The bucket bounds and counts, the number of values and their mean.
+        """
+        return {'bounds': list(self.bounds), 'counts': list(self.counts), 'count': self.count,
+                'mean': round(self.total / self.count, 3) if self.count else None}
+
+
+class Metrics:
+    """
+    The counters, gauges and histograms of one endpoint. Subclasses name their counters in
+    COUNTERS and their histograms in HISTOGRAMS, and report gauges through the gauge callback.
+    Args:
+        gauges (callable): Returns a dictionary of current values, such as the congestion window.
+    """
+    ROLE = None
+    COUNTERS = ()
+    HISTOGRAMS = {}
+    GOODPUT_COUNTER = None
+
+    def __init__(self, gauges=None):
+        self.start = time.monotonic()
+        self.gauges = gauges
+        for name in self.COUNTERS:
+            setattr(self, name, 0)
+        for name, bounds in self.HISTOGRAMS.items():
+            setattr(self, name, Histogram(bounds))
+        self.interval_goodput_mbps = None
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: All metrics, with the goodput averaged since the start.
+        """
+        elapsed = time.monotonic() - self.start
+        snapshot = {'time': round(time.time(), 3), 'role': self.ROLE, 'elapsed': round(elapsed, 3)}
+        for name in self.COUNTERS:
+            snapshot[name] = getattr(self, name)
+        goodput = getattr(self, self.GOODPUT_COUNTER)
+        snapshot['goodput_mbps'] = round(goodput * 8 / elapsed / 1000000, 3) if elapsed > 0 else 0.0
+        snapshot['interval_goodput_mbps'] = self.interval_goodput_mbps
+        if self.gauges is not None:
+            snapshot.update(self.gauges())
+        for name in self.HISTOGRAMS:
+            snapshot[name] = getattr(self, name).snapshot()
+        return snapshot
+
+
+class ClientMetrics(Metrics):
+    """
+    The metrics of a sender. Window occupancy is the number of packets in flight, sampled on every ACK.
+    Bytes sent and acknowledged are payload bytes on the wire, after compression.
+    """
+    ROLE = 'client'
+    COUNTERS = ('packets_sent', 'bytes_sent', 'packets_acked', 'bytes_acked', 'retransmissions',
+                'fast_retransmissions', 'timeouts', 'duplicate_acks', 'compressed_chunks', 'bypassed_chunks',
+                'compression_saved_bytes', 'resumed_chunks', 'nacks_received', 'sync_matched_bytes',
+                'parity_packets_sent', 'spurious_retransmissions', 'congestion_undos')
+    HISTOGRAMS = {'rtt_ms': RTT_BUCKETS_MS, 'window_occupancy': PACKET_BUCKETS}
+    GOODPUT_COUNTER = 'bytes_acked'
+
+
+class ServerMetrics(Metrics):
+    """
+    The metrics of a server, over all its sessions. Reorder depth is the number of packets
+    buffered out of order, sampled whenever a packet is buffered.
+    """
+    ROLE = 'server'
+    COUNTERS = ('packets_received', 'bytes_received', 'bytes_written', 'duplicates', 'out_of_order',
+                'discarded', 'acks_sent', 'acks_delayed', 'sessions_started', 'sessions_completed', 'sessions_dropped',
+                'compressed_chunks', 'sessions_resumed', 'checksum_errors', 'digest_mismatches',
+                'sessions_synced', 'parity_packets_received', 'fec_recovered')
+    HISTOGRAMS = {'reorder_depth': PACKET_BUCKETS}
+    GOODPUT_COUNTER = 'bytes_written'
+
+
+class MetricsReporter:
+    """
+    Writes the metrics as JSON lines at a fixed interval and serves them on a Unix socket,
+    from a background thread so neither the sliding window nor the event loop waits on it.
+    Args:
+        metrics (Metrics): The metrics to report.
+        path (str): Where to append the JSON lines, '-' for standard output, None to not write them.
+        socket_path (str): The Unix socket to serve the current metrics on, None for no socket.
+        interval (float): Seconds between two JSON lines.
+    """
+
+    def __init__(self, metrics, path=None, socket_path=None, interval=METRICS_INTERVAL):
+        self.metrics = metrics
+        self.interval = interval
+        self.output = None
+        if path == '-':
+            self.output = sys.stdout
+        elif path is not None:
+            self.output = open(path, 'a')
+        self.socket_path = socket_path
+        self.listener = None
+        if socket_path is not None:
+            if os.path.exists(socket_path):
+                os.unlink(socket_path)
+            self.listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            self.listener.bind(socket_path)
+            self.listener.listen()
+        # Writing to the socket pair wakes the thread up when the reporter is closed
+        self.wakeup, self.waker = socket.socketpair()
+        self.stopped = False
+        self.last = (time.monotonic(), 0)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def close(self):
+        """
+        Writes a last JSON line and stops the reporter.
+        """
+        self.stopped = True
+        self.waker.send(b'x')
+        self.thread.join()
+        self.emit()
+        if self.output is not None and self.output is not sys.stdout:
+            self.output.close()
+        if self.listener is not None:
+            self.listener.close()
+            os.unlink(self.socket_path)
+        self.wakeup.close()
+        self.waker.close()
+
+    def emit(self):
+        """
+        Writes the current metrics as one JSON line, with the goodput since the last line.
+        """
+        now = time.monotonic()
+        goodput = getattr(self.metrics, self.metrics.GOODPUT_COUNTER)
+        last_time, last_goodput = self.last
+        if now > last_time:
+            self.metrics.interval_goodput_mbps = round((goodput - last_goodput) * 8 / (now - last_time) / 1000000, 3)
+        self.last = (now, goodput)
+        if self.output is not None:
+            self.output.write(json.dumps(self.metrics.snapshot()) + '\n')
+            self.output.flush()
+
+    def _run(self):
+        watched = [self.wakeup] + ([self.listener] if self.listener is not None else [])
+        next_emit = time.monotonic() + self.interval
+        while not self.stopped:
+            ready, _, _ = select.select(watched, [], [], max(next_emit - time.monotonic(), 0))
+            if self.listener in ready:
+                connection, _ = self.listener.accept()
+                try:
+                    connection.sendall(json.dumps(self.metrics.snapshot()).encode() + b'\n')
+                except OSError:
+                    pass
+                connection.close()
+            if time.monotonic() >= next_emit:
+                self.emit()
+                next_emit += self.interval
+
+
+def open_reporter(args, metrics, tag=None):
+    """
+    Starts the reporter asked for on the command line.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        metrics (Metrics): The metrics to report.
+        tag (str): Added to the file and socket names, so that the processes of --workers and
+            --streams do not share them.
+    Returns:
+        MetricsReporter: The reporter, or None if neither --metrics-file nor --metrics-socket is set.
+    """
+    if args.metrics_file is None and args.metrics_socket is None:
+        return None
+    paths = []
+    for path in (args.metrics_file, args.metrics_socket):
+        if path is not None and path != '-' and tag is not None:
+            stem, extension = os.path.splitext(path)
+            path = f'{stem}-{tag}{extension}'
+        paths.append(path)
+    return MetricsReporter(metrics, paths[0], paths[1], args.metrics_interval)
+
+
+def main():
+    """
+    Prints the metrics served on the Unix socket given on the command line.
+    """
+    parser = argparse.ArgumentParser(description='Query the live metrics of a DRTP client or server')
+    parser.add_argument('socket', help='The --metrics-socket of the client or server')
+    args = parser.parse_args()
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as query:
+            query.connect(args.socket)
+            data = b''
+            while chunk := query.recv(BUFFER_SIZE):
+                data += chunk
+    except OSError as e:
+        print(f"Error querying {args.socket}: {e}")
+        sys.exit(1)
+    print(json.dumps(json.loads(data), indent=2))
+
+# ---------------- SCRIPT ENTRY POINT ---------------- 
+if __name__ == "__main__":
+    main()
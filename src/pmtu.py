@@ -0,0 +1,77 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities
+from utils import *
+from protocol import *
+import sys
+
+# ---------------- PATH MTU PROBING ---------------- 
+# Packetization layer path MTU discovery in the spirit of RFC 8899: the client sends padded probe
+# packets with the Don't Fragment bit set and uses the largest one the server acknowledged as the
+# segment size. Probes that are too big are dropped by the path, or refused by the local interface,
+# so no datagram is ever fragmented.
+IP_MTU_DISCOVER = getattr(socket, 'IP_MTU_DISCOVER', 10)
+IP_PMTUDISC_DO = getattr(socket, 'IP_PMTUDISC_DO', 2)        # Set DF, never fragment
+IP_PMTUDISC_PROBE = getattr(socket, 'IP_PMTUDISC_PROBE', 3)  # Set DF and ignore the cached path MTU
+
+
+def set_dont_fragment(sock, mode):
+    """
+    Sets the path MTU discovery mode of a socket. Only supported on Linux, ignored elsewhere.
+    Args:
+        sock (socket): The UDP socket.
+        mode (int): IP_PMTUDISC_DO or IP_PMTUDISC_PROBE.
+    """
+    if sys.platform.startswith('linux'):
+        try:
+            sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, mode)
+        except OSError:
+            pass
+
+
+def probe_path_mtu(sock, addr, proto, max_size, rtt):
+    """
+    Finds the largest datagram the path carries without fragmentation. One probe of every candidate
+    size is sent at once, so the search takes a single round trip, and unanswered sizes are retried
+    PMTU_PROBE_ATTEMPTS - 1 times. Candidates are the UDP payloads of common link MTUs, plus max_size.
+    Args:
+        sock (socket): The client socket.
+        addr (tuple): The address of the server.
+        proto (HeaderV2): The header codec of the connection.
+        max_size (int): The largest datagram the server accepts.
+        rtt (float): The round-trip time measured during the handshake, in seconds.
+    Returns:
+        int: The largest datagram size that reached the server, at least MAX_PACKET_SIZE.
+    """
+    candidates = sorted({size for size in PMTU_PROBE_SIZES if MAX_PACKET_SIZE < size < max_size} | {max_size})
+    confirmed = MAX_PACKET_SIZE
+    timeout = max(PMTU_PROBE_MIN_TIMEOUT, 3 * rtt)
+
+    set_dont_fragment(sock, IP_PMTUDISC_PROBE)
+    for attempt in range(PMTU_PROBE_ATTEMPTS):
+        pending = [size for size in candidates if size > confirmed]
+        if not pending:
+            break
+        for size in pending:
+            padding = size - proto.size
+            try:
+                sock.sendto(proto.data_header(size, PROBE_FLAG, padding) + bytes(padding), addr)
+            except OSError:
+                # Larger than the MTU of the local interface
+                pass
+
+        # Collect the probe ACKs until the timeout, or until the largest candidate is confirmed
+        deadline = time.monotonic() + timeout
+        while confirmed < candidates[-1]:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            sock.settimeout(remaining)
+            try:
+                data, _ = sock.recvfrom(BUFFER_SIZE)
+            except socket.timeout:
+                break
+            packet = proto.parse(data)
+            if packet is not None and packet[2] == PROBE_FLAG | ACK_FLAG:
+                confirmed = max(confirmed, min(packet[1], max_size))
+    set_dont_fragment(sock, IP_PMTUDISC_DO)
+    return confirmed
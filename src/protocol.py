@@ -0,0 +1,363 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities
+from utils import *
+
+# ---------------- DRTP VERSIONS ---------------- 
+# Version 1 is the original 6-byte header with 16-bit sequence numbers. Version 2 uses 32-bit
+# sequence numbers, carries the payload length and has an options area for negotiated extensions.
+#
+# A version 2 client announces itself in the acknowledgment number field of an ordinary 6-byte SYN,
+# which version 1 servers ignore. A version 1 server answers with a 6-byte SYN-ACK and the client
+# falls back to version 1; a version 2 server answers with a version 2 SYN-ACK carrying its options
+# and the connection ID it assigned, which every later packet of the connection carries.
+DRTP_VERSION = 2
+header_v2_format = '!BxHIIIHH'  # version, padding, flags, connection ID, sequence number, acknowledgment number, options length, payload length
+
+# ---------------- HANDSHAKE OPTIONS ---------------- 
+# Options are type-length-value entries (1-byte type, 1-byte length) in the options area
+OPT_FEATURES = 1    # 4-byte bitmask, offered by the server in the SYN-ACK and chosen by the client in the ACK
+OPT_FILE_SIZE = 2   # 8-byte size of the file, sent by the client in the ACK
+OPT_SACK = 3        # Selective acknowledgement blocks in a data ACK, 8 bytes each (start, end exclusive)
+OPT_MAX_SEGMENT = 4     # 4-byte size of the largest datagram the server accepts, sent in the SYN-ACK
+OPT_SEGMENT_SIZE = 5    # 4-byte size of the data packets the client will send, chosen in the ACK
+OPT_FILE_NAME = 6       # UTF-8 base name of the file, sent by the client in the ACK
+OPT_STREAM = 7          # Session ID, stream index, stream count and byte offset of a striped stream, sent in the ACK
+OPT_COMPRESSION = 8     # Codec IDs the server can decompress, offered in the SYN-ACK; the one the client chose, in the ACK
+OPT_FILE_ID = 9         # 16-byte ID of the file, by which the server finds the state of an interrupted transfer, sent in the ACK
+OPT_CHECKSUM = 10       # Checksum IDs the server can check, offered in the SYN-ACK; the one the client chose, in the ACK
+OPT_CRC = 11            # 4-byte CRC of the header and payload of a data packet
+OPT_DIGEST = 12         # Digest of the file, sent by the client in the FIN and by the server in the FIN ACK
+OPT_FEC_RECOVERED = 13  # 4-byte count of the data packets the server rebuilt from parity so far, in data ACKs
+OPT_ACK_DELAY = 14      # 4-byte longest time the server delays an ACK, in microseconds, sent in the SYN-ACK
+OPT_WINDOW = 15         # 4-byte largest number of packets the client keeps in flight, its --window, sent in the ACK
+stream_option_format = '!IHHQ'
+index_summary_format = '!II'   # Chunks in the server's index and chunk hashes in a page of it
+
+# Flags that only exist in version 2
+PROBE_FLAG = 1 << 4  # Path MTU probe, padded to the probed size. The server answers with PROBE_FLAG | ACK_FLAG
+COMPRESSED_FLAG = 1 << 5  # The payload of a data packet is compressed with the codec chosen in the ACK
+RESUME_FLAG = 1 << 6      # The server's answer to the ACK when resuming is negotiated; its payload lists the chunks it already has
+NACK_FLAG = 1 << 7        # The data packet with the sequence number in the acknowledgment number field failed its CRC
+DELTA_FLAG = 1 << 8       # Delta sync: a request for a page of the server's index, or the page; alone from the server, wait
+FEC_FLAG = 1 << 9         # A parity packet of the block of data packets starting at its sequence number
+TREE_FLAG = 1 << 10       # The server's answer to the ACK of a directory transfer, which is not resumed
+
+# Feature bits that can be negotiated through OPT_FEATURES
+FEATURE_SACK = 1 << 0   # Selective Repeat: the server's ACKs carry SACK blocks
+FEATURE_STREAMS = 1 << 1  # Striping: the server reassembles a file sent over several connections
+FEATURE_RESUME = 1 << 2   # Resuming: the server keeps the chunks of an interrupted transfer and reports them
+FEATURE_DELTA = 1 << 3    # Delta sync: the server hands out the chunk hashes of its copy and rebuilds the file from a delta
+FEATURE_FEC = 1 << 4      # Forward error correction: the server rebuilds lost data packets from parity packets
+FEATURE_TREE = 1 << 5     # Directory transfers: the server writes a stream of files into a directory, following its manifest
+SUPPORTED_FEATURES = FEATURE_SACK | FEATURE_STREAMS | FEATURE_RESUME | FEATURE_DELTA | FEATURE_FEC | FEATURE_TREE
+
+
+def encode_options(options):
+    """
+    Encodes a dictionary of options into the type-length-value options area.
+    Args:
+        options (dict): Maps option types to their values as bytes.
+    Returns:
+        bytes: The encoded options area.
+    """
+    return b''.join(struct.pack('!BB', kind, len(value)) + value for kind, value in options.items())
+
+
+def decode_options(data):
+    """
+    Decodes a type-length-value options area. Truncated entries are ignored.
+    Args:
+        data (bytes): The options area.
+    Returns:
+        dict: Maps option types to their values as bytes.
+    """
+    options = {}
+    offset = 0
+    while offset + 2 <= len(data):
+        kind, length = struct.unpack_from('!BB', data, offset)
+        offset += 2
+        if offset + length > len(data):
+            break
+        options[kind] = bytes(data[offset:offset + length])
+        offset += length
+    return options
+
+
+def option_int(options, kind, default=0):
+    """
+    Reads an unsigned big-endian integer option.
+    Args:
+        options (dict): The decoded options.
+        kind (int): The option type.
+        default (int): The value to return if the option is missing.
+    Returns:
+        int: The option value.
+    """
+    value = options.get(kind)
+    return int.from_bytes(value, 'big') if value else default
+
+
+def encode_sack(received):
+    """
+    Builds the SACK blocks describing the packets buffered out of order.
+    Args:
+        received (iterable): The sequence numbers buffered by the receiver.
+    Returns:
+        dict: The SACK option, holding at most MAX_SACK_BLOCKS blocks starting with the lowest ones,
+        or an empty dictionary if nothing is buffered.
+    """
+    blocks = []
+    for seq in sorted(received):
+        if blocks and blocks[-1][1] == seq:
+            blocks[-1][1] = seq + 1
+        elif len(blocks) == MAX_SACK_BLOCKS:
+            break
+        else:
+            blocks.append([seq, seq + 1])
+    if not blocks:
+        return {}
+    return {OPT_SACK: b''.join(struct.pack('!II', start, end) for start, end in blocks)}
+
+
+def decode_sack(options):
+    """
+    Reads the SACK blocks of an ACK.
+    Args:
+        options (dict): The decoded options of the ACK.
+    Returns:
+        list: (start, end) tuples of selectively acknowledged sequence numbers, end exclusive.
+    """
+    value = options.get(OPT_SACK, b'')
+    return [struct.unpack_from('!II', value, offset) for offset in range(0, len(value) - 7, 8)]
+
+
+def encode_resume(ranges, max_length):
+    """
+    Builds the payload of the resume answer.
+    Args:
+        ranges (list): (start, end) ranges of the sequence numbers the server already has, end exclusive.
+        max_length (int): The largest payload the client receives. Ranges that do not fit are left
+            out, and the client sends those chunks again.
+    Returns:
+        bytes: 8 bytes per range.
+    """
+    ranges = ranges[:max_length // 8]
+    return b''.join(struct.pack('!II', start, end) for start, end in ranges)
+
+
+def decode_resume(payload):
+    """
+    Reads the payload of the resume answer.
+    Args:
+        payload (bytes): The payload.
+    Returns:
+        list: (start, end) ranges of the sequence numbers the server already has, end exclusive.
+    """
+    return [struct.unpack_from('!II', payload, offset) for offset in range(0, len(payload) - 7, 8)]
+
+
+def encode_stream(session_id, index, count, offset):
+    """
+    Builds the option that ties a connection to the other streams of a striped transfer.
+    Args:
+        session_id (int): The ID shared by all streams of the transfer.
+        index (int): The number of this stream, from 0.
+        count (int): The number of streams.
+        offset (int): The byte offset in the file where the range of this stream starts.
+    Returns:
+        dict: The stream option.
+    """
+    return {OPT_STREAM: struct.pack(stream_option_format, session_id, index, count, offset)}
+
+
+def decode_stream(options):
+    """
+    Reads the stream option of an ACK.
+    Args:
+        options (dict): The decoded options of the ACK.
+    Returns:
+        tuple: The session ID, stream index, stream count and byte offset, or None if the
+        connection is not part of a striped transfer.
+    """
+    value = options.get(OPT_STREAM)
+    if value is None or len(value) != struct.calcsize(stream_option_format):
+        return None
+    return struct.unpack(stream_option_format, value)
+
+
+# ---------------- HEADER CODECS ---------------- 
+# Both versions expose the same methods so the client and server do not depend on the negotiated version
+
+class HeaderV1:
+    """
+    The original DRTP header: 16-bit sequence number, acknowledgment number and flags.
+    ACKs carry the acknowledged sequence number in the sequence number field and no flags,
+    so the FIN is acknowledged with a bare ACK_FLAG. There is no connection ID.
+    """
+    version = 1
+    connection_id = 0
+    layout = struct.Struct(header_format)
+    size = layout.size
+    max_sequence = 0xFFFF
+    fin_ack_flags = ACK_FLAG
+
+    def data_header(self, sequence_number, flags, payload_length, options_length=0):
+        return self.layout.pack(sequence_number, 0, flags)
+
+    def control_packet(self, flags, options=None, acknowledgment_number=0):
+        return self.layout.pack(0, acknowledgment_number, flags)
+
+    def ack_packet(self, acknowledgment_number, options=None):
+        return self.layout.pack(acknowledgment_number, 0, 0)
+
+    def parse(self, data):
+        """
+        Parses a packet.
+        Args:
+            data (bytes): The received datagram.
+        Returns:
+            tuple: The sequence number, acknowledgment number, flags, options and payload,
+            or None if the datagram is too short.
+        """
+        if len(data) < self.size:
+            return None
+        sequence_number, acknowledgment_number, flags = self.layout.unpack_from(data)
+        return sequence_number, acknowledgment_number, flags, {}, data[self.size:]
+
+    def parse_data(self, data):
+        """
+        Parses a data packet without decoding its options.
+        Args:
+            data (bytes-like): The received datagram.
+        Returns:
+            tuple: The sequence number, acknowledgment number, flags and payload, a slice of data,
+            or None if the datagram is too short.
+        """
+        if len(data) < self.size:
+            return None
+        sequence_number, acknowledgment_number, flags = self.layout.unpack_from(data)
+        return sequence_number, acknowledgment_number, flags, data[self.size:]
+
+    def parse_ack(self, data):
+        """
+        Parses an acknowledgement.
+        Args:
+            data (bytes): The received datagram.
+        Returns:
+            tuple: The acknowledged sequence number and the options, or None if the datagram is too short.
+        """
+        if len(data) < self.size:
+            return None
+        return self.layout.unpack_from(data)[0], {}
+
+    def parse_nack(self, data):
+        # Version 1 packets carry no CRC
+        return None
+
+
+class HeaderV2:
+    """
+    The version 2 DRTP header: 16-bit flags, a 32-bit connection ID assigned by the server,
+    32-bit sequence and acknowledgment numbers, the length of the options area and the length
+    of the payload that follows it.
+    ACKs carry the cumulative acknowledgment number in the acknowledgment number field with ACK_FLAG set,
+    and the FIN is acknowledged with FIN_FLAG | ACK_FLAG so it cannot be mistaken for a late data ACK.
+    Args:
+        connection_id (int): The connection ID written into the packets built by this codec.
+    """
+    version = 2
+    layout = struct.Struct(header_v2_format)
+    size = layout.size
+    max_sequence = 0xFFFFFFFF
+    fin_ack_flags = FIN_FLAG | ACK_FLAG
+
+    def __init__(self, connection_id=0):
+        self.connection_id = connection_id
+
+    @classmethod
+    def connection_id_of(cls, data):
+        """
+        Reads the connection ID of a version 2 packet without parsing the rest of it.
+        Args:
+            data (bytes): The received datagram, at least `size` bytes long.
+        Returns:
+            int: The connection ID.
+        """
+        return cls.layout.unpack_from(data)[2]
+
+    def data_header(self, sequence_number, flags, payload_length, options_length=0):
+        return self.layout.pack(self.version, flags, self.connection_id, sequence_number, 0, options_length, payload_length)
+
+    def control_packet(self, flags, options=None, acknowledgment_number=0):
+        options = encode_options(options) if options else b''
+        return self.layout.pack(self.version, flags, self.connection_id, 0, acknowledgment_number, len(options), 0) + options
+
+    def ack_packet(self, acknowledgment_number, options=None):
+        options = encode_options(options) if options else b''
+        return self.layout.pack(self.version, ACK_FLAG, self.connection_id, 0, acknowledgment_number, len(options), 0) + options
+
+    def parse(self, data):
+        """
+        Parses a packet.
+        Args:
+            data (bytes): The received datagram.
+        Returns:
+            tuple: The sequence number, acknowledgment number, flags, options and payload,
+            or None if the datagram is not a valid version 2 packet.
+        """
+        if len(data) < self.size:
+            return None
+        version, flags, _, sequence_number, acknowledgment_number, options_length, payload_length = self.layout.unpack_from(data)
+        payload_start = self.size + options_length
+        if version != self.version or payload_start + payload_length != len(data):
+            return None
+        options = decode_options(data[self.size:payload_start]) if options_length else {}
+        return sequence_number, acknowledgment_number, flags, options, data[payload_start:]
+
+    def parse_data(self, data):
+        """
+        Parses a data packet without decoding its options, which the receive path does not need:
+        the CRC is checked in place. Nothing is copied if data is a memoryview.
+        Args:
+            data (bytes-like): The received datagram.
+        Returns:
+            tuple: The sequence number, acknowledgment number, flags and payload, a slice of data,
+            or None if the datagram is not a valid version 2 packet.
+        """
+        if len(data) < self.size:
+            return None
+        version, flags, _, sequence_number, acknowledgment_number, options_length, payload_length = self.layout.unpack_from(data)
+        payload_start = self.size + options_length
+        if version != self.version or payload_start + payload_length != len(data):
+            return None
+        return sequence_number, acknowledgment_number, flags, data[payload_start:]
+
+    def parse_ack(self, data):
+        """
+        Parses an acknowledgement.
+        Args:
+            data (bytes): The received datagram.
+        Returns:
+            tuple: The acknowledged sequence number and the options, or None if the datagram is not a valid ACK.
+        """
+        packet = self.parse(data)
+        if packet is None or not packet[2] & ACK_FLAG:
+            return None
+        return packet[1], packet[3]
+
+    def parse_nack(self, data):
+        """
+        Parses a negative acknowledgement.
+        Args:
+            data (bytes): The received datagram.
+        Returns:
+            int: The sequence number of the corrupt packet, or None if the datagram is not a NACK.
+        """
+        if len(data) < self.size:
+            return None
+        _, flags, _, _, acknowledgment_number, _, _ = self.layout.unpack_from(data)
+        return acknowledgment_number if flags == NACK_FLAG else None
+
+
+HEADER_V1 = HeaderV1()
+HEADER_V2 = HeaderV2()
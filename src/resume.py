@@ -0,0 +1,174 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities and the hash used for file IDs
+from utils import *
+import hashlib
+import threading
+
+# ---------------- RESUMABLE TRANSFERS ---------------- 
+# The server records which chunks it has written in a bitmap, and saves it next to the partial
+# output file every RESUME_SAVE_INTERVAL seconds and when a connection is dropped. The client
+# identifies the file by a hash of its name, size and modification time. When a client reconnects
+# with the same file ID, the server loads the bitmap and tells the client which chunks it already
+# has, so only the missing ones are sent. The bitmap is saved only after the chunks it marks have
+# reached the file, so a server that is killed loses at most the chunks of the last interval.
+
+# The state file starts with a magic string, the file ID, the file size, the chunk size and the
+# number of chunks, followed by the bitmap
+resume_header = struct.Struct('!8s16sQII')
+RESUME_MAGIC = b'DRTPRSM1'
+
+
+def file_identity(path):
+    """
+    Computes the ID a server recognizes a file by when the client reconnects.
+    Args:
+        path (str): The file to send.
+    Returns:
+        bytes: A 16-byte hash of the file's name, size and modification time.
+    """
+    status = os.stat(path)
+    identity = f'{os.path.basename(path)}\0{status.st_size}\0{status.st_mtime_ns}'
+    return hashlib.blake2b(identity.encode(), digest_size=16).digest()
+
+
+class ReceiveBitmap:
+    """
+    One bit per chunk of a file, set once the chunk has been written.
+    Args:
+        count (int): The number of chunks.
+        bits (bytes): The saved bitmap, None for an empty one.
+    """
+
+    def __init__(self, count, bits=None):
+        self.count = count
+        self.bits = bytearray(bits) if bits is not None else bytearray((count + 7) // 8)
+
+    def __contains__(self, index):
+        return 0 <= index < self.count and bool(self.bits[index >> 3] & (0x80 >> (index & 7)))
+
+    def add(self, index):
+        self.bits[index >> 3] |= 0x80 >> (index & 7)
+
+    def ranges(self):
+        """
+        Returns:
+            list: (start, end) tuples of the set chunk indices, end exclusive.
+        """
+        ranges = []
+        start = None
+        for byte_index, byte in enumerate(self.bits):
+            # Whole bytes of set or clear bits are the common case and need no bit-by-bit scan
+            if byte == 0xFF and start is not None or byte == 0 and start is None:
+                continue
+            for bit in range(8):
+                index = byte_index * 8 + bit
+                if index >= self.count:
+                    break
+                if byte & (0x80 >> bit):
+                    if start is None:
+                        start = index
+                elif start is not None:
+                    ranges.append((start, index))
+                    start = None
+        if start is not None:
+            ranges.append((start, self.count))
+        return ranges
+
+    def rechunk(self, chunk_size, new_chunk_size, file_size):
+        """
+        Converts the bitmap to another chunk size, for a client that reconnects with a different
+        segment size. A new chunk counts as received only if all its bytes were received.
+        Args:
+            chunk_size (int): The chunk size of this bitmap.
+            new_chunk_size (int): The chunk size of the new bitmap.
+            file_size (int): The size of the file.
+        Returns:
+            ReceiveBitmap: The bitmap for the new chunk size.
+        """
+        if new_chunk_size == chunk_size:
+            return ReceiveBitmap(self.count, self.bits)
+        bitmap = ReceiveBitmap((file_size + new_chunk_size - 1) // new_chunk_size)
+        for start, end in self.ranges():
+            first_byte, last_byte = start * chunk_size, min(end * chunk_size, file_size)
+            for index in range((first_byte + new_chunk_size - 1) // new_chunk_size, bitmap.count):
+                if min((index + 1) * new_chunk_size, file_size) > last_byte:
+                    break
+                bitmap.add(index)
+        return bitmap
+
+
+class ResumeState:
+    """
+    The saved bitmap of a partial output file. The bitmap is saved from a worker thread while the
+    event loop may save it too, when the connection is dropped, or delete it, when the file is
+    complete, so saving, closing and deleting are serialized and nothing is saved once closed.
+    Args:
+        path (str): The state file, next to the output file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def load(self, file_id, file_size):
+        """
+        Loads the bitmap, if it was saved for the same file.
+        Args:
+            file_id (bytes): The ID of the file the client is sending.
+            file_size (int): The size of the file.
+        Returns:
+            tuple: The chunk size and the ReceiveBitmap, or None if there is no state for this file.
+        """
+        try:
+            with open(self.path, 'rb') as state:
+                data = state.read()
+            magic, saved_id, saved_size, chunk_size, count = resume_header.unpack_from(data)
+        except (OSError, struct.error):
+            return None
+        bits = data[resume_header.size:]
+        if (magic != RESUME_MAGIC or saved_id != file_id or saved_size != file_size or chunk_size == 0
+                or count != (file_size + chunk_size - 1) // chunk_size or len(bits) != (count + 7) // 8):
+            return None
+        return chunk_size, ReceiveBitmap(count, bits)
+
+    def save(self, file_id, file_size, chunk_size, count, bits, sync=False):
+        """
+        Replaces the state file atomically, so a crash while saving leaves the previous bitmap.
+        Args:
+            file_id (bytes): The ID of the file.
+            file_size (int): The size of the file.
+            chunk_size (int): The chunk size of the bitmap.
+            count (int): The number of chunks.
+            bits (bytes): The bitmap.
+            sync (bool): Whether to sync the state file to disk.
+        """
+        temporary = self.path + '.tmp'
+        with self.lock:
+            if self.closed:
+                return
+            with open(temporary, 'wb') as state:
+                state.write(resume_header.pack(RESUME_MAGIC, file_id, file_size, chunk_size, count))
+                state.write(bits)
+                if sync:
+                    state.flush()
+                    os.fsync(state.fileno())
+            os.replace(temporary, self.path)
+
+    def close(self):
+        """
+        Stops saving, keeping the state file for the next connection.
+        """
+        with self.lock:
+            self.closed = True
+
+    def delete(self):
+        """
+        Stops saving and removes the state file once the file is complete.
+        """
+        with self.lock:
+            self.closed = True
+            try:
+                os.unlink(self.path)
+            except FileNotFoundError:
+                pass
@@ -0,0 +1,143 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities and the heap queue used for the retransmission timers
+from utils import *
+import heapq
+
+# ---------------- RTT ESTIMATION ---------------- 
+# Computes the retransmission timeout from round-trip time samples as described in RFC 6298
+
+class RTTEstimator:
+    """
+    Keeps the smoothed round-trip time (SRTT) and its variation (RTTVAR), and derives the
+    retransmission timeout from them. Callers must follow Karn's rule and only sample packets
+    that were sent once. Every timeout doubles the RTO until the next valid sample. The receiver
+    may hold an ACK back for up to its ACK delay, so the delay is added to the RTO, as QUIC adds
+    max_ack_delay to its probe timeout.
+    Args:
+        initial_rto (float): The RTO in seconds before the first sample.
+        min_rto (float): The lower bound of the RTO in seconds.
+        max_rto (float): The upper bound of the RTO in seconds.
+        ack_delay (float): The longest time the receiver delays an ACK, in seconds.
+    """
+
+    def __init__(self, initial_rto=INITIAL_RTO, min_rto=MIN_RTO, max_rto=MAX_RTO, ack_delay=0.0):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.ack_delay = ack_delay
+        self.rto = min(max(initial_rto, min_rto), max_rto)
+        self.srtt = None
+        self.rttvar = None
+        self.samples = 0
+        self.min_rtt = float('inf')
+        self.max_rtt = 0.0
+        self.total_rtt = 0.0
+        self.backoffs = 0
+
+    def sample(self, rtt):
+        """
+        Updates the estimate with a new round-trip time measurement.
+        Args:
+            rtt (float): The measured round-trip time in seconds.
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - RTT_BETA) * self.rttvar + RTT_BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - RTT_ALPHA) * self.srtt + RTT_ALPHA * rtt
+        self.rto = min(max(self.srtt + max(CLOCK_GRANULARITY, 4 * self.rttvar) + self.ack_delay, self.min_rto), self.max_rto)
+        self.samples += 1
+        self.min_rtt = min(self.min_rtt, rtt)
+        self.max_rtt = max(self.max_rtt, rtt)
+        self.total_rtt += rtt
+
+    def backoff(self):
+        """
+        Doubles the RTO after a retransmission timeout.
+        """
+        self.rto = min(self.rto * 2, self.max_rto)
+        self.backoffs += 1
+
+    def stats(self):
+        """
+        Returns:
+            dict: The RTT statistics, with times in milliseconds.
+        """
+        return {
+            'samples': self.samples,
+            'min_rtt_ms': round(self.min_rtt * 1000, 3) if self.samples else None,
+            'avg_rtt_ms': round(self.total_rtt / self.samples * 1000, 3) if self.samples else None,
+            'max_rtt_ms': round(self.max_rtt * 1000, 3) if self.samples else None,
+            'srtt_ms': round(self.srtt * 1000, 3) if self.srtt is not None else None,
+            'rttvar_ms': round(self.rttvar * 1000, 3) if self.rttvar is not None else None,
+            'rto_ms': round(self.rto * 1000, 3),
+            'backoffs': self.backoffs,
+        }
+
+
+# ---------------- TIMERS ---------------- 
+# A heap of deadlines, so the sender can find the next timer to expire without scanning the window
+
+class TimerHeap:
+    """
+    Keeps one deadline per key in a binary heap. Rescheduling or cancelling a timer leaves the old
+    heap entry behind and it is discarded when it reaches the top, so every operation is O(log n).
+    """
+
+    def __init__(self):
+        self.heap = []
+        self.deadlines = {}
+
+    def __len__(self):
+        return len(self.deadlines)
+
+    def schedule(self, key, deadline):
+        """
+        Starts or restarts the timer of a key.
+        Args:
+            key (int): The key of the timer.
+            deadline (float): When the timer expires, in time.monotonic() seconds.
+        """
+        self.deadlines[key] = deadline
+        heapq.heappush(self.heap, (deadline, key))
+        # Rebuild the heap if it is mostly made of stale entries
+        if len(self.heap) > 2 * len(self.deadlines) + 64:
+            self.heap = [(deadline, key) for key, deadline in self.deadlines.items()]
+            heapq.heapify(self.heap)
+
+    def cancel(self, key):
+        """
+        Stops the timer of a key, if it is running.
+        Args:
+            key (int): The key of the timer.
+        """
+        self.deadlines.pop(key, None)
+
+    def next_deadline(self):
+        """
+        Returns:
+            float: The earliest deadline, or None if no timer is running.
+        """
+        while self.heap:
+            deadline, key = self.heap[0]
+            if self.deadlines.get(key) == deadline:
+                return deadline
+            heapq.heappop(self.heap)
+        return None
+
+    def pop_expired(self, now):
+        """
+        Removes the timers that expired.
+        Args:
+            now (float): The current time.monotonic() value.
+        Returns:
+            list: The keys of the expired timers, earliest first.
+        """
+        expired = []
+        while True:
+            deadline = self.next_deadline()
+            if deadline is None or deadline > now:
+                return expired
+            _, key = heapq.heappop(self.heap)
+            del self.deadlines[key]
+            expired.append(key)
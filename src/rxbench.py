@@ -0,0 +1,153 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities, the header codec and the reader of the server
+from utils import *
+from protocol import HeaderV2, OPT_CRC, encode_options
+from fastpath import DatagramReader
+import sys
+import tempfile
+import tracemalloc
+
+# ---------------- RECEIVE PATH MICROBENCHMARK ---------------- 
+# Compares the two ways the server can take a data packet from the socket to the output file, over
+# loopback, without the rest of the protocol. The copying path is the one of asyncio's transports:
+# recvfrom returns a new bytes object, the header is parsed with its options decoded and the
+# payload is sliced into another bytes object before it is written. The in-place path is the one
+# the server uses: recvfrom_into the preallocated buffer of a DatagramReader, the header unpacked
+# from a memoryview of it and the payload written from that view. Packets are sent in batches that
+# fit in the socket buffer, and only the receiving is timed. A second, shorter pass runs under
+# tracemalloc and reports the peak of the memory every packet allocates: the datagram and the
+# payload when they are copied, only a few small objects such as memoryviews when they are not.
+
+RECEIVE_BUFFER = 8 * 1024 * 1024   # SO_RCVBUF asked for, so a batch is never dropped
+RECEIVE_TIMEOUT = 1.0              # seconds to wait for a datagram before the batch is given up
+
+
+def receive_copying(sock, proto, fd, count, buffer_size, chunk_size):
+    """
+    Receives packets the way asyncio hands them to a protocol, and writes their payloads.
+    Args:
+        sock (socket): The receiving socket.
+        proto (HeaderV2): The header codec.
+        fd (int): The output file.
+        count (int): The number of packets to receive.
+        buffer_size (int): The largest datagram to receive.
+        chunk_size (int): The payload size, which gives the offset of every payload.
+    """
+    for _ in range(count):
+        data, _ = sock.recvfrom(buffer_size)
+        sequence_number, _, _, _, chunk = proto.parse(data)
+        os.pwrite(fd, chunk, (sequence_number - 1) * chunk_size)
+
+
+def receive_in_place(reader, proto, fd, count, chunk_size):
+    """
+    Receives packets the way the server does, and writes their payloads from the receive buffer.
+    Args:
+        reader (DatagramReader): The reader of the receiving socket.
+        proto (HeaderV2): The header codec.
+        fd (int): The output file.
+        count (int): The number of packets to receive.
+        chunk_size (int): The payload size, which gives the offset of every payload.
+    """
+    for _ in range(count):
+        data, _ = reader.recv()
+        sequence_number, _, _, chunk = proto.parse_data(data)
+        os.pwrite(fd, chunk, (sequence_number - 1) * chunk_size)
+
+
+def run(receive, sender, addr, packets, batch, traced):
+    """
+    Sends the packets in batches and receives every batch.
+    Args:
+        receive (callable): Receives the given number of packets.
+        sender (socket): The sending socket.
+        addr (tuple): The address of the receiving socket.
+        packets (list): The datagrams to send.
+        batch (int): The number of packets sent before they are received.
+        traced (bool): If True, every packet is received on its own under tracemalloc.
+    Returns:
+        float: Nanoseconds per packet if not traced, otherwise the mean of the peak memory
+        allocated while every packet is received, in bytes.
+    """
+    elapsed = 0
+    allocated = 0
+    for start in range(0, len(packets), batch):
+        sent = packets[start:start + batch]
+        for packet in sent:
+            sender.sendto(packet, addr)
+        if traced:
+            for _ in sent:
+                before = tracemalloc.get_traced_memory()[0]
+                tracemalloc.reset_peak()
+                receive(1)
+                allocated += tracemalloc.get_traced_memory()[1] - before
+        else:
+            began = time.perf_counter_ns()
+            receive(len(sent))
+            elapsed += time.perf_counter_ns() - began
+    return (allocated if traced else elapsed) / len(packets)
+
+
+def main():
+    """
+    Runs the benchmark with the arguments given on the command line.
+    """
+    parser = argparse.ArgumentParser(description='Compare the copying and the in-place receive path of the server over loopback')
+    parser.add_argument('--packets', type=int, default=200000, help='Packets received by each path, default is 200000')
+    parser.add_argument('--segment-size', type=int, default=1472, help='Size of every datagram, default is 1472')
+    parser.add_argument('--batch', type=int, default=256, help='Packets sent before they are received, default is 256')
+    parser.add_argument('--traced-packets', type=int, default=5000, help='Packets received under tracemalloc by each path, default is 5000')
+    args = parser.parse_args()
+
+    # Data packets as the client sends them, with a CRC option, which the copying path decodes
+    proto = HeaderV2(1)
+    options = encode_options({OPT_CRC: bytes(4)})
+    if not proto.size + len(options) < args.segment_size <= MAX_SEGMENT_SIZE:
+        print(f"Error: Segment size must be in the range {proto.size + len(options) + 1}-{MAX_SEGMENT_SIZE}")
+        sys.exit(1)
+    if args.packets < 1 or args.batch < 1 or args.traced_packets < 1:
+        print("Error: The packet counts and the batch size must be positive")
+        sys.exit(1)
+    chunk_size = args.segment_size - proto.size - len(options)
+    payload = os.urandom(chunk_size)
+    packets = [proto.data_header(seq, 0, chunk_size, len(options)) + options + payload
+               for seq in range(1, args.packets + 1)]
+
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+    receiver.bind(('127.0.0.1', 0))
+    receiver.settimeout(RECEIVE_TIMEOUT)
+    addr = receiver.getsockname()
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    reader = DatagramReader(receiver, args.segment_size)
+    paths = {
+        'copying': lambda fd, count: receive_copying(receiver, proto, fd, count, args.segment_size, chunk_size),
+        'in place': lambda fd, count: receive_in_place(reader, proto, fd, count, chunk_size),
+    }
+
+    results = {}
+    with tempfile.TemporaryFile() as output:
+        fd = output.fileno()
+        try:
+            for name, receive in paths.items():
+                nanoseconds = run(lambda count: receive(fd, count), sender, addr, packets, args.batch, False)
+                tracemalloc.start()
+                allocated = run(lambda count: receive(fd, count), sender, addr, packets[:args.traced_packets], 1, True)
+                tracemalloc.stop()
+                results[name] = (nanoseconds, allocated)
+        except socket.timeout:
+            print("Error: Datagrams were dropped on loopback; try a smaller --batch")
+            sys.exit(1)
+    sender.close()
+    receiver.close()
+
+    print(f"{args.packets} packets of {args.segment_size} bytes, {chunk_size}-byte payloads")
+    print(f"{'path':<10} {'ns/packet':>10} {'Mbps':>8} {'bytes allocated/packet':>24}")
+    for name, (nanoseconds, allocated) in results.items():
+        print(f"{name:<10} {nanoseconds:>10.0f} {chunk_size * 8e3 / nanoseconds:>8.0f} {allocated:>24.0f}")
+    copying, in_place = results['copying'][0], results['in place'][0]
+    print(f"The in-place path takes {in_place / copying:.0%} of the time of the copying path")
+
+# ---------------- SCRIPT ENTRY POINT ---------------- 
+if __name__ == "__main__":
+    main()
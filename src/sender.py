@@ -0,0 +1,591 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities
+from utils import *
+from protocol import *
+from rto import RTTEstimator, TimerHeap
+from congestion import Reno, Pacer
+from fastpath import enable_gso, send_segments, UDP_MAX_SEGMENTS, MAX_UDP_PAYLOAD
+from tracing import *
+from metrics import ClientMetrics
+from integrity import CRC_OPTION_SIZE
+
+# ---------------- SLIDING WINDOW SENDER ---------------- 
+# Sends the chunks of a file within a sliding window and retransmits lost packets,
+# either Go-Back-N or Selective Repeat
+
+# Go-Back-N runs a single timer for the oldest packet, kept under this key (sequence numbers start at 1),
+# and Selective Repeat a timer for the packet that is lost once the reordering window has passed
+GBN_TIMER = 0
+RACK_TIMER = -1
+
+
+class WindowSender:
+    """
+    Sends every chunk of a file to the server over an established connection.
+
+    In Go-Back-N mode a single timer guards the oldest unacknowledged packet, and when it
+    expires every unacknowledged packet is sent again. In Selective Repeat mode every packet
+    has its own timer, the server reports the packets it buffered out of order in SACK blocks,
+    and only the holes are retransmitted: when their timer expires, or once a packet sent after
+    them has been acknowledged. Until the path is seen to reorder packets, a hole is lost as soon
+    as SACK_HOLE_THRESHOLD later packets have been selectively acknowledged. Once it is, a hole is
+    lost when the round-trip time of the newest delivered packet plus a reordering window has passed
+    since the hole was sent, as in RACK (RFC 8985). The window starts at a quarter of the minimum
+    RTT and grows with every recovery that holds a spurious retransmission, one whose ACK came back
+    sooner than an ACK of the retransmission could, and it is never shorter than the longest
+    reordering seen. When every fast retransmission of a recovery was spurious, the window
+    reduction is undone.
+
+    The retransmission timeout adapts to the path: ACKs of packets that were sent once are
+    used as RTT samples (Karn's rule), and every timeout backs the RTO off exponentially.
+
+    The number of packets in flight is limited by the congestion controller, and window_size
+    only bounds how far past the oldest unacknowledged packet the sender may go. Unless pacing
+    is disabled, packets are spread over the RTT at the rate the controller asks for.
+
+    With gso, the packets released together are handed to the kernel in one sendmsg call
+    using UDP GSO, falling back to one call per packet if the kernel refuses.
+
+    With a compressor, every chunk is taken from it the first time it is sent, compressed or
+    not, and retransmissions send the same payload again.
+
+    When a transfer is resumed, the chunks the server already has are never sent, and the
+    server's cumulative acknowledgements skip over them.
+
+    With a checksum, every data packet carries a CRC, and a packet the server NACKs because
+    its CRC did not match is sent again at once. Corruption is not congestion, so the window
+    is left alone. With a digest, every chunk is hashed in order as it is first sent.
+
+    With an FEC encoder, every block of packets sent for the first time is followed by its
+    parity packet, which is neither acknowledged nor retransmitted. The encoder is told about
+    every loss, so it can size the blocks after the loss rate.
+    Args:
+        sock (socket): The connected client socket.
+        addr (tuple): The address of the server.
+        proto (HeaderV1 or HeaderV2): The header codec of the connection.
+        file_chunks (FileChunks): The chunks of the file to send.
+        window_size (int): The number of packets that may be unacknowledged at once.
+        selective (bool): True for Selective Repeat, False for Go-Back-N.
+        rtt (RTTEstimator): The RTT estimator, a new one with the default bounds if None.
+        cc (CongestionController): The congestion controller, Reno if None.
+        pacing (bool): Whether to pace packets out.
+        gso (bool): Whether to batch packets with UDP GSO.
+        progress (callable): Called with the number of acknowledged packets and the total whenever the window slides.
+        tracer (Tracer): Where sends, ACKs and retransmissions are recorded, a disabled one if None.
+        metrics (ClientMetrics): The live metrics of the transfer, new ones if None.
+        compressor (ChunkCompressor): Compresses the chunks, None to send them as they are.
+        received (list): Sorted (start, end) ranges of the sequence numbers the server already has, end exclusive.
+        checksum (Checksum): The CRC of the data packets, None to send them without one.
+        digest (FileDigest): Hashes the chunks, None to not hash them.
+        fec (FecEncoder): Builds the parity packets, None to send none.
+    """
+
+    def __init__(self, sock, addr, proto, file_chunks, window_size, selective=False, rtt=None, cc=None, pacing=True, gso=False,
+                 progress=None, tracer=None, metrics=None, compressor=None, received=None, checksum=None, digest=None,
+                 fec=None):
+        self.sock = sock
+        self.addr = addr
+        self.proto = proto
+        self.file_chunks = file_chunks
+        self.window_size = window_size
+        self.selective = selective
+        self.rtt = rtt or RTTEstimator()
+        self.cc = cc or Reno(window_size)
+        # Every packet but the last is header + full chunk, which is what GSO needs
+        self.checksum = checksum
+        self.digest = digest
+        self.fec = fec
+        self.options_length = CRC_OPTION_SIZE if checksum is not None else 0
+        self.segment_size = proto.size + self.options_length + file_chunks.chunk_size
+        self.max_batch = min(UDP_MAX_SEGMENTS, MAX_UDP_PAYLOAD // self.segment_size)
+        self.gso = gso and self.max_batch > 1 and enable_gso(sock)
+        if gso and not self.gso:
+            print(f"UDP GSO is not available for {self.segment_size}-byte segments, sending one packet per system call")
+        self.pacer = (Pacer(GSO_PACING_BURST) if self.gso else Pacer()) if pacing else None
+        self.pace_until = None
+        self.recovery_point = 0       # Losses are only reported to the controller once per window
+        self.timers = TimerHeap()
+        self.total = len(file_chunks)
+        self.base = 1
+        self.nextseqnum = 1
+        self.packets = {}             # Unacknowledged packets, by sequence number
+        self.sent_at = {}             # When each unacknowledged packet was first sent
+        self.retransmitted = set()    # Packets that were sent more than once, and cannot be RTT samples
+        self.highest_sacked = 0
+        self.fast_retransmitted = set()
+        # Time-based loss detection, and undoing the reductions caused by reordering
+        self.rack_sent_at = 0.0       # When the most recently sent packet that was delivered was sent
+        self.rack_rtt = 0.0           # The round-trip time of that packet
+        self.reordering_seen = False
+        self.reorder_multiplier = 1   # The reordering window, in quarters of the minimum RTT
+        self.reorder_extent = 0.0     # The longest a packet was seen to arrive after one sent after it
+        self.recoveries = 0           # Recoveries since the reordering window last grew
+        self.undo_state = None        # The controller before the current recovery, while it may be undone
+        self.recovery_retransmits = set()   # Fast retransmissions of that recovery not acknowledged yet
+        self.recovery_genuine = False       # Whether one of them repaired a real loss
+        self.recovery_spurious = False      # Whether one of them was spurious
+        self.metrics = metrics or ClientMetrics()
+        self.metrics.gauges = self.gauges
+        self.progress = progress
+        self.tracer = tracer or Tracer()
+        self.compressor = compressor
+        self.backoff_until = 0.0  # Timers expiring before this belong to the loss burst that already backed off the RTO
+        self.received = received or []
+        self.received_index = 0   # The first range of self.received that nextseqnum has not passed
+        self.skip_received()
+        self.base = self.nextseqnum
+
+    def run(self):
+        """
+        Sends packets until every chunk has been acknowledged.
+        """
+        while self.base <= self.total:
+            self.fill_window()
+            self.wait_for_ack()
+
+    def fill_window(self):
+        """
+        Sends all the chunks that fit in the congestion window and the sliding window,
+        as fast as the pacer allows.
+        """
+        self.pace_until = None
+        batch = []
+        while (len(self.packets) < self.cc.window() and self.nextseqnum < self.base + self.window_size
+               and self.nextseqnum <= self.total):
+            if self.pacer is not None:
+                now = time.monotonic()
+                delay = self.pacer.delay(now)
+                if delay > 0:
+                    self.pace_until = now + delay
+                    break
+                self.pacer.consume()
+
+            # Create packet and send it. The header and the mapped chunk are sent with
+            # scatter/gather I/O, so the payload is never copied into a new buffer
+            seq = self.nextseqnum
+            flags = FIN_FLAG if seq == self.total else ACK_FLAG
+            if self.compressor is None:
+                chunk = self.file_chunks[seq - 1]
+                if self.digest is not None:
+                    self.digest.update(chunk)
+            else:
+                if self.digest is not None:
+                    self.digest.update(self.file_chunks[seq - 1])
+                chunk, compressed = self.compressor.get(seq - 1)
+                if compressed:
+                    flags |= COMPRESSED_FLAG
+            header = self.proto.data_header(seq, flags, len(chunk), self.options_length)
+            if self.checksum is not None:
+                header = self.checksum.seal(header, chunk)
+            self.packets[seq] = [header, chunk]
+            self.sent_at[seq] = time.monotonic()
+            if not self.selective and GBN_TIMER not in self.timers.deadlines:
+                self.timers.schedule(GBN_TIMER, self.sent_at[seq] + self.rtt.rto)
+            if self.gso:
+                # Only the last packet of a GSO batch may be shorter, as compressed ones are
+                batch.append(seq)
+                if len(batch) == self.max_batch or len(header) + len(chunk) < self.segment_size:
+                    self.send_batch(batch)
+                    batch = []
+            else:
+                self.send_packet(seq)
+            self.tracer.packet(EV_SEND, self.proto.connection_id, seq, self.base - 1, len(self.packets), self.cc.window())
+            if self.fec is not None:
+                parities = self.fec.add(seq, flags, chunk, last=seq == self.total)
+                if parities and batch:
+                    # Parity packets may be shorter than a segment, so they leave after the batch
+                    self.send_batch(batch)
+                    batch = []
+                for first, parity in parities:
+                    self.send_parity(first, parity)
+            self.nextseqnum += 1
+            self.skip_received()
+        if batch:
+            self.send_batch(batch)
+
+    def send_parity(self, first, payload):
+        """
+        Sends the parity packet of a block.
+        Args:
+            first (int): The sequence number of the first packet of the block.
+            payload (bytes): The parity payload.
+        """
+        header = self.proto.data_header(first, FEC_FLAG, len(payload), self.options_length)
+        if self.checksum is not None:
+            header = self.checksum.seal(header, payload)
+        self.sock.sendmsg([header, payload], [], 0, self.addr)
+        self.metrics.parity_packets_sent += 1
+
+    def skip_received(self):
+        """
+        Moves nextseqnum past the chunks the server already has.
+        """
+        while self.received_index < len(self.received):
+            start, end = self.received[self.received_index]
+            if self.nextseqnum < start:
+                return
+            if self.nextseqnum < end:
+                end = min(end, self.total + 1)
+                self.metrics.resumed_chunks += end - self.nextseqnum
+                if self.digest is not None:
+                    for seq in range(self.nextseqnum, end):
+                        self.digest.update(self.file_chunks[seq - 1])
+                self.nextseqnum = end
+            self.received_index += 1
+
+    def send_batch(self, seqs):
+        """
+        Sends consecutive new packets with a single UDP GSO system call.
+        Args:
+            seqs (list): The sequence numbers of the packets, in order.
+        """
+        if len(seqs) > 1:
+            try:
+                send_segments(self.sock, self.addr, [self.packets[seq] for seq in seqs], self.segment_size)
+            except OSError as e:
+                print(f"UDP GSO send failed ({e}), sending one packet per system call")
+                self.gso = False
+            else:
+                self.metrics.packets_sent += len(seqs)
+                self.metrics.bytes_sent += sum(len(self.packets[seq][1]) for seq in seqs)
+                if self.selective:
+                    deadline = time.monotonic() + self.rtt.rto
+                    for seq in seqs:
+                        self.timers.schedule(seq, deadline)
+                return
+        for seq in seqs:
+            self.send_packet(seq)
+
+    def send_packet(self, seq):
+        """
+        Sends a packet and, in Selective Repeat mode, (re)starts its timer.
+        Args:
+            seq (int): The sequence number of the packet.
+        """
+        self.sock.sendmsg(self.packets[seq], [], 0, self.addr)
+        self.metrics.packets_sent += 1
+        self.metrics.bytes_sent += len(self.packets[seq][1])
+        if self.selective:
+            self.timers.schedule(seq, time.monotonic() + self.rtt.rto)
+
+    def retransmit(self, seq):
+        """
+        Sends a packet again and excludes it from RTT sampling.
+        Args:
+            seq (int): The sequence number of the packet.
+        """
+        self.retransmitted.add(seq)
+        self.sent_at[seq] = time.monotonic()
+        self.metrics.retransmissions += 1
+        self.send_packet(seq)
+
+    def wait_for_ack(self):
+        """
+        Waits for an acknowledgement until the next timer expires or the pacer releases the next
+        packet, and handles whichever comes first.
+        """
+        now = time.monotonic()
+        wake = self.timers.next_deadline()
+        if wake is not None and wake <= now:
+            self.on_timeout()
+            return
+        if self.pace_until is not None:
+            wake = self.pace_until if wake is None else min(wake, self.pace_until)
+            if wake <= now:
+                return
+        # The socket only sleeps until the earliest deadline in the timer heap or the pacer
+        self.sock.settimeout(wake - now)
+        try:
+            data, _ = self.sock.recvfrom(BUFFER_SIZE)
+        except socket.timeout:
+            self.on_timeout()
+            return
+        if self.checksum is not None:
+            nack = self.proto.parse_nack(data)
+            if nack is not None:
+                self.on_nack(nack)
+                return
+        packet = self.proto.parse_ack(data)
+        if packet is None:
+            return
+        ack, options = packet
+        self.tracer.packet(EV_ACK, self.proto.connection_id, self.base, ack, len(self.packets), self.cc.window())
+        if self.fec is not None:
+            self.fec.on_recovered(option_int(options, OPT_FEC_RECOVERED))
+        self.on_ack(ack, decode_sack(options))
+
+    def sample_rtt(self, seq, now):
+        """
+        Feeds the round-trip time of a packet to the estimator, unless it was retransmitted.
+        Args:
+            seq (int): The sequence number of the acknowledged packet.
+            now (float): When the acknowledgement arrived.
+        """
+        if seq not in self.retransmitted:
+            self.rtt.sample(now - self.sent_at[seq])
+            self.metrics.rtt_ms.record((now - self.sent_at[seq]) * 1000)
+
+    def acknowledge(self, seq, now):
+        """
+        Forgets a packet that the server has received.
+        Args:
+            seq (int): The sequence number of the packet.
+            now (float): When the acknowledgement arrived.
+        """
+        if seq in self.packets and self.selective:
+            self.on_delivered(seq, now)
+        packet = self.packets.pop(seq, None)
+        if packet is not None:
+            self.metrics.packets_acked += 1
+            self.metrics.bytes_acked += len(packet[1])
+            self.timers.cancel(seq)
+            del self.sent_at[seq]
+            self.retransmitted.discard(seq)
+            self.fast_retransmitted.discard(seq)
+
+    def on_ack(self, ack, sack_blocks):
+        """
+        Slides the window past the cumulatively acknowledged packets and, in Selective Repeat mode,
+        forgets the selectively acknowledged ones and retransmits the holes before them.
+        Args:
+            ack (int): The cumulative acknowledgment number.
+            sack_blocks (list): (start, end) ranges of packets the server has buffered, end exclusive.
+        """
+        now = time.monotonic()
+        in_flight = len(self.packets)
+        if ack < self.base:
+            self.metrics.duplicate_acks += 1
+
+        # If the ack is within the window, move the base of the window. The newest acknowledged
+        # packet is only a valid RTT sample if none of the packets it covers was retransmitted
+        if ack >= self.base and ack < self.nextseqnum:
+            if ack in self.packets and not any(seq in self.retransmitted for seq in range(self.base, ack + 1)):
+                self.sample_rtt(ack, now)
+            for seq in range(self.base, ack + 1):
+                self.acknowledge(seq, now)
+            self.base = ack + 1
+            self.file_chunks.release(ack)
+            if self.progress is not None:
+                self.progress(ack, self.total)
+            if not self.selective:
+                self.timers.cancel(GBN_TIMER)
+                if self.packets:
+                    self.timers.schedule(GBN_TIMER, now + self.rtt.rto)
+
+        if self.selective:
+            self.on_sack(sack_blocks, now)
+
+        # Let the congestion controller grow the window for every newly acknowledged packet
+        self.metrics.window_occupancy.record(len(self.packets))
+        acked = in_flight - len(self.packets)
+        if acked > 0:
+            self.cc.on_ack(acked, now, self.rtt)
+            if self.pacer is not None:
+                self.pacer.set_rate(self.cc.pacing_rate(self.rtt))
+
+    def on_sack(self, sack_blocks, now):
+        """
+        Forgets the selectively acknowledged packets and retransmits the holes before them.
+        Args:
+            sack_blocks (list): (start, end) ranges of packets the server has buffered, end exclusive.
+            now (float): When the acknowledgement arrived.
+        """
+        newest = None
+        for start, end in sack_blocks:
+            for seq in range(max(start, self.base), min(end, self.nextseqnum)):
+                if seq in self.packets:
+                    newest = seq if newest is None or seq > newest else newest
+                self.highest_sacked = max(self.highest_sacked, seq)
+        if newest is not None:
+            self.sample_rtt(newest, now)
+        for start, end in sack_blocks:
+            for seq in range(max(start, self.base), min(end, self.nextseqnum)):
+                self.acknowledge(seq, now)
+        self.detect_losses(now)
+
+    def on_delivered(self, seq, now):
+        """
+        Updates the newest delivered packet, and tells reordering and spurious retransmissions apart.
+        Args:
+            seq (int): The sequence number of a packet that was acknowledged for the first time.
+            now (float): When the acknowledgement arrived.
+        """
+        sent = self.sent_at[seq]
+        # An ACK that comes back sooner than the minimum RTT after a retransmission is for the original
+        early = self.rtt.samples > 0 and now - sent < self.rtt.min_rtt
+        if seq in self.fast_retransmitted and early:
+            self.on_spurious(seq)
+        elif seq in self.recovery_retransmits:
+            self.recovery_retransmits.discard(seq)
+            self.recovery_genuine = True
+        if seq in self.retransmitted and early:
+            # Which copy arrived is unknown, so it says nothing about the path
+            return
+        if seq not in self.retransmitted and sent < self.rack_sent_at:
+            # A packet sent later arrived first
+            self.reordering_seen = True
+            self.reorder_extent = max(self.reorder_extent, self.rack_sent_at - sent)
+        if sent > self.rack_sent_at:
+            self.rack_sent_at = sent
+            self.rack_rtt = now - sent
+
+    def on_spurious(self, seq):
+        """
+        Counts a fast retransmission that reordering caused. The reordering window grows once per
+        recovery, and the reduction of the recovery is undone once all its retransmissions turn out spurious.
+        Args:
+            seq (int): The sequence number of the packet.
+        """
+        self.metrics.spurious_retransmissions += 1
+        self.reordering_seen = True
+        if seq not in self.recovery_retransmits:
+            return
+        self.recovery_retransmits.discard(seq)
+        if not self.recovery_spurious:
+            self.recovery_spurious = True
+            self.reorder_multiplier += 1
+            self.recoveries = 0
+        if not self.recovery_retransmits and not self.recovery_genuine:
+            self.cc.undo(self.undo_state)
+            self.undo_state = None
+            # The recovery is over, so the next loss reduces the window again
+            self.recovery_point = 0
+            self.metrics.congestion_undos += 1
+            if self.pacer is not None:
+                self.pacer.set_rate(self.cc.pacing_rate(self.rtt))
+
+    def detect_losses(self, now):
+        """
+        Retransmits the holes that are lost: those sent before the newest delivered packet, once
+        its round-trip time plus the reordering window has passed since they were sent, and arms
+        the RACK timer for the first hole that is not lost yet.
+        Args:
+            now (float): The current time.monotonic() value.
+        """
+        if self.reordering_seen and self.rtt.samples:
+            reorder_window = min(max(self.reorder_multiplier * self.rtt.min_rtt / 4, self.reorder_extent), self.rtt.srtt)
+        else:
+            reorder_window = 0.0
+        lost = []
+        deadline = None
+        for seq in self.packets:
+            # Without reordering, a packet is treated as lost once enough later packets have arrived
+            if seq >= self.highest_sacked or not self.reordering_seen and seq + SACK_HOLE_THRESHOLD > self.highest_sacked:
+                break
+            if seq in self.fast_retransmitted or self.sent_at[seq] >= self.rack_sent_at:
+                continue
+            expires = self.sent_at[seq] + self.rack_rtt + reorder_window
+            if expires <= now:
+                lost.append(seq)
+            elif deadline is None or expires < deadline:
+                deadline = expires
+        if deadline is None:
+            self.timers.cancel(RACK_TIMER)
+        else:
+            self.timers.schedule(RACK_TIMER, deadline)
+        if lost:
+            self.on_congestion(now, timeout=False)
+            if self.fec is not None:
+                self.fec.on_loss(len(lost))
+        for seq in lost:
+            self.fast_retransmitted.add(seq)
+            if self.undo_state is not None:
+                self.recovery_retransmits.add(seq)
+            self.metrics.fast_retransmissions += 1
+            self.retransmit(seq)
+            self.tracer.event(EV_FAST_RETRANSMIT, self.proto.connection_id, seq, self.base - 1, len(self.packets), self.cc.window())
+
+    def on_nack(self, seq):
+        """
+        Sends a packet that arrived corrupt again.
+        Args:
+            seq (int): The sequence number of the packet.
+        """
+        if seq not in self.packets:
+            return
+        self.metrics.nacks_received += 1
+        if self.fec is not None:
+            self.fec.on_loss()
+        self.tracer.event(EV_NACK, self.proto.connection_id, seq, self.base - 1, len(self.packets), self.cc.window())
+        self.retransmit(seq)
+
+    def on_congestion(self, now, timeout):
+        """
+        Reports a loss to the congestion controller, once per window of data unless it is a timeout.
+        Args:
+            now (float): The current time.monotonic() value.
+            timeout (bool): True if the loss was detected by a retransmission timeout.
+        """
+        if timeout or self.base > self.recovery_point:
+            self.recovery_point = self.nextseqnum - 1
+            # A fast recovery may turn out to be reordering and be undone, a timeout is not
+            self.undo_state = None if timeout else self.cc.state()
+            self.recovery_retransmits = set()
+            self.recovery_genuine = False
+            self.recovery_spurious = False
+            if not timeout:
+                self.recoveries += 1
+                if self.recoveries >= REORDER_WINDOW_DECAY:
+                    self.reorder_multiplier = 1
+                    self.reorder_extent = 0.0
+                    self.recoveries = 0
+            self.cc.on_congestion(now, timeout)
+            self.tracer.event(EV_CONGESTION, self.proto.connection_id, self.nextseqnum - 1, self.base - 1, len(self.packets), self.cc.window())
+            if self.pacer is not None:
+                self.pacer.set_rate(self.cc.pacing_rate(self.rtt))
+
+    def on_timeout(self):
+        """
+        Retransmits after a timeout: every unacknowledged packet in Go-Back-N mode,
+        only the packets whose own timer expired in Selective Repeat mode. The RTO is doubled
+        once per loss burst: the timers of packets sent within one RTO of each other expire
+        within one RTO too, and doubling for each of them would inflate the RTO exponentially.
+        """
+        now = time.monotonic()
+        expired = self.timers.pop_expired(now)
+        if RACK_TIMER in expired:
+            expired.remove(RACK_TIMER)
+            self.detect_losses(now)
+        if not expired:
+            return
+        self.tracer.event(EV_TIMEOUT, self.proto.connection_id, min(expired), self.base - 1, len(self.packets), self.cc.window())
+        self.metrics.timeouts += 1
+        if now >= self.backoff_until:
+            self.backoff_until = now + self.rtt.rto
+            self.rtt.backoff()
+        self.on_congestion(now, timeout=True)
+        if self.fec is not None:
+            # Go-Back-N sends the whole window again, but only knows that one packet was lost
+            self.fec.on_loss(len(expired) if self.selective else 1)
+        if not self.selective:
+            expired = list(self.packets)
+            self.timers.schedule(GBN_TIMER, time.monotonic() + self.rtt.rto)
+        for seq in expired:
+            self.retransmit(seq)
+            self.tracer.event(EV_RETRANSMIT, self.proto.connection_id, seq, self.base - 1, len(self.packets), self.cc.window())
+
+    def gauges(self):
+        """
+        Returns:
+            dict: The current state of the window, the congestion controller and the RTT estimator.
+        """
+        return {'base': self.base, 'total_packets': self.total, 'in_flight': len(self.packets),
+                'cwnd': round(self.cc.cwnd, 2), 'ssthresh': round(self.cc.ssthresh, 2),
+                'srtt_ms': None if self.rtt.srtt is None else round(self.rtt.srtt * 1000, 3),
+                'rto_ms': round(self.rtt.rto * 1000, 3)}
+
+    def stats(self):
+        """
+        Returns:
+            dict: The retransmission counters, the RTT statistics and the final congestion window.
+        """
+        return dict(self.rtt.stats(), retransmissions=self.metrics.retransmissions, timeouts=self.metrics.timeouts,
+                    cwnd=round(self.cc.cwnd, 2), ssthresh=round(self.cc.ssthresh, 2))
+
+    def close(self):
+        """
+        Drops the references to the chunks so the file can be unmapped.
+        """
+        self.packets.clear()
+        if self.compressor is not None:
+            self.compressor.close()
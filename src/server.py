@@ -1,21 +1,39 @@
 # ---------------- IMPORTS ---------------- 
-# Import necessary utilities
+# Import necessary utilities and the event loop that serves the connections
 from utils import *
+from protocol import *
+from writer import FileWriter
+from fastpath import DatagramReader, ReaderTransport
+from tracing import *
+from metrics import ServerMetrics, open_reporter
+from compress import CODECS_BY_ID, offered_codecs
+from resume import ReceiveBitmap, ResumeState
+from integrity import CHECKSUMS_BY_ID, CRC_OPTION_SIZE, FileDigest, offered_checksums
+from delta import CHUNK_HASH_SIZE, apply_delta, load_index, save_index
+from fec import parity_header, recover_packet
+from tree import TreeWriter
+import asyncio
+import random
 
 # ---------------- UTILITY FUNCTIONS ---------------- 
 # Functions for socket initiation, file handling, data receiving, and more.
 
-def init_socket(ip, port):
+def init_socket(ip, port, reuse_port=False):
     """
     Creates and binds a UDP socket to the given IP and port.
     Args:
         ip (str): The IP address for the socket to bind to.
         port (int): The port for the socket to bind to.
+        reuse_port (bool): Whether other processes may bind the same port, with the kernel
+            spreading the flows across the sockets.
     Returns:
         socket: The created and bound socket.
     """
     try:
         sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)  # UDP
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, SOCKET_BUFFER_SIZE)
+        if reuse_port:
+            sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         sock.bind((ip, port))
         return sock
     except socket.error as e:
@@ -23,207 +41,1115 @@ def init_socket(ip, port):
         exit(1)
 
 
-def write_chunks_to_file(file_chunks):
+def parse_data(data, proto):
     """
-    Writes chunks of data to a file.
+    Parses data into a header and body.
     Args:
-        file_chunks (list): The chunks of data to write to the file.
+        data (bytes-like): The data to parse, a memoryview of the receive buffer.
+        proto (HeaderV1 or HeaderV2): The header codec of the connection.
+    Returns:
+        tuple: The sequence number, acknowledgment number, flags, and body, a memoryview of data,
+        or None if the packet is malformed.
     """
-    try:
-        with open('img/received_file.jpg', 'wb') as file:
-            for chunk in file_chunks:
-                file.write(chunk)
-    except Exception as e:
-        print(f"Error writing to file: {e}")
-        exit(1)
+    return proto.parse_data(data)
+
 
-def receive_data(sock, buffer_size):
+def is_handshake_ack(packet):
     """
-    Receives data from a socket.
+    Tells the handshake ACK from data packets, which carry ACK_FLAG too.
     Args:
-        sock (socket): The socket to receive data from.
-        buffer_size (int): The maximum amount of data to be received at once.
-
+        packet (tuple): The parsed packet.
     Returns:
-        tuple: The received data and the sender's address.
+        bool: True if the packet is the client's ACK of the SYN-ACK.
     """
-    data, addr = sock.recvfrom(buffer_size)
-    return data, addr
+    return packet[2] == ACK_FLAG and packet[0] == 0 and not packet[4]
 
 
-def handle_syn(sock, addr):
+def calculate_throughput(elapsed_time, file_size_bits):
     """
-    Handles a SYN packet.
+    Calculates the throughput of the transfer.
     Args:
-        sock (socket): The socket to send data to.
-        addr (tuple): The address of the recipient.
+        elapsed_time (float): The time it took to transfer the file.
+        file_size_bits (int): The size of the file in bits.
+    Returns:
+        float: The throughput of the transfer in Mbps.
     """
-    print("SYN packet is received")
-    syn_ack_header = struct.pack(header_format, 0, 0, SYN_FLAG | ACK_FLAG)
-    sock.sendto(syn_ack_header, addr)
-    print("SYN-ACK packet is sent\n")
+    throughput = file_size_bits / elapsed_time
+    throughput_mbps = round(throughput / 1000000, 2)
+    return throughput_mbps
+
+# ---------------- SESSIONS ---------------- 
+# The state of every connection lives in its own Session, so one server serves many clients at once.
+# A session moves from SYN_RECEIVED (handshake and path MTU probes) to ESTABLISHED (data transfer),
+# DATA_DONE (the last packet arrived, waiting for the FIN) and CLOSED (lingering to answer lost FIN ACKs).
+SYN_RECEIVED = 'syn-received'
+ESTABLISHED = 'established'
+DATA_DONE = 'data-done'
+CLOSED = 'closed'
 
 
-def parse_data(data, header_size):
+class Session:
     """
-    Parses data into a header and body.
+    One connection: its handshake state, receive window and output file.
     Args:
-        data (bytes): The data to parse.
-        header_size (int): The size of the header.
-    Returns:
-        tuple: The sequence number, acknowledgment number, flags, and body.
+        server (DRTPServerProtocol): The server that owns the session.
+        addr (tuple): The address of the client.
+        proto (HeaderV1 or HeaderV2): The header codec of the connection.
     """
-    header = data[:header_size]
-    sequence_number, acknowledgment_number, flags = struct.unpack(header_format, header)
-    chunk = data[header_size:]
-    return sequence_number, acknowledgment_number, flags, chunk
 
+    def __init__(self, server, addr, proto):
+        self.server = server
+        self.args = server.args
+        self.tracer = server.tracer
+        self.metrics = server.metrics
+        self.addr = addr
+        self.proto = proto
+        self.key = (addr, proto.connection_id)
+        self.label = f"{addr[0]}:{addr[1]}#{proto.connection_id}"
+        if server.worker_id is not None:
+            self.label = f"worker {server.worker_id} {self.label}"
+        self.state = SYN_RECEIVED
+        self.last_activity = time.monotonic()
+
+        # Receive state
+        self.discard_seq = self.args.discard
+        self.selective = False
+        self.chunk_size = MAX_PACKET_SIZE - proto.size
+        self.buffer = {}            # The flags and payload of the packets received out of order, by sequence number
+        self.expected_sequence_number = 1
+        self.unacked = 0            # In-order packets received since the last ACK
+        self.ack_every = 1          # In-order packets per ACK, chosen once the client's window is known
+        self.ack_timer = None       # The timer that sends a delayed ACK
+        self.total_file_size = 0
+        self.writer = None
+        self.output_path = None
+        self.start_time = None
+        self.group = None      # The StreamGroup of a striped transfer
+        self.base_offset = 0   # Where the byte range of a stream starts in the file
+        self.codec = None      # The compression codec the client chose
+
+        # Resume state, when the client identified its file
+        self.file_id = None
+        self.file_size = 0
+        self.bitmap = None          # The ReceiveBitmap of the chunks in the output file
+        self.resume_state = None    # Where the bitmap is saved
+        self.ack_reply = None       # The answer to the ACK, repeated if the client sends the ACK again
+        self.resume_dirty = False   # Chunks were written since the bitmap was last saved
+        self.saving = False
+        self.saved_at = time.monotonic()
+
+        # Integrity, when the client chose a checksum
+        self.checksum = None
+        self.digest = None          # The FileDigest of the chunks written in order
+        self.file_digest = None     # Its value once the last chunk is hashed, b'' if it could not be computed
+        self.pending_fin = None     # The options of a FIN that arrived before the digest was ready
+
+        # Delta sync, when the client sends a delta against the server's copy of the file
+        self.sync = False
+        self.segment_size = MAX_PACKET_SIZE
+        self.base_chunks = None     # (hash, length) of the chunks of the copy, once it is indexed
+        self.index_reply = None     # The answer to the ACK: how many chunks the index has and how many a page holds
+        self.rebuilding = False     # The file is being rebuilt from the delta and the copy, or the files of a tree completed
+        self.rebuild_failed = False
+
+        # Directory transfers, when the client sends a stream of files
+        self.tree = False
+
+        # Forward error correction, when the client sends parity packets
+        self.fec_packets = None     # The flags and payload of the data packets received since the last parity, by sequence number
+        self.fec_recovered = 0      # The data packets rebuilt from parity, reported to the client in ACKs
+
+    def log(self, message):
+        print(f"[{self.label}] {message}")
+
+    def send(self, data):
+        self.server.transport.sendto(data, self.addr)
+
+    def send_syn_ack(self):
+        """
+        Answers the SYN, offering the optional features, the largest datagram the server accepts,
+        the codecs it can decompress and the checksums it can check, and telling how long it may
+        delay an ACK.
+        """
+        ack_delay = 0 if self.args.ack_every == 1 else round(self.args.ack_delay * 1e6)
+        options = {OPT_FEATURES: self.server.offered_features().to_bytes(4, 'big'), OPT_MAX_SEGMENT: self.args.max_segment.to_bytes(4, 'big'),
+                   OPT_COMPRESSION: offered_codecs(), OPT_ACK_DELAY: ack_delay.to_bytes(4, 'big')}
+        if not self.args.no_integrity:
+            options[OPT_CHECKSUM] = offered_checksums()
+        self.send(self.proto.control_packet(SYN_FLAG | ACK_FLAG, options))
+        self.log("SYN-ACK packet is sent")
+
+    def send_ack(self):
+        """
+        Sends the cumulative ACK of the packets received in order, with SACK blocks for the packets
+        buffered out of order in Selective Repeat mode, and cancels the delayed ACK.
+        """
+        self.cancel_ack_timer()
+        self.unacked = 0
+        options = self.fec_options()
+        if self.selective:
+            options.update(encode_sack(self.buffer))
+        self.send(self.proto.ack_packet(self.expected_sequence_number - 1, options))
+        self.metrics.acks_sent += 1
+        self.tracer.packet(EV_ACK_SENT, self.proto.connection_id, 0, self.expected_sequence_number - 1, len(self.buffer), self.expected_sequence_number)
+
+    def delay_ack(self):
+        """
+        Acknowledges a packet received in order: every ack_every packets, or once --ack-delay
+        has passed since the first packet that is not acknowledged yet.
+        """
+        self.unacked += 1
+        if self.unacked >= self.ack_every:
+            self.send_ack()
+        elif self.ack_timer is None:
+            self.ack_timer = asyncio.get_running_loop().call_later(self.args.ack_delay, self.on_ack_timer)
+
+    def on_ack_timer(self):
+        self.ack_timer = None
+        if self.state == ESTABLISHED and self.unacked:
+            self.metrics.acks_delayed += 1
+            self.send_ack()
+
+    def cancel_ack_timer(self):
+        if self.ack_timer is not None:
+            self.ack_timer.cancel()
+            self.ack_timer = None
+
+    def handle_packet(self, data):
+        """
+        Handles a datagram of the connection according to its state.
+        Args:
+            data (memoryview): The received datagram, valid until the next one is read.
+        """
+        self.last_activity = time.monotonic()
+        if self.state == SYN_RECEIVED:
+            self.handle_handshake(data)
+        elif self.state == ESTABLISHED:
+            self.handle_data(data)
+        else:
+            self.handle_fin(data)
+
+    def handle_handshake(self, data):
+        """
+        Answers path MTU probes and retransmitted SYNs until the ACK establishes the connection.
+        Args:
+            data (memoryview): The received datagram, valid until the next one is read.
+        """
+        if len(data) == HEADER_V1.size and struct.unpack(header_format, data)[2] == SYN_FLAG:
+            # Our SYN-ACK was lost
+            self.send_syn_ack()
+            return
+        packet = self.proto.parse(data)
+        if packet is None:
+            return
+        if packet[2] == PROBE_FLAG:
+            self.send(self.proto.control_packet(PROBE_FLAG | ACK_FLAG, acknowledgment_number=len(data)))
+        elif is_handshake_ack(packet):
+            # Data packets carry ACK_FLAG too; one that overtook the ACK is dropped and retransmitted
+            self.establish(packet[3])
+
+    def establish(self, options):
+        """
+        Establishes the connection with the options of the client's ACK and opens the output file.
+        Args:
+            options (dict): The options of the ACK.
+        """
+        self.log('ACK packet is received')
+        self.log('Connection Established')
+        self.server.pending.pop(self.addr, None)
+        features = option_int(options, OPT_FEATURES) & self.server.offered_features()
+        self.selective = bool(features & FEATURE_SACK)
+        self.segment_size = option_int(options, OPT_SEGMENT_SIZE, MAX_PACKET_SIZE)
+        self.chunk_size = self.segment_size - self.proto.size
+        self.log(f'Segment size is {self.segment_size} bytes')
+
+        # Wait for at most half the client's window, so it can send again before the window is used
+        # up and never waits for the delayed ACK. Version 1 clients and version 2 clients that do
+        # not announce their window get every packet acknowledged at once
+        window = option_int(options, OPT_WINDOW)
+        self.ack_every = max(1, min(self.args.ack_every, window // 2))
+        if features & FEATURE_FEC:
+            # The header of the parity packets takes room from every chunk
+            self.fec_packets = {}
+            self.chunk_size -= parity_header.size
+            self.log('Lost packets are rebuilt from parity packets')
+        if OPT_COMPRESSION in options:
+            self.codec = CODECS_BY_ID.get(option_int(options, OPT_COMPRESSION))
+            if self.codec is None:
+                self.log(f"The client chose codec {option_int(options, OPT_COMPRESSION)}, which was not offered")
+                self.server.remove(self)
+                return
+            self.log(f'Chunks are compressed with {self.codec.name}')
+        if OPT_CHECKSUM in options:
+            self.checksum = CHECKSUMS_BY_ID.get(option_int(options, OPT_CHECKSUM))
+            if self.checksum is None or self.args.no_integrity:
+                self.log(f"The client chose checksum {option_int(options, OPT_CHECKSUM)}, which was not offered")
+                self.server.remove(self)
+                return
+            # The CRC option takes room from every chunk
+            self.chunk_size -= CRC_OPTION_SIZE
+            self.log(f'Packets are checked with {self.checksum.name}, the file with SHA-256')
+
+        # Open the output file; every in-order chunk is written straight to its offset.
+        # Version 2 clients announce the file size, so the file can be preallocated.
+        # The streams of a striped transfer all write their byte range into the same file
+        file_name = options.get(OPT_FILE_NAME, b'').decode(errors='replace')
+        stream = decode_stream(options)
+        if stream is not None:
+            self.group = self.server.join_stream_group(self, file_name, stream)
+            self.base_offset = stream[3]
+            self.output_path = self.group.path
+            self.log(f'Stream {stream[1] + 1} of {stream[2]} of session {stream[0]:08x}, from byte {self.base_offset}')
+        else:
+            # A delta replaces the whole file, so it is not resumed, and neither is a tree
+            self.sync = bool(features & FEATURE_DELTA)
+            self.tree = bool(features & FEATURE_TREE) and not self.sync
+            if features & FEATURE_RESUME and not self.sync and not self.tree and len(options.get(OPT_FILE_ID, b'')) == 16:
+                self.file_id = options[OPT_FILE_ID]
+                self.file_size = option_int(options, OPT_FILE_SIZE)
+                self.server.drop_stale_session(self)
+            self.output_path = self.server.claim_output_path(file_name, self)
+        # The delta is written next to the copy, and the file is rebuilt from both once it is complete
+        write_path = self.output_path + DELTA_SUFFIX if self.sync else self.output_path
+        # The digest of a delta is of the rebuilt file, which is hashed as it is checked
+        if self.checksum is not None and not self.sync:
+            self.digest = FileDigest(write_path)
+        resumed = self.file_id is not None and self.load_resume_state()
+        try:
+            if self.tree:
+                self.writer = TreeWriter(write_path, self.args.fsync, self.args.writer_thread)
+            else:
+                self.writer = FileWriter(write_path, self.args.fsync, self.args.writer_thread,
+                                         truncate=self.group is None and not resumed)
+            if OPT_FILE_SIZE in options and not self.sync:
+                self.writer.preallocate(option_int(options, OPT_FILE_SIZE))
+        except OSError as e:
+            self.log(f"Error opening output file {write_path}: {e}")
+            if self.writer is not None and self.writer.fd is not None:
+                os.close(self.writer.fd)
+                self.writer = None
+            self.server.remove(self)
+            return
+        if self.sync:
+            self.log(f'Writing the delta against {self.output_path} to {write_path}')
+        elif self.tree:
+            self.log(f'Writing the files to the directory {self.output_path}')
+        else:
+            self.log(f'Writing to {self.output_path}')
+
+        # Start receiving data
+        self.start_time = time.time()
+        self.state = ESTABLISHED
+        self.metrics.sessions_started += 1
+
+        # A client that asked to resume waits for the list of chunks the server already has
+        if features & FEATURE_RESUME:
+            ranges = [] if self.bitmap is None else [(start + 1, end + 1) for start, end in self.bitmap.ranges()]
+            payload = encode_resume(ranges, BUFFER_SIZE - self.proto.size)
+            self.ack_reply = self.proto.data_header(0, RESUME_FLAG | ACK_FLAG, len(payload)) + payload
+            self.send(self.ack_reply)
+            if self.bitmap is not None and self.expected_sequence_number > self.bitmap.count:
+                self.log('Every chunk was already received')
+                self.finish()
+
+        # A client that sends a tree waits for the answer too, as the stream starts with the manifest
+        if self.tree:
+            self.ack_reply = self.proto.control_packet(TREE_FLAG | ACK_FLAG)
+            self.send(self.ack_reply)
+
+        # A client that syncs waits for the chunk hashes of the copy, which may take a while to compute
+        if self.sync:
+            self.send(self.proto.control_packet(DELTA_FLAG))
+            indexing = asyncio.get_running_loop().run_in_executor(None, load_index, self.output_path)
+            indexing.add_done_callback(self.on_indexed)
+
+    def on_indexed(self, indexing):
+        if indexing.exception() is not None:
+            # Without the chunks of the copy the client sends every chunk
+            self.log(f"Error indexing {self.output_path}: {indexing.exception()}")
+            self.base_chunks = []
+        else:
+            self.base_chunks = indexing.result()
+        per_page = (self.segment_size - self.proto.size) // CHUNK_HASH_SIZE
+        payload = struct.pack(index_summary_format, len(self.base_chunks), per_page)
+        self.index_reply = self.proto.data_header(0, DELTA_FLAG | ACK_FLAG, len(payload)) + payload
+        self.log(f'{self.output_path} has {len(self.base_chunks)} chunks to sync against')
+        if self.state == ESTABLISHED:
+            self.send(self.index_reply)
+
+    def send_index_page(self, page):
+        """
+        Answers the client's request for a page of the index of the copy.
+        Args:
+            page (int): The number of the page, from 1.
+        """
+        if self.base_chunks is None:
+            return
+        per_page = (self.segment_size - self.proto.size) // CHUNK_HASH_SIZE
+        payload = b''.join(digest for digest, _ in self.base_chunks[(page - 1) * per_page:page * per_page])
+        self.send(self.proto.data_header(page, DELTA_FLAG | ACK_FLAG, len(payload)) + payload)
+
+    def load_resume_state(self):
+        """
+        Loads the bitmap saved by an interrupted transfer of the same file into the output file,
+        converted to the chunk size of this connection, or starts a new one.
+        Returns:
+            bool: True if the transfer resumes and the output file must be kept.
+        """
+        self.resume_state = ResumeState(self.output_path + RESUME_SUFFIX)
+        saved = self.resume_state.load(self.file_id, self.file_size) if os.path.exists(self.output_path) else None
+        if saved is None:
+            self.bitmap = ReceiveBitmap((self.file_size + self.chunk_size - 1) // self.chunk_size)
+            return False
+        chunk_size, bitmap = saved
+        self.bitmap = bitmap.rechunk(chunk_size, self.chunk_size, self.file_size)
+        self.skip_received()
+        have = sum(end - start for start, end in self.bitmap.ranges())
+        self.metrics.sessions_resumed += 1
+        self.log(f'Resuming, {have} of {self.bitmap.count} chunks were already received')
+        return True
+
+    def handle_data(self, data):
+        """
+        Handles a data packet: writes in-order chunks, buffers out-of-order ones and acknowledges.
+        Args:
+            data (memoryview): The received datagram, valid until the next one is read.
+        """
+        packet = parse_data(data, self.proto)
+        if packet is None:
+            return
+        sequence_number, _, flags, chunk = packet
+        if flags & PROBE_FLAG:
+            # A path MTU probe that arrived after the ACK; its padding is not file data
+            return
+        if self.ack_reply is not None and is_handshake_ack((sequence_number, 0, flags, None, chunk)):
+            # The answer to the ACK was lost and the client sends the ACK again
+            self.send(self.ack_reply)
+            return
+        if self.sync and is_handshake_ack((sequence_number, 0, flags, None, chunk)):
+            # The index answer was lost, or the copy is still being indexed
+            self.send(self.index_reply or self.proto.control_packet(DELTA_FLAG))
+            return
+        if self.sync and flags == DELTA_FLAG:
+            self.send_index_page(packet[1])
+            return
+        if self.checksum is not None and not self.checksum.verify(data, self.proto.size):
+            # Ask for the packet again at once; if its sequence number is what got corrupted, the client ignores the NACK
+            self.tracer.event(EV_CORRUPT, self.proto.connection_id, sequence_number, 0, len(self.buffer), self.expected_sequence_number)
+            self.metrics.checksum_errors += 1
+            if not flags & FEC_FLAG:
+                # A parity packet is not sent again
+                self.send(self.proto.control_packet(NACK_FLAG, acknowledgment_number=sequence_number))
+            return
+        if flags & FEC_FLAG:
+            if self.fec_packets is not None:
+                self.handle_parity(sequence_number, chunk)
+            return
+        self.metrics.packets_received += 1
+        self.metrics.bytes_received += len(chunk)
+        self.receive(sequence_number, flags, chunk)
+
+    def receive(self, sequence_number, flags, chunk):
+        """
+        Handles a data packet that passed its CRC check or was rebuilt from parity. Packets that
+        arrive in order are acknowledged together, and anything else at once: a packet out of order
+        or a duplicate, so the client learns about the hole or the lost ACK, the packet that fills
+        a hole, so the client stops retransmitting, and the last packet.
+        Args:
+            sequence_number (int): The sequence number of the packet.
+            flags (int): Its flags.
+            chunk (bytes): Its payload.
+        """
+        file_transfer_complete = False
+        ack_now = True
+
+        # Handle the incoming data based on its sequence number
+        if sequence_number == self.discard_seq:
+            self.tracer.event(EV_DISCARD, self.proto.connection_id, sequence_number, 0, len(self.buffer), self.expected_sequence_number)
+            self.metrics.discarded += 1
+            self.discard_seq = float('inf')
+            return
+        if self.fec_packets is not None:
+            self.fec_packets[sequence_number] = (flags, bytes(chunk))
+        if sequence_number == self.expected_sequence_number:
+            self.tracer.packet(EV_RECEIVE, self.proto.connection_id, sequence_number, 0, len(self.buffer), self.expected_sequence_number)
+            if not self.write_chunk(sequence_number, flags, chunk):
+                return
+            self.advance()
+
+            # If last packet, the transfer is complete
+            file_transfer_complete = self.is_complete(flags)
+            ack_now = file_transfer_complete or bool(self.buffer)
+
+            # Process any buffered packets with sequence numbers that match the expected one
+            while not file_transfer_complete and self.expected_sequence_number in self.buffer:
+                sequence_number = self.expected_sequence_number
+                flags, chunk = self.buffer.pop(sequence_number)
+                if not self.write_chunk(sequence_number, flags, chunk):
+                    if self.state == CLOSED:
+                        return
+                    # The writer is full and the packet was dropped; the ACK leaves a hole for it
+                    break
+                self.advance()
+                file_transfer_complete = self.is_complete(flags)
+        elif sequence_number < self.expected_sequence_number:
+            # A duplicate means our ACK was lost, so repeat the last cumulative ACK
+            self.tracer.packet(EV_DUPLICATE, self.proto.connection_id, sequence_number, 0, len(self.buffer), self.expected_sequence_number)
+            self.metrics.duplicates += 1
+        elif sequence_number in self.buffer or self.bitmap is not None and sequence_number - 1 in self.bitmap:
+            self.tracer.packet(EV_DUPLICATE, self.proto.connection_id, sequence_number, 0, len(self.buffer), self.expected_sequence_number)
+            self.metrics.duplicates += 1
+        elif len(self.buffer) >= self.args.max_reorder:
+            # The client sent further ahead than the server buffers; it will retransmit the packet
+            self.tracer.event(EV_DISCARD, self.proto.connection_id, sequence_number, 0, len(self.buffer), self.expected_sequence_number)
+            self.metrics.discarded += 1
+        else:
+            # If the packet is out of order, buffer a copy of its payload, as the datagram is only
+            # valid until the next one is received
+            self.buffer[sequence_number] = (flags, bytes(chunk))
+            self.tracer.packet(EV_OUT_OF_ORDER, self.proto.connection_id, sequence_number, 0, len(self.buffer), self.expected_sequence_number)
+            self.metrics.out_of_order += 1
+            self.metrics.reorder_depth.record(len(self.buffer))
+
+        # The ACK is cumulative, with SACK blocks for the packets buffered out of order in Selective Repeat mode
+        if ack_now:
+            self.send_ack()
+        else:
+            self.delay_ack()
+
+        if file_transfer_complete:
+            self.finish()
+
+    def handle_parity(self, first, parity):
+        """
+        Rebuilds the data packet of a block that is missing, if it is the only one, from the
+        block's parity packet and its other packets, and forgets the packets of the block.
+        Args:
+            first (int): The sequence number of the first packet of the block.
+            parity (bytes): The payload of the parity packet.
+        """
+        self.metrics.parity_packets_received += 1
+        try:
+            count = parity_header.unpack_from(parity)[0]
+        except struct.error:
+            return
+        block = range(first, first + count)
+        missing = [seq for seq in block if seq not in self.fec_packets]
+        if len(missing) == 1 and missing[0] >= self.expected_sequence_number and missing[0] not in self.buffer:
+            seq = missing[0]
+            try:
+                flags, chunk = recover_packet(parity, [self.fec_packets[other] for other in block if other != seq])
+            except ValueError as e:
+                self.log(f"Parity packet of block {first} does not match its packets ({e})")
+            else:
+                self.fec_recovered += 1
+                self.metrics.fec_recovered += 1
+                self.tracer.event(EV_FEC_RECOVER, self.proto.connection_id, seq, 0, len(self.buffer), self.expected_sequence_number)
+                self.receive(seq, flags, chunk)
+        # Packets of this or earlier blocks are not needed anymore
+        for seq in [seq for seq in self.fec_packets if seq < first + count]:
+            del self.fec_packets[seq]
+
+    def fec_options(self):
+        """
+        Returns:
+            dict: The option that reports the packets rebuilt from parity, empty if there are none.
+        """
+        return {OPT_FEC_RECOVERED: self.fec_recovered.to_bytes(4, 'big')} if self.fec_recovered else {}
+
+    def write_chunk(self, sequence_number, flags, chunk):
+        """
+        Writes an in-order chunk at its offset in the output file, decompressing it first if it
+        is compressed. Decompression runs on the event loop, as it is much faster than compression.
+        Args:
+            sequence_number (int): The sequence number of the chunk.
+            flags (int): The flags of the data packet.
+            chunk (bytes): The payload of the data packet.
+        Returns:
+            bool: True if the chunk was written, False if it was corrupt and the connection was
+            dropped, or if the writer thread is behind and the chunk was dropped.
+        """
+        if flags & COMPRESSED_FLAG:
+            if self.codec is None:
+                self.log(f"Packet {sequence_number} is compressed, but no codec was negotiated, dropping the connection")
+                self.abort()
+                return False
+            try:
+                chunk = self.codec.decompress(chunk, self.chunk_size)
+            except ValueError as e:
+                self.log(f"Packet {sequence_number} does not decompress ({e}), dropping the connection")
+                self.abort()
+                return False
+            self.metrics.compressed_chunks += 1
+        if not self.writer.write(self.base_offset + (sequence_number - 1) * self.chunk_size, chunk):
+            # The writer thread falls behind the disk; the chunk is not acknowledged, so the client
+            # sends it again, rather than the event loop waiting on the disk for every connection
+            self.tracer.event(EV_DISCARD, self.proto.connection_id, sequence_number, 0, len(self.buffer), self.expected_sequence_number)
+            self.metrics.discarded += 1
+            return False
+        # The chunk is hashed before the receive buffer it points into is reused
+        if self.digest is not None:
+            self.digest.update_view(chunk)
+        self.total_file_size += len(chunk)
+        self.metrics.bytes_written += len(chunk)
+        if self.bitmap is not None:
+            self.bitmap.add(sequence_number - 1)
+            self.resume_dirty = True
+        return True
+
+    def advance(self):
+        """
+        Moves past the chunk just written and the chunks an earlier connection already received.
+        """
+        self.expected_sequence_number += 1
+        if self.bitmap is not None:
+            self.skip_received()
 
-def send_acknowledgement(sock, addr, sequence_number, acknowledgement_dictionary):
+    def skip_received(self):
+        """
+        Moves past the chunks an earlier connection already wrote, hashing them from the output file.
+        """
+        start = self.expected_sequence_number
+        while self.expected_sequence_number - 1 in self.bitmap:
+            self.expected_sequence_number += 1
+        if self.digest is not None and self.expected_sequence_number > start:
+            offset = (start - 1) * self.chunk_size
+            self.digest.update_from_file(offset, min((self.expected_sequence_number - 1) * self.chunk_size, self.file_size) - offset)
+
+    def is_complete(self, flags):
+        """
+        Args:
+            flags (int): The flags of the chunk just written.
+        Returns:
+            bool: True if the chunk was the last one, or every chunk has been received. When resuming,
+            the last chunk may have arrived over an earlier connection.
+        """
+        return bool(flags & FIN_FLAG) or self.bitmap is not None and self.expected_sequence_number > self.bitmap.count
+
+    def save_resume_state(self):
+        """
+        Saves the bitmap if chunks were written since the last save. The chunks it marks are
+        flushed to the output file first, on a worker thread, and the bitmap is taken now,
+        so it never marks a chunk that is not in the file yet.
+        """
+        if self.saving or not self.resume_dirty:
+            return
+        self.saving = True
+        self.resume_dirty = False
+        self.saved_at = time.monotonic()
+        saving = asyncio.get_running_loop().run_in_executor(None, self.store_resume_state, bytes(self.bitmap.bits))
+        saving.add_done_callback(self.on_resume_state_saved)
+
+    def store_resume_state(self, bits):
+        self.writer.flush()
+        self.resume_state.save(self.file_id, self.file_size, self.chunk_size, self.bitmap.count, bits)
+
+    def on_resume_state_saved(self, saving):
+        self.saving = False
+        if saving.exception() is not None:
+            self.log(f"Error saving {self.resume_state.path}: {saving.exception()}")
+
+    def finish(self):
+        """
+        Ends the data transfer. The output file is flushed and closed on a worker thread,
+        so a slow fsync does not hold up the other connections.
+        """
+        self.state = DATA_DONE
+        self.buffer.clear()
+        self.cancel_ack_timer()
+        self.metrics.sessions_completed += 1
+        loop = asyncio.get_running_loop()
+        closing = loop.run_in_executor(None, self.writer.close)
+        closing.add_done_callback(self.on_file_closed)
+        if self.digest is not None:
+            hashing = loop.run_in_executor(None, self.digest.digest)
+            hashing.add_done_callback(self.on_file_hashed)
+        self.rebuilding = self.sync or self.tree
+
+    def on_file_hashed(self, hashing):
+        if hashing.exception() is not None:
+            self.log(f"Error hashing {self.output_path}: {hashing.exception()}")
+            self.file_digest = b''
+        else:
+            self.file_digest = hashing.result()
+        if self.pending_fin is not None and self.fin_ready():
+            self.answer_fin(self.pending_fin)
+
+    def fin_ready(self):
+        """
+        Returns:
+            bool: True once the file is hashed and, for a delta, rebuilt, or for a tree, every file
+            is complete, so the FIN can be answered.
+        """
+        return (self.digest is None or self.file_digest is not None) and not self.rebuilding
+
+    def on_file_closed(self, closing):
+        if closing.exception() is not None:
+            self.log(f"Error writing {self.writer.path}: {closing.exception()}")
+            if self.sync or self.tree:
+                # The delta is incomplete, so the file is not rebuilt, or some files are missing;
+                # the digest of what arrived is not reported, so the client does not take it for a success
+                self.rebuilding = False
+                self.rebuild_failed = True
+                if self.pending_fin is not None and self.fin_ready():
+                    self.answer_fin(self.pending_fin)
+            return
+        if self.tree:
+            self.log(f'Wrote {self.writer.files_written} files to {self.output_path}')
+            self.rebuilding = False
+            if self.pending_fin is not None and self.fin_ready():
+                self.answer_fin(self.pending_fin)
+        if self.resume_state is not None:
+            self.resume_state.delete()
+        if self.sync:
+            rebuilding = asyncio.get_running_loop().run_in_executor(None, self.rebuild)
+            rebuilding.add_done_callback(self.on_rebuilt)
+        end_time = time.time()
+        throughput_mbps = calculate_throughput(end_time - self.start_time, self.total_file_size * 8)
+        self.log(f"The throughput is {throughput_mbps} Mbps")
+        if self.fec_packets is not None:
+            self.log(f"Rebuilt {self.fec_recovered} lost packets from parity")
+        if self.server.stats is not None:
+            self.server.stats.put({'worker': self.server.worker_id, 'bytes': self.total_file_size,
+                                   'start_time': self.start_time, 'end_time': end_time})
+        if self.group is not None:
+            self.group.stream_done(self, end_time)
+
+    def rebuild(self):
+        """
+        Rebuilds the file from the delta and the copy, next to the copy, then replaces the copy
+        with it and saves its index for the next sync. Runs on a worker thread.
+        Returns:
+            tuple: The size of the rebuilt file and its SHA-256 digest.
+        """
+        delta_path = self.output_path + DELTA_SUFFIX
+        temporary = self.output_path + '.tmp'
+        try:
+            chunks, digest = apply_delta(delta_path, self.output_path, self.base_chunks, temporary,
+                                         sync=self.args.fsync != 'none')
+        except ValueError:
+            # The copy is left as it was, but its index no longer describes it; dropping the index
+            # makes the next sync index the copy again, so the client's retry sends what it lacks
+            for path in (temporary, self.output_path + INDEX_SUFFIX):
+                try:
+                    os.unlink(path)
+                except FileNotFoundError:
+                    pass
+            raise
+        os.replace(temporary, self.output_path)
+        os.unlink(delta_path)
+        try:
+            save_index(self.output_path, chunks)
+        except OSError as e:
+            self.log(f"Error saving the index of {self.output_path}: {e}")
+        return sum(length for _, length in chunks), digest
+
+    def on_rebuilt(self, rebuilding):
+        self.rebuilding = False
+        if rebuilding.exception() is not None:
+            # The copy is left as it was; without a digest in the FIN ACK the client does not report success
+            self.log(f"Error rebuilding {self.output_path} from the delta: {rebuilding.exception()}")
+            self.rebuild_failed = True
+        else:
+            size, digest = rebuilding.result()
+            if self.checksum is not None:
+                self.file_digest = digest
+            self.metrics.sessions_synced += 1
+            self.log(f"Rebuilt {self.output_path}, {size} bytes, from a {self.total_file_size}-byte delta")
+        if self.pending_fin is not None and self.fin_ready():
+            self.answer_fin(self.pending_fin)
+
+    def handle_fin(self, data):
+        """
+        Answers the FIN after the last data packet, and the retransmissions of the client whose
+        ACK of the last data packet or FIN ACK was lost.
+        Args:
+            data (memoryview): The received datagram, valid until the next one is read.
+        """
+        packet = self.proto.parse(data)
+        if packet is None:
+            return
+        if self.ack_reply is not None and is_handshake_ack(packet):
+            # Every chunk was already received, and the resume answer was lost
+            self.send(self.ack_reply)
+            return
+        # The FIN has sequence number 0; a retransmission of the last data packet carries FIN_FLAG too
+        if packet[2] == FIN_FLAG and packet[0] == 0:
+            if not self.fin_ready():
+                # The last chunks are still being hashed, or the file rebuilt; the FIN is answered once
+                # they are, and a client that syncs is asked to wait, as rebuilding a large file takes a while
+                self.pending_fin = packet[3]
+                if self.rebuilding:
+                    self.send(self.proto.control_packet(DELTA_FLAG))
+                return
+            self.answer_fin(packet[3])
+            return
+
+        # The ACK of the last data packet was lost and the client is retransmitting it.
+        # Parity packets are not acknowledged
+        if not packet[2] & FEC_FLAG:
+            self.send(self.proto.ack_packet(self.expected_sequence_number - 1))
+
+    def answer_fin(self, options):
+        """
+        Sends the FIN ACK, with the digest of the file if it was hashed and matches the client's.
+        Args:
+            options (dict): The options of the FIN.
+        """
+        self.pending_fin = None
+        client_digest = options.get(OPT_DIGEST)
+        file_digest = None if self.rebuild_failed else self.file_digest
+        if client_digest and file_digest and client_digest != file_digest:
+            # A FIN ACK without a digest makes the client report the transfer as failed
+            file_digest = None
+        self.send(self.proto.control_packet(self.proto.fin_ack_flags, {OPT_DIGEST: file_digest} if file_digest else None))
+        if self.state == CLOSED:
+            return
+        self.log("FIN packet is received")
+        self.log("FIN ACK packet is sent")
+        if self.file_digest and client_digest:
+            if client_digest == self.file_digest:
+                self.log(f"File digest verified: {self.file_digest.hex()}")
+            else:
+                self.log(f"Error: {self.output_path} is corrupt, its digest is {self.file_digest.hex()} "
+                         f"and the client's is {client_digest.hex()}")
+                self.metrics.digest_mismatches += 1
+        self.log("Connection Closes")
+        self.state = CLOSED
+        self.server.release_output_path(self)
+
+    def abort(self, wait=False):
+        """
+        Drops the connection, closing the output file if it is still open and saving which
+        chunks it holds, so the client can resume the transfer. Closing waits for the writer
+        thread and may sync the file, so it is done on a worker thread.
+        Args:
+            wait (bool): Whether to close the file before returning, for a connection whose file
+                and saved chunks another connection takes over at once.
+        """
+        self.cancel_ack_timer()
+        if self.state == ESTABLISHED:
+            if self.digest is not None:
+                self.digest.close()
+            if wait:
+                self.close_file()
+            else:
+                asyncio.get_running_loop().run_in_executor(None, self.close_file)
+        self.state = CLOSED
+
+    def close_file(self):
+        """
+        Closes the output file of a dropped connection and saves which chunks it holds.
+        """
+        try:
+            self.writer.close()
+        except OSError as e:
+            self.log(f"Error writing {self.output_path}: {e}")
+        else:
+            self.close_resume_state()
+        if self.sync:
+            # A delta is not resumed, so the partial one is of no use
+            try:
+                os.unlink(self.writer.path)
+            except OSError:
+                pass
+
+    def close_resume_state(self):
+        if self.resume_state is None:
+            return
+        try:
+            self.resume_state.save(self.file_id, self.file_size, self.chunk_size, self.bitmap.count, self.bitmap.bits,
+                                   sync=self.args.fsync != 'none')
+            self.log(f"Saved the received chunks to {self.resume_state.path}")
+        except OSError as e:
+            self.log(f"Error saving {self.resume_state.path}: {e}")
+        self.resume_state.close()
+
+class StreamGroup:
     """
-    Sends an acknowledgement packet.
+    The streams of one striped transfer, which share a session ID and an output file.
     Args:
-        sock (socket): The socket to send data to.
-        addr (tuple): The address of the recipient.
-        sequence_number (int): The sequence number to acknowledge.
-        acknowledgement_dictionary (dict): A dictionary that maps sequence numbers to acknowledgements.
+        key (tuple): The client's IP address and the session ID.
+        count (int): The number of streams.
+        path (str): The output file.
     """
-    sock.sendto(acknowledgement_dictionary[sequence_number], addr)
-    print(f"{datetime.now().strftime('%H:%M:%S.%f')} -- sending ack for the received {sequence_number}")
 
+    def __init__(self, key, count, path):
+        self.key = key
+        self.count = count
+        self.path = path
+        self.sessions = set()
+        self.done = 0
+        self.total_bytes = 0
+        self.start_time = None
 
-def calculate_throughput(elapsed_time, file_size_bits):
+    def stream_done(self, session, end_time):
+        """
+        Counts a stream whose byte range is complete, and reports the transfer once all are.
+        Args:
+            session (Session): The stream.
+            end_time (float): When its file was closed.
+        """
+        self.done += 1
+        self.total_bytes += session.total_file_size
+        self.start_time = min(self.start_time or session.start_time, session.start_time)
+        if self.done == self.count:
+            throughput_mbps = calculate_throughput(end_time - self.start_time, self.total_bytes * 8)
+            session.log(f"All {self.count} streams of session {self.key[1]:08x} are received, {self.total_bytes} bytes "
+                        f"in {self.path}, the throughput is {throughput_mbps} Mbps")
+
+# ---------------- SERVER PROTOCOL ---------------- 
+# Demultiplexes the datagrams of all connections to their sessions
+
+class DRTPServerProtocol(asyncio.DatagramProtocol):
     """
-    Calculates the throughput of the transfer.
+    The DRTP server. Every datagram is handed to the session of its connection, found by the
+    client's address and, for version 2, the connection ID the server assigned in the SYN-ACK.
+    Version 1 headers have no connection ID, so a version 1 client is identified by its address alone.
     Args:
-        elapsed_time (float): The time it took to transfer the file.
-        file_size_bits (int): The size of the file in bits.
-    Returns:
-        float: The throughput of the transfer in Mbps.
+        args (argparse.Namespace): The command line arguments.
+        worker_id (int): The number of the worker process, or None if the server runs in one process.
+        stats (multiprocessing.Queue): Where the statistics of finished transfers are reported, or None.
     """
-    throughput = file_size_bits / elapsed_time
-    throughput_mbps = round(throughput / 1000000, 2)
-    return throughput_mbps
 
+    def __init__(self, args, worker_id=None, stats=None):
+        self.args = args
+        self.worker_id = worker_id
+        self.stats = stats
+        tag = None if worker_id is None else f'worker{worker_id}'
+        self.tracer = open_tracer(args, tag)
+        self.metrics = ServerMetrics(self.gauges)
+        self.reporter = open_reporter(args, self.metrics, tag)
+        self.transport = None
+        self.sessions = {}      # (address, connection ID) -> Session
+        self.pending = {}       # address -> Session in the handshake, to answer retransmitted SYNs
+        self.output_paths = {}   # output path -> Session or StreamGroup writing it
+        self.stream_groups = {}  # (client IP address, session ID) -> StreamGroup
+        self.session_count = 0
+        self.features = SUPPORTED_FEATURES & ~FEATURE_RESUME if args.no_resume else SUPPORTED_FEATURES
 
-def handle_fin(sock, buffer_size, throughput_mbps):
-    """
-    Handles a FIN packet.
-    Args:
-        sock (socket): The socket to receive data from and send data to.
-        buffer_size (int): The maximum amount of data to be received at once.
-        throughput_mbps (float): The throughput of the transfer.
-    """
-    data, addr = sock.recvfrom(buffer_size)
-    _, _, flags = struct.unpack(header_format, data)
-    if flags == FIN_FLAG:
-        print("\nFIN packet is received")
-        ack_header = struct.pack(header_format, 0, 0, ACK_FLAG)
-        sock.sendto(ack_header, addr)
-        print("FIN ACK packet is sent")
-        print(f"\nThe throughput is {throughput_mbps} Mbps")
-        print("Connection Closes")
-        sock.close()
+    def connection_made(self, transport):
+        self.transport = transport
 
-# ---------------- MAIN SERVER FUNCTION ---------------- 
-# This function starts a UDP server and handles file transfer from a client.
+    def offered_features(self):
+        """
+        Returns:
+            int: The optional features offered to a connection. A tree is written into a directory
+            inside --output, so directory transfers are only offered while --output is a directory,
+            and the client reports that instead of waiting for a server that cannot write them.
+        """
+        if os.path.isdir(self.args.output):
+            return self.features
+        return self.features & ~FEATURE_TREE
 
-def server(args):
+    def datagram_received(self, data, addr):
+        session = self.sessions.get((addr, 0))
+        if session is None and len(data) >= HEADER_V2.size and data[0] == HEADER_V2.version:
+            session = self.sessions.get((addr, HeaderV2.connection_id_of(data)))
+        if session is not None:
+            session.handle_packet(data)
+            return
 
-    # Extract the IP, port, and sequence to discard from the argument parser
-    UDP_IP = args.ip
-    UDP_PORT = args.port
-    DISCARD_SEQ = args.discard
+        # A new connection starts with a SYN. A version 2 client puts its DRTP version in the
+        # acknowledgment number field of the SYN, which is a version 1 header
+        if len(data) != HEADER_V1.size:
+            return
+        _, version, flags = struct.unpack(header_format, data)
+        if flags != SYN_FLAG:
+            return
+        if addr in self.pending:
+            self.pending[addr].send_syn_ack()
+            return
+        if len(self.sessions) >= self.args.max_sessions:
+            print(f"SYN from {addr[0]}:{addr[1]} is dropped, {len(self.sessions)} connections are open")
+            return
 
-    try:
-        print(f'Server started on IP: {UDP_IP} and port: {UDP_PORT}')  
+        proto = HeaderV2(self.new_connection_id()) if version >= HEADER_V2.version else HEADER_V1
+        session = Session(self, addr, proto)
+        self.sessions[session.key] = session
+        self.pending[addr] = session
+        session.log(f"SYN packet is received (DRTP version {proto.version})")
+        session.send_syn_ack()
 
-        # Create a UDP socket and bind it to the IP and port
-        sock = init_socket(UDP_IP, UDP_PORT)
+    def gauges(self):
+        """
+        Returns:
+            dict: The number of open connections.
+        """
+        return {'active_sessions': len(self.sessions)}
 
-        # Initialize variables for the data transfer
-        data_received = False
-        ack_dict = {} 
-        expected_sequence_number = 1
-        buffer = {}  
-        file_chunks = []  
-        file_transfer_complete = False  
-        header_size = struct.calcsize(header_format)
+    def error_received(self, exc):
+        # ICMP errors, such as port unreachable from a client that went away, are not fatal for the server
+        pass
 
-        while True: 
-            try:
-                # Receive data and check for flags
-                data, addr = receive_data(sock, BUFFER_SIZE)
-                _, _, flags = struct.unpack(header_format, data)
-
-                # If the flag is SYN, handle connection establishment
-                if flags == SYN_FLAG:
-                    handle_syn(sock, addr)
-
-                    # Wait for ACK from client to establish connection
-                    data, addr = receive_data(sock, BUFFER_SIZE)
-                    _, _, flags = struct.unpack(header_format, data)
-                    if flags == ACK_FLAG:
-                        print('ACK packet is received')
-                        print('Connection Established\n')
-
-                        # Start receiving data
-                        start_time = time.time()
-                        data_received = True
-
-                        while True:
-                            data, addr = receive_data(sock, BUFFER_SIZE)
-                            sequence_number, _, flags, chunk = parse_data(data, header_size)
-
-                            # Create an ACK for this sequence number if it doesn't already exist
-                            if sequence_number not in ack_dict:
-                                ack_dict[sequence_number] = struct.pack('!HHH', sequence_number, 0, 0)
-
-                            # Handle the incoming data based on its sequence number
-                            if sequence_number == DISCARD_SEQ:
-                                print(f"{datetime.now().strftime('%H:%M:%S.%f')} -- Discarding packet with sequence number {DISCARD_SEQ}")
-                                DISCARD_SEQ = float('inf')  
-                            elif sequence_number == expected_sequence_number:
-                                print(f"{datetime.now().strftime('%H:%M:%S.%f')} -- packet {sequence_number} is received")
-                                file_chunks.append(chunk)  
-                                send_acknowledgement(sock, addr, sequence_number, ack_dict)
-                                expected_sequence_number += 1
-                                
-                                # If last packet, break the loop
-                                if flags == FIN_FLAG:  
-                                    file_transfer_complete = True  
-                                    break
-
-                                # Process any buffered packets with sequence numbers that match the expected one
-                                while expected_sequence_number in buffer:
-                                    data = buffer.pop(expected_sequence_number)
-                                    sequence_number, _, flags, chunk = parse_data(data, header_size)
-                                    file_chunks.append(chunk)  
-                                    expected_sequence_number += 1
-                            elif sequence_number < expected_sequence_number or sequence_number in buffer:
-                                continue
-                            else:
-                                # If the packet is out of order, buffer it for later
-                                buffer[sequence_number] = data
-                                print(f"{datetime.now().strftime('%H:%M:%S.%f')} -- out-of-order packet {sequence_number} is received")
-                        # If the file transfer is complete, break the loop
-                        if file_transfer_complete:
-                            break  
-
-            except KeyboardInterrupt:
-                print("\nServer interrupted by user. Shutting down...")
-                break
-
-        # If data was received, process it and calculate the throughput
-        if data_received:
-            end_time = time.time()
-            elapsed_time = end_time - start_time
-            total_file_size = sum(len(chunk) for chunk in file_chunks)  
-            file_size_bits = total_file_size * 8
-            throughput_mbps = calculate_throughput(elapsed_time, file_size_bits)
-            write_chunks_to_file(file_chunks)
-            handle_fin(sock, BUFFER_SIZE, throughput_mbps)  
-            
+    def new_connection_id(self):
+        """
+        Returns a random connection ID that no open connection uses. IDs are random so a stray
+        packet of an earlier connection from the same address is not taken for a new one.
+        """
+        while True:
+            connection_id = random.getrandbits(32)
+            if connection_id and all(key[1] != connection_id for key in self.sessions):
+                return connection_id
+
+    def claim_output_path(self, file_name, owner, session_id=None):
+        """
+        Chooses the output file of a connection. If --output is a directory, the file keeps the
+        name the client announced; otherwise --output is used, with the connection number added
+        when another connection is already writing to it. Worker processes cannot see each
+        other's connections, so each worker also adds its number to the file name, in both cases,
+        or the session ID for a striped transfer, whose streams may reach different workers.
+        Args:
+            file_name (str): The name the client announced, empty for version 1 clients.
+            owner (Session or StreamGroup): What writes the file.
+            session_id (int): The session ID of a striped transfer, None for a single connection.
+        Returns:
+            str: The path to write to.
+        """
+        self.session_count += 1
+        file_name = os.path.basename(file_name)
+        if os.path.isdir(self.args.output):
+            if file_name in ('', '.', '..'):
+                file_name = f'received_file_{self.session_count}'
+            path = os.path.join(self.args.output, file_name)
+        else:
+            path = self.args.output
+        if self.worker_id is not None:
+            stem, extension = os.path.splitext(path)
+            tag = f'worker{self.worker_id}' if session_id is None else f'{session_id:08x}'
+            path = f'{stem}-{tag}{extension}'
+        if path in self.output_paths:
+            stem, extension = os.path.splitext(path)
+            path = f'{stem}-{self.session_count}{extension}'
+        self.output_paths[path] = owner
+        return path
+
+    def release_output_path(self, session):
+        # The file of a striped transfer is released with its last stream
+        if self.output_paths.get(session.output_path) is session:
+            del self.output_paths[session.output_path]
+
+    def join_stream_group(self, session, file_name, stream):
+        """
+        Adds a connection to the striped transfer it belongs to, starting the transfer if it is the first stream.
+        Args:
+            session (Session): The connection.
+            file_name (str): The name the client announced.
+            stream (tuple): The session ID, stream index, stream count and byte offset from the stream option.
+        Returns:
+            StreamGroup: The transfer.
+        """
+        key = (session.addr[0], stream[0])
+        group = self.stream_groups.get(key)
+        if group is None:
+            group = StreamGroup(key, stream[2], None)
+            group.path = self.claim_output_path(file_name, group, stream[0])
+            self.stream_groups[key] = group
+        group.sessions.add(session)
+        return group
+
+    def drop_stale_session(self, session):
+        """
+        Drops the connection of an earlier transfer of the same file from the same host, whose
+        client went away without the server noticing yet, so its output file and saved chunks
+        can be taken over.
+        Args:
+            session (Session): The new connection.
+        """
+        for other in list(self.sessions.values()):
+            if (other is not session and other.state == ESTABLISHED and other.file_id == session.file_id
+                    and other.addr[0] == session.addr[0]):
+                other.log("The client reconnected to resume the transfer, dropping this connection")
+                self.metrics.sessions_dropped += 1
+                other.abort(wait=True)
+                self.remove(other)
+
+    def remove(self, session):
+        """
+        Forgets a connection.
+        Args:
+            session (Session): The connection.
+        """
+        self.sessions.pop(session.key, None)
+        if self.pending.get(session.addr) is session:
+            del self.pending[session.addr]
+        self.release_output_path(session)
+        group = session.group
+        if group is not None:
+            group.sessions.discard(session)
+            if not group.sessions and self.stream_groups.get(group.key) is group:
+                del self.stream_groups[group.key]
+                if self.output_paths.get(group.path) is group:
+                    del self.output_paths[group.path]
+
+    async def reap_sessions(self):
+        """
+        Periodically forgets closed connections once they stopped lingering, drops
+        connections whose client has been silent for longer than the idle timeout and
+        saves the received chunks of resumable transfers.
+        """
+        while True:
+            await asyncio.sleep(REAPER_INTERVAL)
+            now = time.monotonic()
+            for session in list(self.sessions.values()):
+                idle = now - session.last_activity
+                if session.state == CLOSED and idle > CLOSE_LINGER:
+                    self.remove(session)
+                elif idle > self.args.idle_timeout:
+                    session.log(f"No packet for {idle:.1f} seconds, dropping the connection")
+                    self.metrics.sessions_dropped += 1
+                    session.abort()
+                    self.remove(session)
+                elif session.state == ESTABLISHED and session.resume_state is not None and now - session.saved_at >= RESUME_SAVE_INTERVAL:
+                    session.save_resume_state()
+
+    def close(self):
+        """
+        Drops all connections, closing their output files, and flushes the trace.
+        """
+        for session in list(self.sessions.values()):
+            session.abort()
+            self.remove(session)
+        self.tracer.close()
+        if self.reporter is not None:
+            self.reporter.close()
+
+# ---------------- MAIN SERVER FUNCTION ---------------- 
+# This function starts a UDP server and handles file transfers from many clients at once.
+
+async def serve(args, worker_id=None, stats=None):
+    """
+    Serves connections until the task is cancelled.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        worker_id (int): The number of the worker process, or None if the server runs in one process.
+        stats (multiprocessing.Queue): Where the statistics of finished transfers are reported, or None.
+    """
+    loop = asyncio.get_running_loop()
+    sock = init_socket(args.ip, args.port, reuse_port=worker_id is not None)
+    sock.setblocking(False)
+    protocol = DRTPServerProtocol(args, worker_id, stats)
+    # asyncio reads with recvfrom, which allocates every datagram and cannot split GRO runs,
+    # so the reader receives into its own buffer
+    transport = ReaderTransport(loop, sock, protocol, DatagramReader(sock, args.max_segment, gro=args.fastpath))
+    try:
+        await protocol.reap_sessions()
+    finally:
+        protocol.close()
+        transport.close()
+
+
+def server(args):
+    """
+    Starts a UDP server that receives files from many clients at once.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+    """
+    try:
+        print(f'Server started on IP: {args.ip} and port: {args.port}')
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        print("\nServer interrupted by user. Shutting down...")
     except Exception as e:
         print(f"An error occurred: {e}")
     pass
@@ -0,0 +1,174 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities, the server and the modules used to run it in several processes
+from utils import *
+from server import serve, calculate_throughput
+import asyncio
+import multiprocessing
+import queue
+import signal
+
+# ---------------- WORKER PROCESSES ---------------- 
+# One Python process only ever uses one core. With --workers N the supervisor starts N server
+# processes that bind the same port with SO_REUSEPORT, and the kernel spreads the flows across
+# them by hashing their addresses, so every packet of a connection reaches the same worker.
+# The supervisor restarts workers that crash and adds up the statistics they report.
+
+async def watch_supervisor(task):
+    """
+    Cancels the worker once the supervisor is gone, so a supervisor that was killed does not
+    leave workers behind that keep the port bound.
+    Args:
+        task (asyncio.Task): The task that serves the connections of the worker.
+    """
+    # The workers started later inherit the pipe behind parent_process().is_alive(), so the
+    # worker is re-parented instead
+    supervisor = multiprocessing.parent_process().pid
+    while os.getppid() == supervisor:
+        await asyncio.sleep(SUPERVISOR_INTERVAL)
+    task.cancel()
+
+
+async def run_worker(args, worker_id, stats):
+    """
+    Serves connections in a worker process until the supervisor sends SIGTERM or exits.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        worker_id (int): The number of the worker.
+        stats (multiprocessing.Queue): Where the statistics of finished transfers are reported.
+    """
+    task = asyncio.current_task()
+    asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+    watcher = asyncio.create_task(watch_supervisor(task))
+    try:
+        await serve(args, worker_id, stats)
+    finally:
+        watcher.cancel()
+
+
+def worker_main(args, worker_id, stats):
+    """
+    The entry point of a worker process.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        worker_id (int): The number of the worker.
+        stats (multiprocessing.Queue): Where the statistics of finished transfers are reported.
+    """
+    # Ctrl-C reaches the whole process group, but only the supervisor decides when to stop
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        asyncio.run(run_worker(args, worker_id, stats))
+    except asyncio.CancelledError:
+        pass
+
+
+class Supervisor:
+    """
+    Starts the worker processes, restarts the ones that exit and aggregates their statistics.
+    Restarting a worker changes which socket the kernel hashes some flows to, so connections
+    that were in progress on a crashed worker are lost and their clients time out.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+    """
+
+    def __init__(self, args):
+        self.args = args
+        self.stats = multiprocessing.Queue()
+        self.workers = {}     # worker number -> Process
+        self.restart_at = {}  # worker number -> when the crashed worker is started again
+        self.restarts = 0
+        self.sessions = 0
+        self.total_bytes = 0
+        self.first_start = None
+        self.last_end = None
+
+    def start_worker(self, worker_id):
+        process = multiprocessing.Process(target=worker_main, args=(self.args, worker_id, self.stats),
+                                          name=f'drtp-worker-{worker_id}', daemon=True)
+        process.start()
+        self.workers[worker_id] = process
+
+    def run(self):
+        """
+        Supervises the workers until the user presses Ctrl-C or the supervisor receives SIGTERM.
+        """
+        signal.signal(signal.SIGTERM, self.on_sigterm)
+        for worker_id in range(self.args.workers):
+            self.start_worker(worker_id)
+        print(f'Server started on IP: {self.args.ip} and port: {self.args.port} with {self.args.workers} workers')
+        try:
+            while True:
+                self.collect(SUPERVISOR_INTERVAL)
+                self.check_workers()
+        except KeyboardInterrupt:
+            print("\nServer interrupted by user. Shutting down...")
+        except SystemExit:
+            print("\nServer terminated. Shutting down...")
+        finally:
+            # A second Ctrl-C or SIGTERM must not leave the workers behind
+            signal.signal(signal.SIGINT, signal.SIG_IGN)
+            signal.signal(signal.SIGTERM, signal.SIG_IGN)
+            self.stop()
+            self.collect(0)
+            self.report()
+
+    def on_sigterm(self, signum, frame):
+        """
+        Stops the supervisor on SIGTERM the way Ctrl-C does, so the workers are stopped and the
+        statistics reported before it exits.
+        """
+        raise SystemExit(0)
+
+    def collect(self, timeout):
+        """
+        Adds up the statistics the workers reported.
+        Args:
+            timeout (float): How long to wait for the first report, in seconds.
+        """
+        try:
+            report = self.stats.get(timeout=timeout) if timeout else self.stats.get_nowait()
+            while True:
+                self.sessions += 1
+                self.total_bytes += report['bytes']
+                self.first_start = min(self.first_start or report['start_time'], report['start_time'])
+                self.last_end = max(self.last_end or report['end_time'], report['end_time'])
+                report = self.stats.get_nowait()
+        except queue.Empty:
+            pass
+
+    def check_workers(self):
+        """
+        Restarts the workers that exited, after WORKER_RESTART_DELAY so a worker that fails
+        on start does not spin.
+        """
+        now = time.monotonic()
+        for worker_id, process in self.workers.items():
+            if process.is_alive():
+                continue
+            if worker_id not in self.restart_at:
+                print(f"Worker {worker_id} exited with code {process.exitcode}, restarting it")
+                self.restart_at[worker_id] = now + WORKER_RESTART_DELAY
+            elif now >= self.restart_at[worker_id]:
+                del self.restart_at[worker_id]
+                self.restarts += 1
+                self.start_worker(worker_id)
+
+    def stop(self):
+        """
+        Asks the workers to close their connections and waits for them to exit.
+        """
+        for process in self.workers.values():
+            if process.is_alive():
+                process.terminate()
+        for process in self.workers.values():
+            process.join(WORKER_RESTART_DELAY)
+            if process.is_alive():
+                process.kill()
+
+    def report(self):
+        """
+        Prints the aggregate statistics of all workers.
+        """
+        print(f"\n{self.sessions} transfers received, {self.total_bytes} bytes, {self.restarts} worker restarts")
+        if self.sessions and self.last_end > self.first_start:
+            throughput_mbps = calculate_throughput(self.last_end - self.first_start, self.total_bytes * 8)
+            print(f"The aggregate throughput is {throughput_mbps} Mbps")
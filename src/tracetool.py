@@ -0,0 +1,111 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities and the trace format
+from utils import *
+from tracing import *
+import csv
+import sys
+
+# ---------------- TRACE DECODING ---------------- 
+# Decodes a binary trace written with --trace-level into a readable timeline, and writes the data
+# for sequence/ack plots: the time of every send, retransmission and ACK with its sequence number.
+
+# Client events carry the packets in flight and the congestion window, server events the number
+# of buffered packets and the expected sequence number
+CLIENT_EVENTS = {EV_SEND, EV_ACK, EV_RETRANSMIT, EV_FAST_RETRANSMIT, EV_TIMEOUT, EV_CONGESTION}
+
+# The events that make up the sequence/ack plot, and the field that is plotted for each
+PLOT_SERIES = {EV_SEND: ('send', 'seq'), EV_RETRANSMIT: ('retransmit', 'seq'), EV_FAST_RETRANSMIT: ('retransmit', 'seq'),
+               EV_ACK: ('ack', 'ack'), EV_RECEIVE: ('receive', 'seq'), EV_OUT_OF_ORDER: ('out-of-order', 'seq'),
+               EV_ACK_SENT: ('ack', 'ack')}
+
+
+def read_trace(path):
+    """
+    Reads the events of a trace file.
+    Args:
+        path (str): The trace file.
+    Returns:
+        tuple: The wall-clock time the trace started and a list of events as dictionaries.
+    """
+    with open(path, 'rb') as trace:
+        magic, start_time, event_size = trace_header.unpack(trace.read(trace_header.size))
+        if magic != TRACE_MAGIC or event_size != trace_event.size:
+            raise ValueError(f"{path} is not a DRTP trace")
+        data = trace.read()
+    events = []
+    for offset in range(0, len(data) - event_size + 1, event_size):
+        nanoseconds, kind, connection_id, seq, ack, in_flight, window = trace_event.unpack_from(data, offset)
+        events.append({'time': nanoseconds / 1e9, 'kind': kind, 'connection': connection_id, 'seq': seq,
+                       'ack': ack, 'in_flight': in_flight, 'window': window})
+    return start_time, events
+
+
+def format_event(start_time, event):
+    """
+    Formats an event as a timeline line.
+    Args:
+        start_time (float): The wall-clock time the trace started.
+        event (dict): The event.
+    Returns:
+        str: The line.
+    """
+    clock = datetime.fromtimestamp(start_time + event['time']).strftime('%H:%M:%S.%f')
+    name = EVENT_NAMES.get(event['kind'], f"EVENT{event['kind']}")
+    if event['kind'] == EV_DROPPED:
+        return f"{clock} +{event['time']:.6f} #{event['connection']} {name} {event['seq']} events lost"
+    if event['kind'] in CLIENT_EVENTS:
+        state = f"in_flight={event['in_flight']} cwnd={event['window']}"
+    else:
+        state = f"buffered={event['in_flight']} expected={event['window']}"
+    return f"{clock} +{event['time']:.6f} #{event['connection']} {name} seq={event['seq']} ack={event['ack']} {state}"
+
+
+def write_plot(events, path):
+    """
+    Writes the sequence/ack plot data as CSV with the columns time, connection, series and value.
+    Args:
+        events (list): The events.
+        path (str): The CSV file.
+    """
+    with open(path, 'w', newline='') as output:
+        writer = csv.writer(output)
+        writer.writerow(['time', 'connection', 'series', 'value'])
+        for event in events:
+            if event['kind'] in PLOT_SERIES:
+                series, field = PLOT_SERIES[event['kind']]
+                writer.writerow([f"{event['time']:.6f}", event['connection'], series, event[field]])
+
+
+def main():
+    """
+    Decodes the trace file given on the command line.
+    """
+    parser = argparse.ArgumentParser(description='Decode a DRTP event trace')
+    parser.add_argument('trace', help='Trace file written with --trace-level')
+    parser.add_argument('--plot', type=str, help='Write sequence/ack plot data to this CSV file')
+    parser.add_argument('--connection', type=int, help='Only show the events of this connection ID')
+    parser.add_argument('--quiet', '-q', action='store_true', help='Do not print the timeline')
+    args = parser.parse_args()
+
+    try:
+        start_time, events = read_trace(args.trace)
+    except (OSError, ValueError, struct.error) as e:
+        print(f"Error reading {args.trace}: {e}")
+        sys.exit(1)
+    if args.connection is not None:
+        events = [event for event in events if event['connection'] == args.connection]
+    if not args.quiet:
+        for event in events:
+            print(format_event(start_time, event))
+    counts = {}
+    for event in events:
+        name = EVENT_NAMES.get(event['kind'], f"EVENT{event['kind']}")
+        counts[name] = counts.get(name, 0) + 1
+    print(f"{len(events)} events: " + ', '.join(f"{name} {count}" for name, count in sorted(counts.items())))
+    if args.plot:
+        write_plot(events, args.plot)
+        print(f"Plot data written to {args.plot}")
+
+# ---------------- SCRIPT ENTRY POINT ---------------- 
+if __name__ == "__main__":
+    main()
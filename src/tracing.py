@@ -0,0 +1,161 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities and the modules used by the background flush thread
+from utils import *
+import threading
+
+# ---------------- EVENT TRACING ---------------- 
+# Formatting a line and writing it to the terminal for every packet costs more than sending the
+# packet. Instead, the client and the server record fixed-size binary events into a preallocated
+# ring buffer, which a background thread flushes to a trace file. Tracing is off by default;
+# --trace-level events records losses and retransmissions, --trace-level packets every packet.
+# tracetool.py decodes a trace file into a timeline and sequence/ack plot data.
+TRACE_OFF = 0
+TRACE_EVENTS = 1
+TRACE_PACKETS = 2
+
+# Event types
+EV_SEND = 1             # Client sent a new data packet
+EV_ACK = 2              # Client received an ACK
+EV_RETRANSMIT = 3       # Client retransmitted a packet after a timeout
+EV_FAST_RETRANSMIT = 4  # Client retransmitted a hole reported by SACK
+EV_TIMEOUT = 5          # Client's retransmission timer expired
+EV_CONGESTION = 6       # Client's congestion controller reduced the window
+EV_RECEIVE = 7          # Server received an in-order data packet
+EV_OUT_OF_ORDER = 8     # Server buffered an out-of-order data packet
+EV_DUPLICATE = 9        # Server received a packet it already had
+EV_ACK_SENT = 10        # Server sent an ACK
+EV_DISCARD = 11         # Server discarded a packet on purpose (--discard) or because its reorder buffer was full
+EV_DROPPED = 12         # The ring buffer was full and this many events were lost
+EV_CORRUPT = 13         # Server dropped a data packet whose CRC did not match, and NACKed it
+EV_NACK = 14            # Client retransmitted a packet the server NACKed
+EV_FEC_RECOVER = 15     # Server rebuilt a lost data packet from a parity packet
+
+EVENT_NAMES = {EV_SEND: 'SEND', EV_ACK: 'ACK', EV_RETRANSMIT: 'RETRANSMIT', EV_FAST_RETRANSMIT: 'FAST_RETRANSMIT',
+               EV_TIMEOUT: 'TIMEOUT', EV_CONGESTION: 'CONGESTION', EV_RECEIVE: 'RECEIVE',
+               EV_OUT_OF_ORDER: 'OUT_OF_ORDER', EV_DUPLICATE: 'DUPLICATE', EV_ACK_SENT: 'ACK_SENT',
+               EV_DISCARD: 'DISCARD', EV_DROPPED: 'DROPPED', EV_CORRUPT: 'CORRUPT', EV_NACK: 'NACK',
+               EV_FEC_RECOVER: 'FEC_RECOVER'}
+
+# Every event is 32 bytes: nanoseconds since the trace started, event type, connection ID, sequence
+# number, acknowledgment number, and the window state: packets in flight and congestion window on
+# the client, buffered packets and expected sequence number on the server
+trace_event = struct.Struct('<QB3xIIIII')
+# The file starts with a magic string, the wall-clock start time and the size of an event
+trace_header = struct.Struct('<8sdI4x')
+TRACE_MAGIC = b'DRTPTRC1'
+
+
+class Tracer:
+    """
+    Records binary events into a ring buffer that a background thread writes to a file.
+    Recording never blocks: if the flush thread falls a whole buffer behind, events are dropped
+    and an EV_DROPPED event with their number is recorded once there is room again.
+    A Tracer created without a path is disabled and its methods return at once.
+    Args:
+        path (str): The trace file, None to disable tracing.
+        level (int): TRACE_EVENTS to record losses and retransmissions, TRACE_PACKETS to also record every packet.
+        capacity (int): The number of events the ring buffer holds.
+    """
+
+    def __init__(self, path=None, level=TRACE_OFF, capacity=TRACE_CAPACITY):
+        self.level = level if path is not None else TRACE_OFF
+        if self.level == TRACE_OFF:
+            return
+        self.file = open(path, 'wb')
+        self.file.write(trace_header.pack(TRACE_MAGIC, time.time(), trace_event.size))
+        self.start = time.monotonic_ns()
+        self.capacity = capacity
+        self.ring = bytearray(capacity * trace_event.size)
+        self.head = 0      # Events recorded, only advanced by the recording thread
+        self.tail = 0      # Events flushed, only advanced by the flush thread
+        self.dropped = 0
+        self.stopped = False
+        self.wakeup = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def packet(self, kind, connection_id, seq, ack=0, in_flight=0, window=0):
+        """
+        Records a per-packet event, if the level is TRACE_PACKETS.
+        Args:
+            kind (int): The event type.
+            connection_id (int): The connection ID.
+            seq (int): The sequence number.
+            ack (int): The acknowledgment number.
+            in_flight (int): Packets in flight (client) or buffered out of order (server).
+            window (int): The congestion window (client) or the expected sequence number (server).
+        """
+        if self.level >= TRACE_PACKETS:
+            self._record(kind, connection_id, seq, ack, in_flight, window)
+
+    def event(self, kind, connection_id, seq, ack=0, in_flight=0, window=0):
+        """
+        Records a loss or retransmission event, if tracing is on. Takes the same arguments as packet.
+        """
+        if self.level >= TRACE_EVENTS:
+            self._record(kind, connection_id, seq, ack, in_flight, window)
+
+    def close(self):
+        """
+        Flushes the remaining events and closes the trace file.
+        """
+        if self.level == TRACE_OFF:
+            return
+        self.stopped = True
+        self.wakeup.set()
+        self.thread.join()
+        self._flush()
+        self.file.close()
+        self.level = TRACE_OFF
+
+    def _record(self, kind, connection_id, seq, ack, in_flight, window):
+        if self.head - self.tail >= self.capacity - 1:
+            self.dropped += 1
+            return
+        now = time.monotonic_ns() - self.start
+        if self.dropped:
+            trace_event.pack_into(self.ring, self.head % self.capacity * trace_event.size,
+                                  now, EV_DROPPED, connection_id, self.dropped, 0, 0, 0)
+            self.head += 1
+            self.dropped = 0
+        # Values are masked so a window state that does not fit cannot break recording
+        trace_event.pack_into(self.ring, self.head % self.capacity * trace_event.size, now, kind,
+                              connection_id & 0xFFFFFFFF, seq & 0xFFFFFFFF, ack & 0xFFFFFFFF,
+                              min(in_flight, 0xFFFFFFFF), min(int(window), 0xFFFFFFFF))
+        self.head += 1
+        if self.head - self.tail >= self.capacity // 2:
+            self.wakeup.set()
+
+    def _flush(self):
+        head = self.head
+        while self.tail < head:
+            start = self.tail % self.capacity
+            end = min(start + head - self.tail, self.capacity)
+            self.file.write(self.ring[start * trace_event.size:end * trace_event.size])
+            self.tail += end - start
+
+    def _run(self):
+        while not self.stopped:
+            self.wakeup.wait(TRACE_FLUSH_INTERVAL)
+            self.wakeup.clear()
+            self._flush()
+
+
+def open_tracer(args, tag=None):
+    """
+    Creates the tracer asked for on the command line.
+    Args:
+        args (argparse.Namespace): The command line arguments.
+        tag (str): Added to the trace file name, so that the processes of --workers and --streams
+            write separate files.
+    Returns:
+        Tracer: The tracer, disabled if --trace-level is off.
+    """
+    level = TRACE_LEVELS.index(args.trace_level)
+    if level == TRACE_OFF:
+        return Tracer()
+    path = args.trace_file
+    if tag is not None:
+        stem, extension = os.path.splitext(path)
+        path = f'{stem}-{tag}{extension}'
+    return Tracer(path, level)
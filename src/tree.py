@@ -0,0 +1,343 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities and the writer the tree writer builds on
+from utils import *
+from writer import FileWriter
+import bisect
+import glob
+import stat
+import threading
+
+# ---------------- DIRECTORY TRANSFERS ---------------- 
+# When --file names a directory or a glob pattern, the client sends every file over one connection
+# instead of one connection per file. It sends a single byte stream: a manifest with the name,
+# size, modification time and permissions of every file, followed by the contents of the files,
+# one after the other. The stream is cut into chunks like a file, so small files share datagrams
+# and the window keeps sliding across file boundaries without waiting for the end of a file. The
+# server receives the stream in order and writes every range of it to its file under the output
+# directory, so the stream itself is never stored. Only files are listed, so a directory that holds
+# no file, directly or below it, is not created on the server.
+
+# The manifest starts with a magic string, the number of files and the length of the entries that
+# follow; every entry holds the size, modification time and mode of a file and the length of its
+# name, followed by the name, relative to the directory, with / between its components
+manifest_header = struct.Struct('!8sIQ')
+manifest_entry = struct.Struct('!QqIH')
+MANIFEST_MAGIC = b'DRTPTRE1'
+
+
+def is_tree(pattern):
+    """
+    Args:
+        pattern (str): The --file argument.
+    Returns:
+        bool: True if it names a directory or is a glob pattern rather than a file.
+    """
+    return not os.path.isfile(pattern) and (os.path.isdir(pattern) or glob.escape(pattern) != pattern)
+
+
+class Tree:
+    """
+    The files to send for a directory or a glob pattern, and the manifest that describes them.
+    Files that are not regular files are skipped, and symbolic links are followed. Directories
+    are not listed, so empty ones are not sent.
+    Args:
+        pattern (str): A directory, whose files are sent with their paths relative to it, or a
+            glob pattern, whose matches are sent with their paths relative to the deepest directory
+            that holds them all. ** matches any number of directories.
+    Attributes:
+        name (str): The name announced to the server, that of the directory.
+        files (list): (name, path, size) of every file, in the order they are sent.
+        manifest (bytes): The manifest.
+        size (int): The length of the stream, the manifest and the contents of every file.
+        offsets (list): Where the contents of every file start in the stream.
+    Raises:
+        OSError: If a file cannot be read.
+        ValueError: If the pattern matches no file.
+    """
+
+    def __init__(self, pattern):
+        if os.path.isdir(pattern):
+            root, paths = pattern, [pattern]
+        else:
+            paths = sorted(glob.glob(pattern, recursive=True))
+            if not paths:
+                raise ValueError(f'{pattern} matches no file')
+            root = os.path.commonpath([os.path.dirname(os.path.abspath(path)) for path in paths])
+        self.name = os.path.basename(os.path.abspath(root)) or 'files'
+
+        # Directories are walked in sorted order, so the same tree is always sent the same way
+        entries = {}
+        for path in paths:
+            if os.path.isdir(path):
+                for directory, subdirectories, names in os.walk(path):
+                    subdirectories.sort()
+                    for name in sorted(names):
+                        self.add(entries, root, os.path.join(directory, name))
+            else:
+                self.add(entries, root, path)
+
+        self.files = []
+        encoded = []
+        for name, (path, status) in entries.items():
+            name_bytes = name.encode()
+            encoded.append(manifest_entry.pack(status.st_size, status.st_mtime_ns, stat.S_IMODE(status.st_mode), len(name_bytes)) + name_bytes)
+            self.files.append((name, path, status.st_size))
+        body = b''.join(encoded)
+        self.manifest = manifest_header.pack(MANIFEST_MAGIC, len(self.files), len(body)) + body
+        self.offsets = []
+        self.size = len(self.manifest)
+        for _, _, size in self.files:
+            self.offsets.append(self.size)
+            self.size += size
+
+    @staticmethod
+    def add(entries, root, path):
+        status = os.stat(path)
+        if stat.S_ISREG(status.st_mode):
+            name = os.path.relpath(os.path.abspath(path), os.path.abspath(root)).replace(os.sep, '/')
+            entries.setdefault(name, (path, status))
+
+
+class TreeChunks:
+    """
+    Exposes the stream of a Tree as a sequence of fixed-size chunks, with the same interface as
+    FileChunks. A chunk may hold the end of one file and the start of the next ones, so chunks are
+    read into memory with pread rather than mapped. The compression workers read chunks too, so
+    the file that was read last, which is usually read from next, is kept open under a lock.
+    Args:
+        tree (Tree): The files to send.
+        chunk_size (int): The number of stream bytes carried by each packet.
+    """
+
+    def __init__(self, tree, chunk_size):
+        self.tree = tree
+        self.chunk_size = chunk_size
+        self.size = tree.size
+        self.lock = threading.Lock()
+        self.open_index = None
+        self.open_fd = None
+
+    def __len__(self):
+        return (self.size + self.chunk_size - 1) // self.chunk_size
+
+    def __getitem__(self, index):
+        start = index * self.chunk_size
+        end = min(start + self.chunk_size, self.size)
+        parts = []
+        if start < len(self.tree.manifest):
+            parts.append(self.tree.manifest[start:end])
+            start = min(end, len(self.tree.manifest))
+        # The file that holds the first byte, then the ones after it until the chunk is full
+        file_index = bisect.bisect_right(self.tree.offsets, start) - 1
+        while start < end:
+            offset = self.tree.offsets[file_index]
+            name, path, size = self.tree.files[file_index]
+            length = min(end, offset + size) - start
+            if length > 0:
+                parts.append(self.read(file_index, start - offset, length))
+            start += length
+            file_index += 1
+        return b''.join(parts)
+
+    def read(self, file_index, offset, length):
+        """
+        Reads a range of a file.
+        Args:
+            file_index (int): The number of the file in the tree.
+            offset (int): Where the range starts in the file.
+            length (int): The length of the range.
+        Returns:
+            bytes: The range.
+        Raises:
+            OSError: If the file cannot be read or became shorter since the manifest was built.
+        """
+        with self.lock:
+            if self.open_index != file_index:
+                self.close()
+                self.open_fd = os.open(self.tree.files[file_index][1], os.O_RDONLY)
+                self.open_index = file_index
+            data = os.pread(self.open_fd, length, offset)
+        if len(data) != length:
+            raise OSError(f'{self.tree.files[file_index][1]} became shorter while it was sent')
+        return data
+
+    def release(self, count):
+        # Chunks are read when they are sent, so there is nothing to drop
+        pass
+
+    def close(self):
+        if self.open_fd is not None:
+            os.close(self.open_fd)
+            self.open_fd = None
+            self.open_index = None
+
+
+class TreeWriter(FileWriter):
+    """
+    Writes the stream of a tree into the files it describes, under the output directory. The
+    stream arrives in order, starting with the manifest. A file is created when the stream reaches
+    it, and gets its permissions and modification time once it is complete. Errors, such as a name
+    that would leave the output directory, are kept until close, and the rest of the stream is
+    dropped, so the transfer itself is not disturbed.
+    Args:
+        path (str): The output directory, created if it does not exist.
+        fsync_policy (str): 'none' never syncs, 'end' syncs every file once it is complete,
+            'always' syncs after every write.
+        threaded (bool): If True, writes are handed to a background thread so the caller never waits on disk.
+        queue_size (int): The maximum number of chunks waiting for the writer thread.
+    Raises:
+        OSError: If the output directory cannot be created.
+    """
+
+    def __init__(self, path, fsync_policy='none', threaded=False, queue_size=WRITER_QUEUE_SIZE):
+        self.position = 0           # How much of the stream was received
+        self.pending = b''          # The start of the manifest, until it is complete
+        self.files = None           # (name, size, mtime_ns, mode) of every file, once the manifest is parsed
+        self.file_index = 0         # The file the next bytes belong to
+        self.file_written = 0       # How much of it was written
+        self.files_written = 0
+        super().__init__(path, fsync_policy, threaded, queue_size)
+
+    def _open(self, path, truncate):
+        # The files are opened one at a time as the stream reaches them; fd is the current one
+        os.makedirs(path, exist_ok=True)
+        return None
+
+    def preallocate(self, size):
+        # The size of every file is only known from the manifest
+        pass
+
+    def flush(self):
+        # Trees are not resumed, so nothing needs to be on disk before the end
+        pass
+
+    def close(self):
+        """
+        Waits for queued chunks to be written and completes the files that follow the last byte
+        received, which can only be empty ones.
+        Returns:
+            int: The number of bytes of the stream written.
+        Raises:
+            OSError: If a file could not be written or the stream ended early.
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+        if self.error is None:
+            try:
+                self.next_files()
+                if self.files is None or self.file_index < len(self.files):
+                    raise OSError(f'the stream ended after {self.position} bytes, before the last file')
+            except OSError as e:
+                self.error = e
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+        if self.error:
+            raise self.error
+        return self.bytes_written
+
+    def _pwrite(self, offset, data):
+        if self.error is not None:
+            return
+        try:
+            if offset != self.position:
+                raise OSError(f'the stream continues at byte {offset} instead of {self.position}')
+            self.position += len(data)
+            self.bytes_written += len(data)
+            view = memoryview(data)
+            if self.files is None:
+                view = self.parse_manifest(view)
+            while view:
+                self.next_files()
+                if self.file_index == len(self.files):
+                    raise OSError(f'the stream is {len(view)} bytes longer than its files')
+                name, size, _, _ = self.files[self.file_index]
+                if self.fd is None:
+                    self.fd = os.open(os.path.join(self.path, name), os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+                part = view[:size - self.file_written]
+                written = 0
+                while written < len(part):
+                    written += os.pwrite(self.fd, part[written:], self.file_written + written)
+                self.file_written += len(part)
+                view = view[len(part):]
+                if self.fsync_policy == 'always':
+                    os.fdatasync(self.fd)
+        except (OSError, ValueError) as e:
+            self.error = e if isinstance(e, OSError) else OSError(str(e))
+
+    def parse_manifest(self, view):
+        """
+        Collects the manifest and, once it is complete, parses it and creates the directories.
+        Args:
+            view (memoryview): The next bytes of the stream.
+        Returns:
+            memoryview: The bytes that follow the manifest, empty if it is not complete yet.
+        Raises:
+            ValueError: If the manifest is malformed or a name would leave the output directory.
+        """
+        self.pending += view
+        if len(self.pending) < manifest_header.size:
+            return memoryview(b'')
+        magic, count, length = manifest_header.unpack_from(self.pending)
+        if magic != MANIFEST_MAGIC:
+            raise ValueError('the stream does not start with a manifest')
+        end = manifest_header.size + length
+        if len(self.pending) < end:
+            return memoryview(b'')
+        files = []
+        offset = manifest_header.size
+        try:
+            for _ in range(count):
+                size, mtime_ns, mode, name_length = manifest_entry.unpack_from(self.pending, offset)
+                offset += manifest_entry.size
+                name = self.pending[offset:offset + name_length].decode()
+                offset += name_length
+                files.append((safe_name(name), size, mtime_ns, mode))
+        except (struct.error, UnicodeDecodeError):
+            raise ValueError('the manifest is truncated or malformed')
+        if offset != end:
+            raise ValueError('the manifest is malformed')
+        for name, _, _, _ in files:
+            os.makedirs(os.path.dirname(os.path.join(self.path, name)), exist_ok=True)
+        rest = memoryview(self.pending)[end:]
+        self.pending = b''
+        self.files = files
+        return rest
+
+    def next_files(self):
+        """
+        Completes the current file if all of it was written, and every empty file after it.
+        """
+        while self.files is not None and self.file_index < len(self.files):
+            name, size, mtime_ns, mode = self.files[self.file_index]
+            if self.file_written < size:
+                return
+            path = os.path.join(self.path, name)
+            if self.fd is None:
+                self.fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+            if self.fsync_policy != 'none':
+                os.fsync(self.fd)
+            os.fchmod(self.fd, mode & 0o777)
+            os.close(self.fd)
+            self.fd = None
+            os.utime(path, ns=(mtime_ns, mtime_ns))
+            self.files_written += 1
+            self.file_index += 1
+            self.file_written = 0
+
+
+def safe_name(name):
+    """
+    Checks that a name from the manifest stays inside the output directory.
+    Args:
+        name (str): The name, with / between its components.
+    Returns:
+        str: The name, with the separator of the platform.
+    Raises:
+        ValueError: If the name is absolute, empty or has an empty, . or .. component.
+    """
+    parts = name.split('/')
+    if any(part in ('', '.', '..') or os.sep in part or '\0' in part for part in parts):
+        raise ValueError(f'the manifest names {name!r}, which is outside the output directory')
+    return os.path.join(*parts)
@@ -1,10 +1,12 @@
 # ---------------- IMPORTS ---------------- 
 # Import necessary modules for command line input, network communication, 
-# handling binary data, operating system tasks, and time functions
+# handling binary data, operating system tasks, memory-mapped files, and time functions
 import argparse
+import glob
 import socket
 import struct
 import os
+import mmap
 import time
 from datetime import datetime
 
@@ -13,12 +15,129 @@ from datetime import datetime
 BUFFER_SIZE = 4096
 MAX_PACKET_SIZE = 1000
 
+# ---------------- SEGMENT SIZE ---------------- 
+# MAX_PACKET_SIZE is the datagram size of version 1 and the starting point of path MTU probing.
+# Version 2 peers negotiate the segment size, up to the largest IPv4 UDP payload.
+MIN_SEGMENT_SIZE = 100
+MAX_SEGMENT_SIZE = 65507
+PMTU_PROBE_SIZES = (1472, 8972, 16356, MAX_SEGMENT_SIZE)  # UDP payloads of Ethernet, jumbo frame, 16k and loopback MTUs
+PMTU_PROBE_ATTEMPTS = 2
+PMTU_PROBE_MIN_TIMEOUT = 0.05  # seconds
+SOCKET_BUFFER_SIZE = 4 * 1024 * 1024  # Requested socket buffer size, capped by net.core.[rw]mem_max
+
+# ---------------- OUTPUT FILE ---------------- 
+# Default path of the received file and how many chunks may wait for the writer thread
+DEFAULT_OUTPUT_PATH = 'img/received_file.jpg'
+WRITER_QUEUE_SIZE = 256
+FSYNC_POLICIES = ('none', 'end', 'always')
+
+# ---------------- SESSIONS ---------------- 
+# Limits of the server, which serves many connections at once
+MAX_SESSIONS = 256            # Connections served at the same time
+IDLE_TIMEOUT = 30.0           # seconds without a packet before a connection is dropped
+MAX_REORDER_PACKETS = 8192    # Out-of-order packets buffered per connection
+CLOSE_LINGER = 2.0            # seconds a closed connection keeps answering retransmitted FINs
+REAPER_INTERVAL = 1.0         # seconds between idle connection checks
+SUPERVISOR_INTERVAL = 0.5     # seconds between worker process checks
+WORKER_RESTART_DELAY = 1.0    # seconds before a crashed worker process is restarted
+MAX_STREAMS = 64              # Connections a striped transfer may use
+
+# ---------------- ACKNOWLEDGEMENTS ---------------- 
+# The server acknowledges packets that arrive in order together, and anything else at once
+ACK_EVERY = 2                 # In-order packets per ACK, as TCP's delayed ACK; at most half the client's window
+ACK_DELAY = 0.005             # seconds an in-order packet may wait for its ACK, well below MIN_RTO
+
+# ---------------- TRACING ---------------- 
+# Event tracing levels, the size of the ring buffer in events and how often it is flushed
+TRACE_LEVELS = ('off', 'events', 'packets')
+DEFAULT_TRACE_FILE = 'drtp.trace'
+TRACE_CAPACITY = 65536
+TRACE_FLUSH_INTERVAL = 0.2  # seconds
+METRICS_INTERVAL = 1.0      # seconds between two lines of live metrics
+
+# ---------------- COMPRESSION ---------------- 
+# Codecs that may be asked for with --compress, and how chunks are compressed
+COMPRESSION_CHOICES = ('none', 'auto', 'zlib', 'zstd', 'lz4')
+COMPRESSION_MIN_SAVING = 0.1   # A chunk is only sent compressed if it shrinks by at least this fraction
+COMPRESSION_MAX_SKIP = 64      # Chunks sent uncompressed at most after a poor result, before trying again
+COMPRESSION_LOOKAHEAD = 2      # Chunks compressed ahead of the sender, per worker
+COMPRESSION_WORKERS = os.cpu_count() or 1
+ZLIB_LEVEL = 6
+ZSTD_LEVEL = 3
+
+# ---------------- RESUMING ---------------- 
+# The state of a partial output file is saved next to it, with this suffix, every few seconds
+RESUME_SUFFIX = '.resume'
+RESUME_SAVE_INTERVAL = 1.0    # seconds between two saves of the received bitmap
+RESUME_RETRIES = 5            # How many times the client sends the ACK before giving up on the resume answer
+
+# ---------------- INTEGRITY ---------------- 
+DIGEST_READ_SIZE = 1024 * 1024   # bytes read at a time when hashing chunks already in the output file
+
+# ---------------- DELTA SYNC ---------------- 
+# Content-defined chunks of --sync, and the files the server keeps next to its copy of a file
+SYNC_MIN_CHUNK = 4 * 1024      # bytes
+SYNC_MAX_CHUNK = 64 * 1024     # bytes
+SYNC_READ_SIZE = 4 * 1024 * 1024   # bytes mapped to bits or copied at a time
+SYNC_INDEX_WINDOW = 32         # Pages of the server's index the client asks for at once
+INDEX_SUFFIX = '.index'
+DELTA_SUFFIX = '.delta'
+
+# ---------------- FORWARD ERROR CORRECTION ---------------- 
+# Data packets per parity packet, and how --fec auto follows the loss rate
+FEC_MIN_BLOCK = 2
+FEC_MAX_BLOCK = 64
+FEC_LOSSES_PER_BLOCK = 0.5   # Lost packets per block --fec auto aims for, which one parity packet can mostly repair
+FEC_GAIN = 1 / 8             # Gain of the loss rate estimate, updated once per block
+
+# ---------------- BENCHMARK ---------------- 
+# Defaults of the impairment proxy and the benchmark harness
+IMPAIR_QUEUE_BYTES = 1024 * 1024   # Bytes queued behind the proxy's bandwidth limit
+IMPAIR_REORDER_DELAY = 0.005       # seconds a reordered packet is held back
+IMPAIR_POLL_INTERVAL = 0.1         # seconds the proxy waits for packets before checking whether to stop
+IMPAIR_READS_PER_WAKEUP = 64       # Datagrams the proxy reads from a socket before sending what is due
+BENCHMARK_TIMEOUT = 120.0          # seconds a benchmark run may take before it is failed
+BENCHMARK_TOLERANCE = 0.2          # Throughput may drop by this fraction of the baseline before it is a regression
+
 # ---------------- HEADER FORMATTING ---------------- 
 # Defines the format for data packet headers and flags for ACK, SYN, and FIN signals
 header_format = '!HHH'  # sequence number, acknowledgment number, and flags (all 2 bytes)
 ACK_FLAG = 1 << 2   # Flag for ACK signal
 SYN_FLAG = 1 << 3   # Flag for SYN signal
 FIN_FLAG = 1 << 1   # Flag for FIN signal
+SYN_RETRIES = 5     # How many times the client sends the SYN before giving up on the SYN-ACK
+FIN_RETRIES = 5     # How many times the client sends the FIN before giving up on the FIN ACK
+
+# ---------------- RETRANSMISSION ---------------- 
+# Retransmission timeout bounds and RTT estimation constants (RFC 6298), and the
+# Selective Repeat settings for SACK-based loss detection
+RETRANSMISSION_TIMEOUT = 0.5  # seconds, used for the handshake and teardown
+INITIAL_RTO = 0.5             # seconds, the data RTO before the first RTT sample
+MIN_RTO = 0.2                 # seconds, above the delayed ACK and the jitter of most paths, as in Linux
+MAX_RTO = 10.0                # seconds
+RTT_ALPHA = 1 / 8             # Gain of the smoothed RTT
+RTT_BETA = 1 / 4              # Gain of the RTT variation
+CLOCK_GRANULARITY = 0.001     # seconds
+SACK_HOLE_THRESHOLD = 3       # A hole is retransmitted once this many later packets are selectively acknowledged
+REORDER_WINDOW_DECAY = 16     # Recoveries without a spurious retransmission before the reordering window shrinks back
+MAX_SACK_BLOCKS = 16          # SACK blocks carried in one ACK
+TRANSFER_MODES = ('gbn', 'sr')
+
+# ---------------- CONGESTION CONTROL ---------------- 
+# Window limits in packets, the default controller, and the constants of the controllers and the pacer
+DEFAULT_WINDOW = 3            # The fixed window of earlier versions, which --window raises
+MAX_WINDOW_SIZE = 65535
+CONGESTION_CONTROL_ALGORITHMS = ('fixed', 'reno', 'cubic')
+DEFAULT_CONGESTION_CONTROL = 'reno'
+INITIAL_CWND = 10             # RFC 6928 initial window
+MIN_CWND = 2
+RENO_BETA = 0.5
+CUBIC_BETA = 0.7
+CUBIC_C = 0.4
+SLOW_START_PACING_GAIN = 2.0
+PACING_GAIN = 1.25
+PACING_BURST = 4              # Packets that may leave back-to-back
+GSO_PACING_BURST = 16         # Packets that may leave back-to-back when they are batched with UDP GSO
 
 # ---------------- MAIN CODE ---------------- 
 # This section will contain primary functionality of the program
@@ -27,7 +146,11 @@ def get_args():
     """
     Initializes the argument parser and parses the command line arguments.
     
-    The function supports the following arguments: client, server, ip, file, window, discard
+    The function supports the following arguments: client, server, ip, file, window, cc, no-pacing, mode, min-rto, max-rto,
+    segment-size, max-segment, fastpath, discard,
+    output, fsync, writer-thread, max-sessions, idle-timeout, max-reorder, ack-every, ack-delay, workers, streams,
+    trace-level, trace-file, metrics-file, metrics-interval, metrics-socket, compress, compress-workers, no-resume,
+    no-integrity, sync, fec
     
     Returns:
         argparse.Namespace: The command line arguments.
@@ -37,9 +160,38 @@ def get_args():
     parser.add_argument('--server', '-s', action='store_true', help='Run as server')
     parser.add_argument('--ip', '-i', default='10.0.1.2', help='IP address of the server, default is 10.0.1.2')
     parser.add_argument('--port', '-p', type=int, default=8080, help='UDP port, default is 8080, should be in range 1024-65535')
-    parser.add_argument('--file', '-f', type=str, help='File name')
-    parser.add_argument('--window', '-w', type=int, default=3, help='Sliding window size')
+    parser.add_argument('--file', '-f', type=str, help='File to send, or a directory or quoted glob pattern to send every file it holds or matches')
+    parser.add_argument('--window', '-w', type=int, default=DEFAULT_WINDOW, help=f'Upper bound of the sliding window in packets, default is {DEFAULT_WINDOW}')
+    parser.add_argument('--cc', choices=CONGESTION_CONTROL_ALGORITHMS, default=DEFAULT_CONGESTION_CONTROL, help=f'Congestion control algorithm (client mode), fixed keeps the window at --window, default is {DEFAULT_CONGESTION_CONTROL}')
+    parser.add_argument('--no-pacing', action='store_true', help='Send the packets of a window back-to-back instead of pacing them (client mode)')
+    parser.add_argument('--mode', '-m', choices=TRANSFER_MODES, default='gbn', help='Retransmission strategy (client mode): gbn for Go-Back-N, sr for Selective Repeat with SACK, default is gbn')
+    parser.add_argument('--min-rto', type=float, default=MIN_RTO, help=f'Lower bound of the retransmission timeout in seconds (client mode), default is {MIN_RTO}')
+    parser.add_argument('--max-rto', type=float, default=MAX_RTO, help=f'Upper bound of the retransmission timeout in seconds (client mode), default is {MAX_RTO}')
+    parser.add_argument('--segment-size', type=int, help='Datagram size to use instead of probing the path MTU (client mode)')
+    parser.add_argument('--max-segment', type=int, default=MAX_SEGMENT_SIZE, help=f'Largest datagram the server accepts (server mode), default is {MAX_SEGMENT_SIZE}')
+    parser.add_argument('--streams', type=int, default=1, help=f'Connections to stripe the file over, at most {MAX_STREAMS} (client mode), default is 1')
+    parser.add_argument('--fastpath', action='store_true', help='Batch datagrams with Linux UDP GSO (client) or GRO (server) when the kernel supports it')
     parser.add_argument('--discard', '-d', type=int, help='Seq number to discard for retransmission test')
+    parser.add_argument('--output', '-o', type=str, default=DEFAULT_OUTPUT_PATH, help=f'Path of the received file (server mode), default is {DEFAULT_OUTPUT_PATH}')
+    parser.add_argument('--fsync', choices=FSYNC_POLICIES, default='none', help='When to fsync the received file (server mode), default is none')
+    parser.add_argument('--writer-thread', action='store_true', help='Write received chunks from a background thread (server mode)')
+    parser.add_argument('--max-sessions', type=int, default=MAX_SESSIONS, help=f'Connections served at the same time (server mode), default is {MAX_SESSIONS}')
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT, help=f'Seconds without a packet before a connection is dropped (server mode), default is {IDLE_TIMEOUT}')
+    parser.add_argument('--max-reorder', type=int, default=MAX_REORDER_PACKETS, help=f'Out-of-order packets buffered per connection (server mode), default is {MAX_REORDER_PACKETS}')
+    parser.add_argument('--ack-every', type=int, default=ACK_EVERY, help=f'In-order packets acknowledged with one ACK (server mode), 1 to acknowledge every packet, default is {ACK_EVERY}')
+    parser.add_argument('--ack-delay', type=float, default=ACK_DELAY, help=f'Seconds an in-order packet may wait for its ACK (server mode), default is {ACK_DELAY}')
+    parser.add_argument('--workers', type=int, default=1, help='Server processes sharing the port with SO_REUSEPORT (server mode), default is 1')
+    parser.add_argument('--trace-level', choices=TRACE_LEVELS, default='off', help='Record a binary event trace: events for losses and retransmissions, packets for every packet, default is off')
+    parser.add_argument('--trace-file', type=str, default=DEFAULT_TRACE_FILE, help=f'Path of the event trace, default is {DEFAULT_TRACE_FILE}')
+    parser.add_argument('--metrics-file', type=str, help="Append live metrics as JSON lines to this file, - for standard output")
+    parser.add_argument('--metrics-interval', type=float, default=METRICS_INTERVAL, help=f'Seconds between two lines of live metrics, default is {METRICS_INTERVAL}')
+    parser.add_argument('--metrics-socket', type=str, help='Serve the live metrics on this Unix socket')
+    parser.add_argument('--compress', choices=COMPRESSION_CHOICES, default='none', help='Compress the chunks with a codec the server supports, auto for the fastest one, default is none')
+    parser.add_argument('--compress-workers', type=int, default=COMPRESSION_WORKERS, help=f'Threads compressing chunks ahead of the window, default is {COMPRESSION_WORKERS}')
+    parser.add_argument('--no-resume', action='store_true', help='Do not resume interrupted transfers, nor keep the state to resume them')
+    parser.add_argument('--no-integrity', action='store_true', help='Send data packets without a CRC and do not verify the digest of the file')
+    parser.add_argument('--sync', action='store_true', help="Send only the chunks the server's copy of the file lacks (client mode)")
+    parser.add_argument('--fec', default='off', help=f'Send a parity packet after every N data packets ({FEC_MIN_BLOCK}-{FEC_MAX_BLOCK}), auto to follow the loss rate, default is off (client mode)')
     return parser.parse_args()
 
 def validate_args(args):
@@ -61,15 +213,74 @@ def validate_args(args):
         print("Error: Port number must be in the range 1024-65535")
         exit(1)
     
-    # The window size must be in the range 1-100
-    if not 1 <= args.window <= 100:
-        print("Error: Window size must be in the range 1-100")
+    # The window size must be in the range 1-MAX_WINDOW_SIZE
+    if not 1 <= args.window <= MAX_WINDOW_SIZE:
+        print(f"Error: Window size must be in the range 1-{MAX_WINDOW_SIZE}")
+        exit(1)
+
+    # The retransmission timeout bounds must be positive and in order
+    if not 0 < args.min_rto <= args.max_rto:
+        print("Error: The retransmission timeout bounds must satisfy 0 < --min-rto <= --max-rto")
+        exit(1)
+
+    # Segment sizes must fit in a UDP datagram, and the server must accept the version 1 packet size
+    if args.segment_size is not None and not MIN_SEGMENT_SIZE <= args.segment_size <= MAX_SEGMENT_SIZE:
+        print(f"Error: Segment size must be in the range {MIN_SEGMENT_SIZE}-{MAX_SEGMENT_SIZE}")
+        exit(1)
+    if not MAX_PACKET_SIZE <= args.max_segment <= MAX_SEGMENT_SIZE:
+        print(f"Error: Maximum segment size must be in the range {MAX_PACKET_SIZE}-{MAX_SEGMENT_SIZE}")
+        exit(1)
+
+    # Compression needs at least one worker
+    if args.compress_workers < 1:
+        print("Error: --compress-workers must be at least 1")
+        exit(1)
+
+    # Live metrics are written at a positive interval
+    if args.metrics_interval <= 0:
+        print("Error: --metrics-interval must be positive")
+        exit(1)
+
+    # A striped transfer needs at least one stream
+    if not 1 <= args.streams <= MAX_STREAMS:
+        print(f"Error: The number of streams must be in the range 1-{MAX_STREAMS}")
+        exit(1)
+
+    # Forward error correction is off, adaptive or a fixed number of data packets per parity packet
+    if args.fec not in ('off', 'auto') and not (args.fec.isdigit() and FEC_MIN_BLOCK <= int(args.fec) <= FEC_MAX_BLOCK):
+        print(f"Error: --fec must be off, auto or a number of packets in the range {FEC_MIN_BLOCK}-{FEC_MAX_BLOCK}")
+        exit(1)
+
+    # A delta is sent over one connection
+    if args.sync and args.streams > 1:
+        print("Error: --sync cannot be used with --streams")
+        exit(1)
+
+    # The server limits must be positive
+    if args.max_sessions < 1 or args.max_reorder < 1 or args.idle_timeout <= 0 or args.workers < 1:
+        print("Error: --max-sessions, --max-reorder, --idle-timeout and --workers must be positive")
+        exit(1)
+    if args.ack_every < 1 or args.ack_delay < 0:
+        print("Error: --ack-every must be positive and --ack-delay must not be negative")
+        exit(1)
+    if args.workers > 1 and not hasattr(socket, 'SO_REUSEPORT'):
+        print("Error: --workers needs SO_REUSEPORT, which this platform does not support")
         exit(1)
 
     # If the application is running in client mode, a file must be specified
     if args.client and not args.file:
         print("Error: A file must be specified with the --file option in client mode.")
         exit(1)
+
+    # The file to send must exist; a directory or a glob pattern sends every file it holds or matches
+    if args.client and not (os.path.exists(args.file) or glob.glob(args.file, recursive=True)):
+        print(f"Error: File {args.file} does not exist.")
+        exit(1)
+
+    # The files of a directory or a glob pattern are sent over one connection as one stream
+    if args.client and not os.path.isfile(args.file) and (args.sync or args.streams > 1):
+        print("Error: --sync and --streams cannot be used with a directory or a glob pattern")
+        exit(1)
     
     # If the application is running in server mode, a file should not be specified
     if args.server and args.file:
@@ -0,0 +1,140 @@
+# ---------------- IMPORTS ---------------- 
+# Import necessary utilities and the modules used by the background writer thread
+from utils import *
+import queue
+import threading
+
+# ---------------- FILE WRITER ---------------- 
+# Writes received chunks directly to their offset in the output file while the transfer runs
+
+class FileWriter:
+    """
+    Writes chunks straight to their byte offset in the output file with pwrite,
+    so nothing has to be kept in memory until the transfer finishes.
+    Args:
+        path (str): The path of the output file.
+        fsync_policy (str): 'none' never syncs, 'end' syncs once on close, 'always' syncs after every write.
+        threaded (bool): If True, writes are handed to a background thread so the caller never waits on disk.
+        queue_size (int): The maximum number of chunks waiting for the writer thread.
+        truncate (bool): Whether to empty the file when it is opened. The streams of a striped transfer
+            write to the same file, so they keep what the others wrote and preallocate sets the size.
+    Raises:
+        OSError: If the output file cannot be opened. The server serves other connections
+        meanwhile, so errors are left to the caller instead of ending the process.
+    """
+
+    def __init__(self, path, fsync_policy='none', threaded=False, queue_size=WRITER_QUEUE_SIZE, truncate=True):
+        self.fd = self._open(path, truncate)
+        self.path = path
+        self.fsync_policy = fsync_policy
+        self.bytes_written = 0
+        self.error = None
+        self.queue = None
+        self.thread = None
+        if threaded:
+            # The queue is bounded so a slow disk applies back-pressure instead of using up memory
+            self.queue = queue.Queue(maxsize=queue_size)
+            self.thread = threading.Thread(target=self._run, daemon=True)
+            self.thread.start()
+
+    def _open(self, path, truncate):
+        return os.open(path, os.O_WRONLY | os.O_CREAT | (os.O_TRUNC if truncate else 0), 0o644)
+
+    def preallocate(self, size):
+        """
+        Sets the size of the file and reserves disk space for it up front, so writes at any
+        offset do not have to extend the file and fail early if the disk is too small.
+        Args:
+            size (int): The final size of the file in bytes.
+        Raises:
+            OSError: If the space cannot be reserved.
+        """
+        if size <= 0:
+            return
+        os.ftruncate(self.fd, size)
+        if hasattr(os, 'posix_fallocate'):
+            os.posix_fallocate(self.fd, 0, size)
+
+    def write(self, offset, data):
+        """
+        Writes a chunk at the given offset, or queues a copy of it for the writer thread.
+        Args:
+            offset (int): The byte offset of the chunk in the file.
+            data (bytes-like): The chunk to write, which may be a view of the receive buffer.
+        Returns:
+            bool: True if the chunk was written or queued, False if the queue is full because the
+            disk falls behind. The caller is not made to wait, so it can serve other connections.
+        """
+        if self.error:
+            raise self.error
+        if self.queue is not None:
+            try:
+                self.queue.put_nowait((offset, bytes(data)))
+            except queue.Full:
+                return False
+        else:
+            self._pwrite(offset, data)
+        return True
+
+    def flush(self):
+        """
+        Waits until the chunks queued so far are written and, unless the fsync policy is none,
+        syncs them to disk. Called from another thread than the one writing.
+        Raises:
+            OSError: If a chunk could not be written.
+        """
+        if self.queue is not None:
+            written = threading.Event()
+            self.queue.put(written)
+            # If the file was closed meanwhile, the thread is gone and its chunks are written
+            while not written.wait(REAPER_INTERVAL) and self.thread.is_alive():
+                pass
+        if self.error:
+            raise self.error
+        if self.fsync_policy != 'none':
+            os.fdatasync(self.fd)
+
+    def close(self):
+        """
+        Waits for queued chunks to be written, syncs the file according to the fsync policy and closes it.
+        Returns:
+            int: The number of bytes written to the file.
+        """
+        if self.thread is not None:
+            self.queue.put(None)
+            self.thread.join()
+        try:
+            if self.error is None and self.fsync_policy == 'end':
+                os.fsync(self.fd)
+        finally:
+            os.close(self.fd)
+        if self.error:
+            raise self.error
+        return self.bytes_written
+
+    def _pwrite(self, offset, data):
+        # pwrite may write less than asked for, so loop until the whole chunk is on disk
+        view = memoryview(data)
+        while view:
+            written = os.pwrite(self.fd, view, offset)
+            view = view[written:]
+            offset += written
+        self.bytes_written += len(data)
+        if self.fsync_policy == 'always':
+            os.fdatasync(self.fd)
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, threading.Event):
+                # Every chunk queued before a flush has been written
+                item.set()
+                continue
+            if self.error is None:
+                try:
+                    self._pwrite(*item)
+                except OSError as e:
+                    # Keep draining the queue so the receive loop is never blocked, and report the error later
+                    self.error = e
@@ -0,0 +1,98 @@
+import random
+
+import pytest
+
+from compress import CODECS, ChunkCompressor, ZlibCodec, choose_codec, offered_codecs
+from metrics import ClientMetrics
+from utils import COMPRESSION_MAX_SKIP
+
+CHUNK_SIZE = 1000
+
+
+def random_chunk(seed):
+    return random.Random(seed).randbytes(CHUNK_SIZE)
+
+
+class CountingCodec(ZlibCodec):
+    """
+    Counts the chunks it compresses, to tell which ones the compressor tried.
+    """
+
+    def __init__(self):
+        self.compressed = []
+
+    def compress(self, data):
+        self.compressed.append(bytes(data))
+        return super().compress(data)
+
+
+@pytest.mark.parametrize('name', ['zlib', 'zstd', 'lz4'])
+def test_round_trip(name):
+    if name not in CODECS:
+        pytest.skip(f'{name} is not installed')
+    codec = CODECS[name]
+    data = b'text that repeats ' * 50
+    compressed = codec.compress(memoryview(data))
+    assert len(compressed) < len(data)
+    assert codec.decompress(compressed, len(data)) == data
+    assert codec.decompress(memoryview(compressed), CHUNK_SIZE * 2) == data
+
+
+@pytest.mark.parametrize('name', ['zlib', 'zstd', 'lz4'])
+def test_payload_larger_than_a_chunk_is_rejected(name):
+    if name not in CODECS:
+        pytest.skip(f'{name} is not installed')
+    codec = CODECS[name]
+    compressed = codec.compress(bytes(CHUNK_SIZE + 1))
+    with pytest.raises(ValueError):
+        codec.decompress(compressed, CHUNK_SIZE)
+    with pytest.raises(ValueError):
+        codec.decompress(b'\xff' * 20, CHUNK_SIZE)
+
+
+def test_codec_choice():
+    assert choose_codec('none', offered_codecs()) is None
+    assert choose_codec('auto', offered_codecs()) is next(iter(CODECS.values()))
+    assert choose_codec('zlib', offered_codecs()) is CODECS['zlib']
+    assert choose_codec('auto', b'') is None
+
+
+def test_incompressible_chunks_are_bypassed_until_a_probe_pays_off():
+    incompressible = [random_chunk(seed) for seed in range(300)]
+    compressible = [bytes([index % 256]) * CHUNK_SIZE for index in range(200)]
+    codec = CountingCodec()
+    metrics = ClientMetrics()
+    compressor = ChunkCompressor(codec, incompressible + compressible, 1, metrics)
+    try:
+        sent = [compressor.get(index) for index in range(len(incompressible) + len(compressible))]
+    finally:
+        compressor.close()
+
+    # Incompressible chunks go out as they are, and the back-off tries only a few of them
+    assert sent[:300] == [(chunk, False) for chunk in incompressible]
+    tried = sum(chunk in incompressible for chunk in codec.compressed)
+    assert tried < 300 // COMPRESSION_MAX_SKIP + 10
+
+    # A probe finds that the data became compressible, at most a full back-off later
+    first = next(index for index, (_, compressed) in enumerate(sent) if compressed)
+    assert 300 <= first <= 300 + COMPRESSION_MAX_SKIP + 1
+    assert all(compressed for _, compressed in sent[first:])
+    assert all(CODECS['zlib'].decompress(payload, CHUNK_SIZE) == compressible[index - 300]
+               for index, (payload, _) in enumerate(sent[first:], first))
+    assert metrics.compressed_chunks == 500 - first
+    assert metrics.bypassed_chunks == first
+    assert compressor.skip == 0
+
+
+def test_chunks_a_resumed_transfer_skips_are_not_compressed():
+    chunks = [bytes([index]) * CHUNK_SIZE for index in range(40)]
+    codec = CountingCodec()
+    compressor = ChunkCompressor(codec, chunks, 1)
+    try:
+        assert compressor.get(0)[1]
+        payload, compressed = compressor.get(30)
+        assert compressed and codec.decompress(payload, CHUNK_SIZE) == chunks[30]
+        assert not any(chunks[index] in codec.compressed for index in range(3, 30))
+        assert not [index for index in compressor.futures if index < 30]
+    finally:
+        compressor.close()
@@ -0,0 +1,64 @@
+from congestion import Cubic, FixedWindow, Reno
+from rto import RTTEstimator
+from utils import CUBIC_BETA, INITIAL_CWND, MIN_CWND, RENO_BETA
+
+
+def test_fixed_window():
+    cc = FixedWindow(3)
+    cc.on_congestion(0.0, True)
+    assert cc.window() == 3 and cc.pacing_rate(RTTEstimator()) is None
+
+
+def test_reno_slow_start_and_loss():
+    cc = Reno(1000)
+    assert cc.window() == INITIAL_CWND
+    cc.on_ack(10, 0.0, None)
+    assert cc.cwnd == INITIAL_CWND + 10
+    window = cc.cwnd
+    cc.on_congestion(0.0, False)
+    assert cc.cwnd == cc.ssthresh == max(window * RENO_BETA, MIN_CWND)
+    cc.on_ack(int(cc.cwnd), 0.0, None)
+    assert cc.cwnd < window * RENO_BETA + 1.01
+    cc.on_congestion(0.0, True)
+    assert cc.cwnd == 1.0 and cc.window() == 1
+
+
+def test_window_never_exceeds_the_maximum():
+    cc = Reno(16)
+    cc.on_ack(1000, 0.0, None)
+    assert cc.window() == 16
+
+
+def test_cubic_reduction_and_regrowth():
+    cc = Cubic(1000)
+    rtt = RTTEstimator()
+    rtt.sample(0.01)
+    cc.on_ack(90, 0.0, rtt)
+    window = cc.cwnd
+    cc.on_congestion(0.0, False)
+    assert cc.cwnd == max(window * CUBIC_BETA, MIN_CWND) and cc.w_max == window
+    now = 0.0
+    while cc.cwnd < window and now < 60:
+        now += 0.01
+        cc.on_ack(int(cc.cwnd), now, rtt)
+    assert cc.cwnd >= window
+
+
+def test_undo_restores_the_window_before_a_spurious_reduction():
+    for cc in (Reno(1000), Cubic(1000)):
+        cc.on_ack(40, 0.0, RTTEstimator())
+        before = cc.state()
+        window = cc.cwnd
+        cc.on_congestion(0.0, False)
+        assert cc.cwnd < window
+        cc.undo(before)
+        assert cc.cwnd == window and cc.ssthresh == before['ssthresh']
+
+
+def test_undo_keeps_growth_since_the_reduction():
+    cc = Reno(1000)
+    before = cc.state()
+    cc.on_congestion(0.0, False)
+    cc.cwnd = before['cwnd'] + 5
+    cc.undo(before)
+    assert cc.cwnd == before['cwnd'] + 5
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import random
+import time
+
+import pytest
+
+from delta import apply_delta, content_chunks, index_file, load_index, save_index, write_delta
+from utils import INDEX_SUFFIX, SYNC_MAX_CHUNK, SYNC_MIN_CHUNK
+
+
+def random_bytes(size, seed=1):
+    return random.Random(seed).randbytes(size)
+
+
+def sync(tmp_path, base, new):
+    """
+    Writes the delta from base to new as the client does and rebuilds new from it as the server does.
+    Returns:
+        tuple: The rebuilt bytes, its digest as apply_delta reports it and the literal bytes sent.
+    """
+    base_path, new_path = tmp_path / 'base.bin', tmp_path / 'new.bin'
+    base_path.write_bytes(base)
+    new_path.write_bytes(new)
+    base_chunks = load_index(str(base_path))
+    delta_path = tmp_path / 'new.bin.delta'
+    with open(delta_path, 'wb') as delta:
+        _, _, literal_bytes = write_delta(delta, str(new_path), index_file(str(new_path)),
+                                          {digest for digest, _ in base_chunks})
+    output_path = tmp_path / 'rebuilt.bin'
+    chunks, digest = apply_delta(str(delta_path), str(base_path), base_chunks, str(output_path))
+    assert chunks == index_file(str(output_path))
+    return output_path.read_bytes(), digest, literal_bytes
+
+
+def test_chunks_cover_the_data_within_bounds():
+    data = random_bytes(1 << 20)
+    chunks = list(content_chunks(data))
+    assert sum(length for _, length in chunks) == len(data)
+    assert all(offset == previous + length for (previous, length), (offset, _) in zip(chunks, chunks[1:]))
+    assert all(SYNC_MIN_CHUNK <= length <= SYNC_MAX_CHUNK for _, length in chunks[:-1])
+    assert list(content_chunks(b'')) == []
+
+
+def test_boundaries_survive_an_insertion():
+    data = random_bytes(1 << 20)
+    before = {bytes(data[offset:offset + length]) for offset, length in content_chunks(data)}
+    changed = data[:300000] + b'inserted' + data[300000:]
+    after = [bytes(changed[offset:offset + length]) for offset, length in content_chunks(changed)]
+    assert sum(chunk not in before for chunk in after) <= 2
+
+
+def test_index_file_also_hashes_the_whole_file(tmp_path):
+    path = tmp_path / 'file.bin'
+    data = random_bytes(200000)
+    path.write_bytes(data)
+    file_hash = hashlib.sha256()
+    chunks = index_file(str(path), file_hash)
+    assert file_hash.digest() == hashlib.sha256(data).digest()
+    assert sum(length for _, length in chunks) == len(data)
+    path.write_bytes(b'')
+    assert index_file(str(path)) == []
+
+
+def test_index_is_cached_until_the_file_changes(tmp_path):
+    path = tmp_path / 'copy.bin'
+    path.write_bytes(random_bytes(100000))
+    chunks = load_index(str(path))
+    assert os.path.exists(str(path) + INDEX_SUFFIX)
+
+    # A cached index is returned without reading the copy
+    save_index(str(path), chunks[:1] + chunks[1:][::-1])
+    assert load_index(str(path)) != chunks
+
+    # Rewriting the copy with its old size and modification time changes its change time, which
+    # some file systems only advance every few milliseconds
+    status = path.stat()
+    time.sleep(0.05)
+    path.write_bytes(random_bytes(100000, seed=2))
+    os.utime(path, ns=(status.st_atime_ns, status.st_mtime_ns))
+    assert load_index(str(path)) == index_file(str(path))
+    assert load_index(str(tmp_path / 'missing.bin')) == []
+
+
+def test_sync_round_trip(tmp_path):
+    base = random_bytes(500000)
+    new = base[:100000] + random_bytes(5000, seed=3) + base[120000:]
+    rebuilt, digest, literal_bytes = sync(tmp_path, base, new)
+    assert rebuilt == new
+    assert digest == hashlib.sha256(new).digest()
+    assert literal_bytes < 5000 + 4 * SYNC_MAX_CHUNK
+
+
+def test_sync_without_a_copy_sends_everything(tmp_path):
+    new = random_bytes(50000)
+    rebuilt, _, literal_bytes = sync(tmp_path, b'', new)
+    assert rebuilt == new and literal_bytes == len(new)
+
+
+def test_corrupt_copy_fails_the_rebuild(tmp_path):
+    base = random_bytes(300000)
+    base_path = tmp_path / 'base.bin'
+    base_path.write_bytes(base)
+    base_chunks = load_index(str(base_path))
+    with open(base_path, 'r+b') as copy:
+        copy.seek(150000)
+        copy.write(b'corrupt!')
+
+    new_path = tmp_path / 'new.bin'
+    new_path.write_bytes(base + b'appended')
+    delta_path = tmp_path / 'new.bin.delta'
+    with open(delta_path, 'wb') as delta:
+        write_delta(delta, str(new_path), index_file(str(new_path)), {digest for digest, _ in base_chunks})
+    with pytest.raises(ValueError, match='changed since it was indexed'):
+        apply_delta(str(delta_path), str(base_path), base_chunks, str(tmp_path / 'rebuilt.bin'))
+
+
+def test_malformed_delta_is_rejected(tmp_path):
+    delta_path = tmp_path / 'bad.delta'
+    delta_path.write_bytes(b'DRTPDLT1')
+    with pytest.raises(ValueError):
+        apply_delta(str(delta_path), str(tmp_path / 'base.bin'), [], str(tmp_path / 'rebuilt.bin'))
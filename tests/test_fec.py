@@ -0,0 +1,61 @@
+import pytest
+
+from fec import FecEncoder, parity_payload, recover_packet, xor_payloads
+from utils import FEC_MAX_BLOCK, FEC_MIN_BLOCK
+
+BLOCK = [(0, b'first payload'), (0, b'second'), (2, b'the last, longest payload')]
+
+
+def test_xor_pads_shorter_payloads():
+    assert xor_payloads([b'\x01\x02\x03', b'\x01']) == b'\x00\x02\x03'
+    assert xor_payloads([]) == b''
+
+
+@pytest.mark.parametrize('lost', range(len(BLOCK)))
+def test_recover_any_one_packet(lost):
+    parity = parity_payload(BLOCK)
+    assert recover_packet(parity, BLOCK[:lost] + BLOCK[lost + 1:]) == BLOCK[lost]
+
+
+def test_recover_rejects_a_mismatched_block():
+    parity = parity_payload(BLOCK)
+    with pytest.raises(ValueError):
+        recover_packet(parity, BLOCK[:1])
+    with pytest.raises(ValueError):
+        recover_packet(parity[:3], BLOCK[1:])
+
+
+def test_blocks_of_fixed_size():
+    fec = FecEncoder(2)
+    assert fec.add(1, 0, b'a') == []
+    assert fec.add(2, 0, b'b') == [(1, parity_payload([(0, b'a'), (0, b'b')]))]
+    assert fec.add(3, 0, b'c', last=True) == [(3, parity_payload([(0, b'c')]))]
+
+
+def test_gap_ends_the_block():
+    fec = FecEncoder(4)
+    fec.add(1, 0, b'a')
+    parities = fec.add(5, 0, b'e')
+    assert parities == [(1, parity_payload([(0, b'a')]))]
+    assert fec.first == 5
+
+
+def test_adaptive_block_size_follows_losses():
+    fec = FecEncoder(8, adaptive=True)
+    for seq in range(1, 9):
+        fec.add(seq, 0, b'x')
+    assert fec.block_size == FEC_MAX_BLOCK
+    for block in range(50):
+        fec.on_loss(4)
+        for seq in range(fec.block_size):
+            if fec.add(1000 * (block + 1) + seq, 0, b'x'):
+                break
+    assert fec.block_size == FEC_MIN_BLOCK
+
+
+def test_recovered_counts_only_new_packets():
+    fec = FecEncoder(8)
+    fec.on_recovered(3)
+    fec.on_recovered(3)
+    fec.on_recovered(5)
+    assert fec.losses == 5
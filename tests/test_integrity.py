@@ -0,0 +1,60 @@
+import hashlib
+
+import pytest
+
+from integrity import CHECKSUMS, CRC_OPTION_SIZE, FileDigest, choose_checksum, offered_checksums
+from protocol import HeaderV2
+
+
+@pytest.mark.parametrize('checksum', CHECKSUMS, ids=lambda checksum: checksum.name)
+def test_sealed_packet_verifies(checksum):
+    proto = HeaderV2(5)
+    payload = b'payload' * 100
+    packet = bytearray(checksum.seal(proto.data_header(1, 0, len(payload), CRC_OPTION_SIZE), payload) + payload)
+    assert checksum.verify(packet, proto.size)
+    packet[-1] ^= 1
+    assert not checksum.verify(packet, proto.size)
+    assert not checksum.verify(proto.data_header(1, 0, 0), proto.size)
+
+
+def test_the_preferred_checksum_is_chosen():
+    assert choose_checksum(offered_checksums()) is CHECKSUMS[0]
+    assert choose_checksum(bytes((CHECKSUMS[-1].checksum_id,))) is CHECKSUMS[-1]
+    assert choose_checksum(b'') is None
+
+
+def test_digest_of_chunks_and_file_ranges(tmp_path):
+    path = tmp_path / 'out.bin'
+    path.write_bytes(b'0123456789')
+    digest = FileDigest(str(path))
+    digest.update_from_file(0, 4)
+    digest.update(b'abc')
+    digest.update_from_file(7, 3)
+    assert digest.digest() == hashlib.sha256(b'0123abc789').digest()
+
+
+def test_missing_range_is_reported(tmp_path):
+    path = tmp_path / 'out.bin'
+    path.write_bytes(b'short')
+    digest = FileDigest(str(path))
+    digest.update_from_file(0, 100)
+    with pytest.raises(OSError):
+        digest.digest()
+
+
+def test_views_of_a_reused_buffer_keep_their_order(tmp_path):
+    # The server hashes views of its receive buffer, which the next datagram overwrites
+    path = tmp_path / 'out.bin'
+    path.write_bytes(bytes(range(256)) * 4096)
+    digest = FileDigest(str(path))
+    expected = hashlib.sha256()
+    buffer = bytearray(1000)
+    for round_number in range(200):
+        if round_number % 10 == 0:
+            # Keeps the thread busy, so some views are queued behind the range
+            digest.update_from_file(0, len(buffer) * 100)
+            expected.update((bytes(range(256)) * 4096)[:len(buffer) * 100])
+        buffer[:] = bytes([round_number]) * len(buffer)
+        digest.update_view(memoryview(buffer))
+        expected.update(buffer)
+    assert digest.digest() == expected.digest()
@@ -0,0 +1,103 @@
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+import pytest
+
+from delta import load_index, save_index
+from utils import INDEX_SUFFIX
+
+APPLICATION = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'application.py')
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture
+def server(tmp_path):
+    """
+    Runs a server over loopback that writes to copy.bin in tmp_path.
+    Returns:
+        tuple: The port and the path of the server's copy.
+    """
+    port = free_port()
+    output = tmp_path / 'copy.bin'
+    with open(tmp_path / 'server.log', 'w') as log:
+        process = subprocess.Popen([sys.executable, '-u', APPLICATION, '-s', '-i', '127.0.0.1', '-p', str(port),
+                                    '-o', str(output)], stdout=log, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + 10
+        while 'Server started' not in (tmp_path / 'server.log').read_text():
+            assert process.poll() is None and time.monotonic() < deadline, (tmp_path / 'server.log').read_text()
+            time.sleep(0.05)
+        yield port, output
+    finally:
+        process.terminate()
+        process.wait()
+
+
+def send(port, path, *options):
+    return subprocess.run([sys.executable, '-u', APPLICATION, '-c', '-i', '127.0.0.1', '-p', str(port),
+                           '-f', str(path), '-w', '64', *options],
+                          capture_output=True, text=True, timeout=60)
+
+
+def test_sync_against_a_corrupt_copy(server, tmp_path):
+    port, copy = server
+    rng = random.Random(1)
+    base = rng.randbytes(2 * 1024 * 1024)
+    new = base[:1000000] + rng.randbytes(3000) + base[1000000:]
+    new_path = tmp_path / 'new.bin'
+    new_path.write_bytes(new)
+
+    # Corrupt the copy behind the back of a valid index, as bit rot would
+    copy.write_bytes(base)
+    chunks = load_index(str(copy))
+    with open(copy, 'r+b') as file:
+        file.seek(1500000)
+        file.write(b'corrupt!')
+    save_index(str(copy), chunks)
+    corrupt = copy.read_bytes()
+
+    # The rebuilt file would be wrong, so it is not rebuilt and the client does not report success
+    result = send(port, new_path, '--sync')
+    assert result.returncode != 0, result.stdout
+    assert 'did not report the digest' in result.stdout
+    assert 'digest verified' not in result.stdout
+    assert copy.read_bytes() == corrupt
+    assert not os.path.exists(str(copy) + INDEX_SUFFIX)
+
+    # The copy is indexed again, so the next sync sends what it lacks
+    result = send(port, new_path, '--sync')
+    assert result.returncode == 0, result.stdout
+    assert 'File digest verified' in result.stdout
+    assert copy.read_bytes() == new
+
+
+def test_sigterm_stops_the_workers_and_reports(tmp_path):
+    port = free_port()
+    log_path = tmp_path / 'server.log'
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen([sys.executable, '-u', APPLICATION, '-s', '-i', '127.0.0.1', '-p', str(port),
+                                    '-o', str(tmp_path), '--workers', '2'], stdout=log, stderr=subprocess.STDOUT)
+    try:
+        deadline = time.monotonic() + 10
+        while 'Server started' not in log_path.read_text():
+            assert process.poll() is None and time.monotonic() < deadline, log_path.read_text()
+            time.sleep(0.05)
+        process.terminate()
+        assert process.wait(10) == 0
+    finally:
+        process.kill()
+        process.wait()
+    assert '0 transfers received' in log_path.read_text()
+
+    # The workers are gone, so the port can be bound without SO_REUSEPORT
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', port))
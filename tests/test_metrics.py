@@ -0,0 +1,59 @@
+import argparse
+import json
+import sys
+
+import metrics
+from metrics import Histogram, MetricsReporter, ServerMetrics, open_reporter
+
+
+def test_histogram_buckets():
+    histogram = Histogram((1, 2, 4))
+    for value in (0.5, 1, 1.5, 4, 5):
+        histogram.record(value)
+    assert histogram.snapshot() == {'bounds': [1, 2, 4], 'counts': [2, 1, 1, 1], 'count': 5, 'mean': 2.4}
+    assert Histogram((1,)).snapshot()['mean'] is None
+
+
+def test_json_lines(tmp_path):
+    path = tmp_path / 'metrics.jsonl'
+    server_metrics = ServerMetrics(gauges=lambda: {'sessions_active': 2})
+    reporter = MetricsReporter(server_metrics, str(path), interval=3600)
+    server_metrics.bytes_written = 1000
+    server_metrics.reorder_depth.record(3)
+    reporter.emit()
+    server_metrics.bytes_written = 3000
+    reporter.close()
+
+    first, last = [json.loads(line) for line in path.read_text().splitlines()]
+    assert first['role'] == 'server' and first['sessions_active'] == 2
+    assert first['bytes_written'] == 1000 and last['bytes_written'] == 3000
+    assert first['reorder_depth']['counts'][2] == 1 and first['reorder_depth']['count'] == 1
+    assert set(ServerMetrics.COUNTERS) <= set(first)
+    assert last['interval_goodput_mbps'] > 0 and last['goodput_mbps'] > 0
+
+
+def test_socket_answers_a_request(tmp_path, monkeypatch, capsys):
+    socket_path = tmp_path / 'metrics.sock'
+    server_metrics = ServerMetrics()
+    server_metrics.acks_sent = 42
+    reporter = MetricsReporter(server_metrics, socket_path=str(socket_path), interval=3600)
+    try:
+        monkeypatch.setattr(sys, 'argv', ['metrics.py', str(socket_path)])
+        metrics.main()
+    finally:
+        reporter.close()
+    answer = json.loads(capsys.readouterr().out)
+    assert answer['role'] == 'server' and answer['acks_sent'] == 42
+    assert not socket_path.exists()
+
+
+def test_workers_tag_the_file_and_socket_names(tmp_path):
+    args = argparse.Namespace(metrics_file=str(tmp_path / 'metrics.jsonl'), metrics_socket=str(tmp_path / 'metrics.sock'),
+                              metrics_interval=3600)
+    reporter = open_reporter(args, ServerMetrics(), 'worker1')
+    try:
+        assert (tmp_path / 'metrics-worker1.sock').exists()
+    finally:
+        reporter.close()
+    assert (tmp_path / 'metrics-worker1.jsonl').exists()
+    assert open_reporter(argparse.Namespace(metrics_file=None, metrics_socket=None), ServerMetrics()) is None
@@ -0,0 +1,87 @@
+from protocol import *
+
+
+def test_options_round_trip():
+    options = {OPT_FILE_SIZE: (1234).to_bytes(8, 'big'), OPT_FILE_NAME: 'photo.jpg'.encode()}
+    assert decode_options(encode_options(options)) == options
+
+
+def test_truncated_option_is_ignored():
+    data = encode_options({OPT_FEATURES: bytes(4)}) + bytes((OPT_FILE_SIZE, 8, 1, 2))
+    assert decode_options(data) == {OPT_FEATURES: bytes(4)}
+
+
+def test_option_int():
+    options = {OPT_SEGMENT_SIZE: (1400).to_bytes(4, 'big')}
+    assert option_int(options, OPT_SEGMENT_SIZE) == 1400
+    assert option_int(options, OPT_MAX_SEGMENT, 7) == 7
+
+
+def test_stream_option_round_trip():
+    options = decode_options(encode_options(encode_stream(0xDEADBEEF, 2, 4, 1 << 40)))
+    assert decode_stream(options) == (0xDEADBEEF, 2, 4, 1 << 40)
+    assert decode_stream({}) is None
+    assert decode_stream({OPT_STREAM: b'short'}) is None
+
+
+def test_v2_data_packet_round_trip():
+    proto = HeaderV2(42)
+    options = encode_options({OPT_CRC: bytes(4)})
+    packet = proto.data_header(7, FIN_FLAG, 5, len(options)) + options + b'hello'
+    assert HeaderV2.connection_id_of(packet) == 42
+    sequence_number, acknowledgment_number, flags, decoded, payload = proto.parse(packet)
+    assert (sequence_number, acknowledgment_number, flags, payload) == (7, 0, FIN_FLAG, b'hello')
+    assert decoded == {OPT_CRC: bytes(4)}
+
+
+def test_v2_parse_data_returns_a_view():
+    proto = HeaderV2(1)
+    packet = bytearray(proto.data_header(0xFFFFFFFF, 0, 3) + b'abc')
+    sequence_number, _, _, payload = proto.parse_data(memoryview(packet))
+    assert sequence_number == 0xFFFFFFFF
+    assert isinstance(payload, memoryview) and payload == b'abc'
+
+
+def test_v2_control_and_ack_packets():
+    proto = HeaderV2(3)
+    packet = proto.control_packet(SYN_FLAG | ACK_FLAG, {OPT_FEATURES: SUPPORTED_FEATURES.to_bytes(4, 'big')})
+    _, _, flags, options, payload = proto.parse(packet)
+    assert flags == SYN_FLAG | ACK_FLAG and payload == b''
+    assert option_int(options, OPT_FEATURES) == SUPPORTED_FEATURES
+    assert proto.parse_ack(proto.ack_packet(99)) == (99, {})
+    assert proto.parse_ack(proto.control_packet(FIN_FLAG)) is None
+
+
+def test_v2_nack():
+    proto = HeaderV2(3)
+    assert proto.parse_nack(proto.control_packet(NACK_FLAG, acknowledgment_number=12)) == 12
+    assert proto.parse_nack(proto.ack_packet(12)) is None
+
+
+def test_v2_rejects_malformed_packets():
+    proto = HeaderV2(1)
+    packet = proto.data_header(1, 0, 4) + b'data'
+    assert proto.parse(packet[:proto.size - 1]) is None
+    assert proto.parse(packet + b'x') is None
+    assert proto.parse_data(packet[:-1]) is None
+    assert proto.parse(bytes([1]) + packet[1:]) is None
+
+
+def test_v1_round_trip():
+    proto = HeaderV1()
+    sequence_number, _, flags, options, payload = proto.parse(proto.data_header(65535, FIN_FLAG, 2) + b'ok')
+    assert (sequence_number, flags, options, payload) == (65535, FIN_FLAG, {}, b'ok')
+    assert proto.parse_ack(proto.ack_packet(5)) == (5, {})
+    assert proto.parse_nack(proto.ack_packet(5)) is None
+
+
+def test_sack_blocks_merge_runs():
+    options = encode_sack({5, 6, 7, 9, 12, 13})
+    assert decode_sack(decode_options(encode_options(options))) == [(5, 8), (9, 10), (12, 14)]
+    assert encode_sack([]) == {}
+
+
+def test_sack_keeps_the_lowest_blocks():
+    blocks = decode_sack(encode_sack(range(0, 4 * MAX_SACK_BLOCKS, 2)))
+    assert len(blocks) == MAX_SACK_BLOCKS
+    assert blocks[0] == (0, 1) and blocks[-1] == (2 * MAX_SACK_BLOCKS - 2, 2 * MAX_SACK_BLOCKS - 1)
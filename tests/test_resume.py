@@ -0,0 +1,76 @@
+import os
+
+from protocol import decode_resume, encode_resume
+from resume import ReceiveBitmap, ResumeState, file_identity
+
+FILE_ID = bytes(range(16))
+
+
+def test_bitmap_ranges():
+    bitmap = ReceiveBitmap(20)
+    for index in (0, 1, 2, 8, 9, 10, 11, 12, 13, 14, 15, 16, 19):
+        bitmap.add(index)
+    assert bitmap.ranges() == [(0, 3), (8, 17), (19, 20)]
+    assert 19 in bitmap and 3 not in bitmap and 20 not in bitmap and -1 not in bitmap
+
+
+def test_full_bitmap_is_one_range():
+    bitmap = ReceiveBitmap(13, bytes((0xFF, 0xFF)))
+    assert bitmap.ranges() == [(0, 13)]
+
+
+def test_rechunk_keeps_only_whole_chunks():
+    # 100-byte file, chunks 0-2 of 10 bytes received: bytes 0-29
+    bitmap = ReceiveBitmap(10)
+    for index in range(3):
+        bitmap.add(index)
+    assert bitmap.rechunk(10, 25, 100).ranges() == [(0, 1)]
+    assert bitmap.rechunk(10, 5, 100).ranges() == [(0, 6)]
+    assert bitmap.rechunk(10, 10, 100).ranges() == [(0, 3)]
+
+
+def test_rechunk_counts_the_short_last_chunk():
+    # 95-byte file: the last 30-byte chunk holds bytes 90-94, half of the last 20-byte chunk
+    bitmap = ReceiveBitmap(4)
+    bitmap.add(3)
+    assert bitmap.rechunk(30, 20, 95).ranges() == []
+    bitmap.add(2)
+    assert bitmap.rechunk(30, 20, 95).ranges() == [(3, 5)]
+
+
+def test_state_round_trip(tmp_path):
+    state = ResumeState(str(tmp_path / 'out.bin.resume'))
+    state.save(FILE_ID, 95, 10, 10, bytes((0xA0, 0x40)))
+    chunk_size, bitmap = state.load(FILE_ID, 95)
+    assert chunk_size == 10 and bitmap.ranges() == [(0, 1), (2, 3), (9, 10)]
+    assert state.load(bytes(16), 95) is None
+    assert state.load(FILE_ID, 96) is None
+
+
+def test_state_is_not_saved_once_closed(tmp_path):
+    path = tmp_path / 'out.bin.resume'
+    state = ResumeState(str(path))
+    state.close()
+    state.save(FILE_ID, 10, 10, 1, bytes(1))
+    assert not path.exists()
+    state = ResumeState(str(path))
+    state.save(FILE_ID, 10, 10, 1, bytes(1))
+    state.delete()
+    assert not path.exists()
+    assert ResumeState(str(path)).load(FILE_ID, 10) is None
+
+
+def test_file_identity_follows_name_size_and_time(tmp_path):
+    path = tmp_path / 'a.bin'
+    path.write_bytes(b'data')
+    os.utime(path, ns=(1, 1))
+    first = file_identity(str(path))
+    assert len(first) == 16 and file_identity(str(path)) == first
+    os.utime(path, ns=(2, 2))
+    assert file_identity(str(path)) != first
+
+
+def test_resume_payload_round_trip():
+    ranges = [(1, 5), (7, 8), (100, 200)]
+    assert decode_resume(encode_resume(ranges, 1000)) == ranges
+    assert decode_resume(encode_resume(ranges, 20)) == ranges[:2]
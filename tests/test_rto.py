@@ -0,0 +1,79 @@
+import pytest
+
+from rto import RTTEstimator, TimerHeap
+from utils import CLOCK_GRANULARITY, RTT_ALPHA, RTT_BETA
+
+
+def test_first_sample():
+    rtt = RTTEstimator(initial_rto=1.0, min_rto=0.0, max_rto=10.0)
+    assert rtt.rto == 1.0
+    rtt.sample(0.1)
+    assert rtt.srtt == 0.1 and rtt.rttvar == 0.05
+    assert rtt.rto == pytest.approx(0.1 + max(CLOCK_GRANULARITY, 0.2))
+
+
+def test_smoothing():
+    rtt = RTTEstimator(min_rto=0.0)
+    rtt.sample(0.1)
+    rtt.sample(0.2)
+    rttvar = (1 - RTT_BETA) * 0.05 + RTT_BETA * 0.1
+    srtt = (1 - RTT_ALPHA) * 0.1 + RTT_ALPHA * 0.2
+    assert rtt.rttvar == pytest.approx(rttvar)
+    assert rtt.srtt == pytest.approx(srtt)
+    assert rtt.rto == pytest.approx(srtt + 4 * rttvar)
+    assert rtt.stats()['samples'] == 2 and rtt.stats()['min_rtt_ms'] == 100.0
+
+
+def test_ack_delay_is_added():
+    without = RTTEstimator(min_rto=0.0)
+    with_delay = RTTEstimator(min_rto=0.0, ack_delay=0.04)
+    for estimator in (without, with_delay):
+        estimator.sample(0.01)
+    assert with_delay.rto == pytest.approx(without.rto + 0.04)
+
+
+def test_bounds():
+    rtt = RTTEstimator(min_rto=0.2, max_rto=1.0)
+    rtt.sample(0.001)
+    assert rtt.rto == 0.2
+    rtt.sample(5.0)
+    assert rtt.rto == 1.0
+
+
+def test_backoff_doubles_up_to_the_maximum():
+    rtt = RTTEstimator(initial_rto=0.5, max_rto=1.5)
+    rtt.backoff()
+    assert rtt.rto == 1.0
+    rtt.backoff()
+    assert rtt.rto == 1.5
+    assert rtt.backoffs == 2
+
+
+def test_timers_expire_in_order():
+    timers = TimerHeap()
+    timers.schedule(1, 3.0)
+    timers.schedule(2, 1.0)
+    timers.schedule(3, 2.0)
+    assert timers.next_deadline() == 1.0
+    assert timers.pop_expired(2.5) == [2, 3]
+    assert len(timers) == 1 and timers.next_deadline() == 3.0
+
+
+def test_rescheduled_and_cancelled_timers():
+    timers = TimerHeap()
+    timers.schedule(1, 1.0)
+    timers.schedule(1, 5.0)
+    timers.schedule(2, 2.0)
+    timers.cancel(2)
+    timers.cancel(7)
+    assert timers.pop_expired(4.0) == []
+    assert timers.pop_expired(5.0) == [1]
+    assert timers.next_deadline() is None
+
+
+def test_stale_entries_are_compacted():
+    timers = TimerHeap()
+    for deadline in range(1000):
+        timers.schedule(0, float(deadline))
+    assert len(timers.heap) <= 2 * len(timers) + 64
+    assert timers.pop_expired(999.0) == [0]
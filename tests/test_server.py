@@ -0,0 +1,144 @@
+import asyncio
+import struct
+import sys
+
+import pytest
+
+from protocol import *
+from server import HEADER_V1, DRTPServerProtocol
+from utils import DEFAULT_WINDOW, get_args, header_format
+
+CLIENT = ('127.0.0.1', 40000)
+
+
+def server_for(monkeypatch, output, worker_id=None, args=()):
+    monkeypatch.setattr(sys, 'argv', ['application.py', '-s', '-o', str(output), *args])
+    return DRTPServerProtocol(get_args(), worker_id)
+
+
+def test_trees_are_offered_only_into_a_directory(monkeypatch, tmp_path):
+    assert server_for(monkeypatch, tmp_path).offered_features() & FEATURE_TREE
+    output = tmp_path / 'received_file.jpg'
+    assert not server_for(monkeypatch, output).offered_features() & FEATURE_TREE
+    output.write_bytes(b'')
+    assert not server_for(monkeypatch, output).offered_features() & FEATURE_TREE
+
+
+def test_workers_tag_the_output_in_both_modes(monkeypatch, tmp_path):
+    server = server_for(monkeypatch, tmp_path, worker_id=1)
+    assert server.claim_output_path('x.bin', object()) == str(tmp_path / 'x-worker1.bin')
+    assert server.claim_output_path('x.bin', object()) == str(tmp_path / 'x-worker1-2.bin')
+    assert server.claim_output_path('x.bin', object(), 0xABCD) == str(tmp_path / 'x-0000abcd.bin')
+    server = server_for(monkeypatch, tmp_path / 'out.jpg', worker_id=2)
+    assert server.claim_output_path('x.bin', object()) == str(tmp_path / 'out-worker2.jpg')
+
+
+def test_one_process_keeps_the_name(monkeypatch, tmp_path):
+    server = server_for(monkeypatch, tmp_path)
+    assert server.claim_output_path('x.bin', object()) == str(tmp_path / 'x.bin')
+    assert server.claim_output_path('x.bin', object()) == str(tmp_path / 'x-2.bin')
+
+
+class Transport:
+    """
+    Keeps the datagrams the server sends instead of sending them.
+    """
+
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append(bytes(data))
+
+
+def connect(server, version, options):
+    """
+    Runs the handshake of a client at the given DRTP version.
+    Returns:
+        tuple: The header codec of the connection and the transport, emptied of the handshake.
+    """
+    transport = Transport()
+    server.connection_made(transport)
+    server.datagram_received(struct.pack(header_format, 0, version, SYN_FLAG), CLIENT)
+    if version == 1:
+        proto = HEADER_V1
+        server.datagram_received(proto.control_packet(ACK_FLAG), CLIENT)
+    else:
+        proto = HeaderV2(HeaderV2.connection_id_of(transport.sent[-1]))
+        server.datagram_received(proto.control_packet(ACK_FLAG, options), CLIENT)
+    transport.sent.clear()
+    return proto, transport
+
+
+def acks_after_each_packet(proto, server, transport, count):
+    """
+    Sends data packets in order and returns the acknowledgment numbers the server sent right
+    away after each of them, without giving the delayed ACK timer a chance to run.
+    """
+    acked = []
+    for seq in range(1, count + 1):
+        server.datagram_received(proto.data_header(seq, ACK_FLAG, 4) + b'data', CLIENT)
+        acked.append([proto.parse_ack(data)[0] for data in transport.sent])
+        transport.sent.clear()
+    return acked
+
+
+def v2_options(window):
+    options = {OPT_FEATURES: bytes(4), OPT_SEGMENT_SIZE: (1000).to_bytes(4, 'big'), OPT_FILE_NAME: b'x.bin'}
+    if window is not None:
+        options[OPT_WINDOW] = window.to_bytes(4, 'big')
+    return options
+
+
+@pytest.mark.parametrize('window, acked', [
+    (DEFAULT_WINDOW, [[1], [2], [3], [4], [5], [6]]),
+    (4, [[], [2], [], [4], [], [6]]),
+    (64, [[], [2], [], [4], [], [6]]),
+    (None, [[1], [2], [3], [4], [5], [6]]),
+])
+def test_acks_are_delayed_for_at_most_half_the_window(monkeypatch, tmp_path, window, acked):
+    async def run():
+        server = server_for(monkeypatch, tmp_path)
+        proto, transport = connect(server, 2, v2_options(window))
+        return acks_after_each_packet(proto, server, transport, 6)
+    assert asyncio.run(run()) == acked
+
+
+def test_ack_every_is_capped_by_the_window(monkeypatch, tmp_path):
+    async def run():
+        server = server_for(monkeypatch, tmp_path, args=['--ack-every', '8'])
+        proto, transport = connect(server, 2, v2_options(6))
+        return acks_after_each_packet(proto, server, transport, 6)
+    assert asyncio.run(run()) == [[], [], [3], [], [], [6]]
+
+
+def test_version_1_packets_are_acknowledged_at_once(monkeypatch, tmp_path):
+    async def run():
+        server = server_for(monkeypatch, tmp_path)
+        proto, transport = connect(server, 1, None)
+        return acks_after_each_packet(proto, server, transport, 4)
+    assert asyncio.run(run()) == [[1], [2], [3], [4]]
+
+
+def test_delayed_ack_is_sent_by_the_timer(monkeypatch, tmp_path):
+    async def run():
+        server = server_for(monkeypatch, tmp_path, args=['--ack-delay', '0.01'])
+        proto, transport = connect(server, 2, v2_options(64))
+        immediate = acks_after_each_packet(proto, server, transport, 3)
+        await asyncio.sleep(0.05)
+        return immediate, [proto.parse_ack(data)[0] for data in transport.sent]
+    assert asyncio.run(run()) == ([[], [2], []], [3])
+
+
+def test_a_chunk_the_writer_refuses_is_sent_again(monkeypatch, tmp_path):
+    async def run():
+        server = server_for(monkeypatch, tmp_path)
+        proto, transport = connect(server, 2, v2_options(DEFAULT_WINDOW))
+        session, = server.sessions.values()
+        write = session.writer.write
+        session.writer.write = lambda offset, data: False
+        refused = acks_after_each_packet(proto, server, transport, 1)
+        session.writer.write = write
+        acked = acks_after_each_packet(proto, server, transport, 2)
+        return refused, acked, session.writer.close()
+    assert asyncio.run(run()) == ([[]], [[1], [2]], 8)
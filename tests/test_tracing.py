@@ -0,0 +1,93 @@
+import csv
+import sys
+
+import pytest
+
+import tracetool
+from tracing import *
+
+
+def stopped_tracer(path, capacity):
+    """
+    Creates a tracer whose flush thread has stopped, so the test flushes it at known points.
+    """
+    tracer = Tracer(str(path), TRACE_PACKETS, capacity)
+    tracer.stopped = True
+    tracer.wakeup.set()
+    tracer.thread.join()
+    return tracer
+
+
+def test_ring_buffer_wraps_around_and_counts_dropped_events(tmp_path):
+    path = tmp_path / 'drtp.trace'
+    tracer = stopped_tracer(path, 8)
+    for seq in range(1, 6):
+        tracer.packet(EV_SEND, 7, seq, 0, seq, 10)
+    tracer._flush()
+
+    # The next events wrap around the end of the ring, until it is one event short of full
+    for seq in range(6, 15):
+        tracer.packet(EV_SEND, 7, seq, 0, seq, 10)
+    assert tracer.dropped == 2
+    tracer._flush()
+    tracer.event(EV_TIMEOUT, 7, 15)
+    tracer.close()
+
+    _, events = tracetool.read_trace(str(path))
+    assert [(event['kind'], event['seq']) for event in events] == (
+        [(EV_SEND, seq) for seq in range(1, 13)] + [(EV_DROPPED, 2), (EV_TIMEOUT, 15)])
+    times = [event['time'] for event in events]
+    assert times == sorted(times)
+
+
+def test_levels_filter_events(tmp_path):
+    path = tmp_path / 'drtp.trace'
+    tracer = Tracer(str(path), TRACE_EVENTS)
+    tracer.packet(EV_SEND, 7, 1)
+    tracer.event(EV_RETRANSMIT, 7, 1)
+    tracer.close()
+    assert [event['kind'] for event in tracetool.read_trace(str(path))[1]] == [EV_RETRANSMIT]
+
+    disabled = Tracer(str(tmp_path / 'off.trace'), TRACE_OFF)
+    disabled.event(EV_TIMEOUT, 7, 1)
+    disabled.close()
+    assert not (tmp_path / 'off.trace').exists()
+
+
+def test_tracetool_decodes_a_trace(tmp_path, monkeypatch, capsys):
+    path = tmp_path / 'drtp.trace'
+    tracer = Tracer(str(path), TRACE_PACKETS)
+    tracer.packet(EV_SEND, 7, 1, 0, 1, 4)
+    tracer.packet(EV_RECEIVE, 9, 1, 0, 0, 2)
+    tracer.packet(EV_ACK, 7, 0, 2, 0, 5)
+    tracer.event(EV_RETRANSMIT, 7, 2, 0, 1, 2)
+    tracer.close()
+
+    plot = tmp_path / 'plot.csv'
+    monkeypatch.setattr(sys, 'argv', ['tracetool.py', str(path), '--connection', '7', '--plot', str(plot)])
+    tracetool.main()
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0].endswith('#7 SEND seq=1 ack=0 in_flight=1 cwnd=4')
+    assert lines[2].endswith('#7 RETRANSMIT seq=2 ack=0 in_flight=1 cwnd=2')
+    assert lines[3] == '3 events: ACK 1, RETRANSMIT 1, SEND 1'
+    with open(plot, newline='') as rows:
+        assert [row[1:] for row in csv.reader(rows)] == [
+            ['connection', 'series', 'value'], ['7', 'send', '1'], ['7', 'ack', '2'], ['7', 'retransmit', '2']]
+
+    monkeypatch.setattr(sys, 'argv', ['tracetool.py', str(path), '--quiet'])
+    tracetool.main()
+    assert capsys.readouterr().out == '4 events: ACK 1, RECEIVE 1, RETRANSMIT 1, SEND 1\n'
+
+
+def test_tracetool_formats_server_and_dropped_events():
+    assert tracetool.format_event(0, {'time': 0.5, 'kind': EV_DROPPED, 'connection': 7, 'seq': 3}).endswith(
+        '+0.500000 #7 DROPPED 3 events lost')
+    event = {'time': 1.0, 'kind': EV_OUT_OF_ORDER, 'connection': 9, 'seq': 5, 'ack': 0, 'in_flight': 2, 'window': 3}
+    assert tracetool.format_event(0, event).endswith('#9 OUT_OF_ORDER seq=5 ack=0 buffered=2 expected=3')
+
+
+def test_tracetool_rejects_other_files(tmp_path):
+    path = tmp_path / 'not.trace'
+    path.write_bytes(b'x' * 64)
+    with pytest.raises(ValueError):
+        tracetool.read_trace(str(path))
@@ -0,0 +1,89 @@
+import os
+import time
+
+import pytest
+
+from tree import Tree, TreeChunks, TreeWriter, is_tree, manifest_entry, manifest_header, safe_name
+
+FILES = {'a.txt': b'alpha', 'empty': b'', 'sub/b.bin': bytes(range(256)) * 40, 'sub/deeper/c': b'c' * 3000}
+
+
+@pytest.fixture
+def source(tmp_path):
+    root = tmp_path / 'photos'
+    for name, data in FILES.items():
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(data)
+        os.utime(path, ns=(10 ** 18, 10 ** 18))
+    (root / 'a.txt').chmod(0o600)
+    return root
+
+
+def send(tree, output, chunk_size, threaded=False):
+    chunks = TreeChunks(tree, chunk_size)
+    writer = TreeWriter(str(output), threaded=threaded)
+    for index in range(len(chunks)):
+        # A full writer queue drops the chunk, which the client would send again
+        while not writer.write(index * chunk_size, chunks[index]):
+            time.sleep(0.001)
+    chunks.close()
+    return writer
+
+
+def test_is_tree(source):
+    assert is_tree(str(source))
+    assert is_tree(str(source / '*.txt'))
+    assert not is_tree(str(source / 'a.txt'))
+
+
+def test_manifest_lists_files_in_sorted_order(source):
+    tree = Tree(str(source))
+    assert tree.name == 'photos'
+    assert [name for name, _, _ in tree.files] == sorted(FILES)
+    assert tree.size == len(tree.manifest) + sum(len(data) for data in FILES.values())
+    magic, count, length = manifest_header.unpack_from(tree.manifest)
+    assert count == len(FILES) and manifest_header.size + length == len(tree.manifest)
+    size, mtime_ns, mode, name_length = manifest_entry.unpack_from(tree.manifest, manifest_header.size)
+    assert (size, mtime_ns, mode, name_length) == (5, 10 ** 18, 0o600, len('a.txt'))
+
+
+def test_glob_is_relative_to_the_deepest_common_directory(source):
+    tree = Tree(str(source / 'sub' / '**' / '*'))
+    assert tree.name == 'sub'
+    assert [name for name, _, _ in tree.files] == ['b.bin', 'deeper/c']
+    with pytest.raises(ValueError):
+        Tree(str(source / '*.none'))
+
+
+@pytest.mark.parametrize('chunk_size', [7, 1000, 1 << 20])
+@pytest.mark.parametrize('threaded', [False, True])
+def test_stream_round_trip(source, tmp_path, chunk_size, threaded):
+    output = tmp_path / 'received'
+    writer = send(Tree(str(source)), output, chunk_size, threaded)
+    writer.close()
+    assert writer.files_written == len(FILES)
+    for name, data in FILES.items():
+        path = output / name
+        assert path.read_bytes() == data
+        assert path.stat().st_mtime_ns == 10 ** 18
+    assert (output / 'a.txt').stat().st_mode & 0o777 == 0o600
+
+
+def test_truncated_stream_fails_on_close(source, tmp_path):
+    tree = Tree(str(source))
+    chunks = TreeChunks(tree, 100)
+    writer = TreeWriter(str(tmp_path / 'received'))
+    writer.write(0, chunks[0])
+    with pytest.raises(OSError):
+        writer.close()
+
+
+@pytest.mark.parametrize('name', ['../escape', '/etc/passwd', 'a//b', 'a/./b', ''])
+def test_safe_name_rejects_names_outside_the_directory(name):
+    with pytest.raises(ValueError):
+        safe_name(name)
+
+
+def test_safe_name_uses_the_platform_separator():
+    assert safe_name('a/b/c') == os.path.join('a', 'b', 'c')
@@ -0,0 +1,31 @@
+import threading
+import time
+
+from writer import FileWriter
+
+
+def test_chunks_land_at_their_offsets(tmp_path):
+    path = tmp_path / 'out.bin'
+    for threaded in (False, True):
+        writer = FileWriter(str(path), threaded=threaded)
+        assert writer.write(4, memoryview(b'4567'))
+        assert writer.write(0, b'0123')
+        assert writer.close() == 8
+        assert path.read_bytes() == b'01234567'
+
+
+def test_a_full_queue_refuses_chunks_without_waiting(tmp_path):
+    path = tmp_path / 'out.bin'
+    writer = FileWriter(str(path), threaded=True, queue_size=2)
+    # The thread is held up on the first chunk, as by a slow disk
+    disk = threading.Event()
+    pwrite = writer._pwrite
+    writer._pwrite = lambda offset, data: (disk.wait(), pwrite(offset, data))
+    assert writer.write(0, b'a')
+    while not writer.queue.empty():
+        time.sleep(0.001)
+    assert writer.write(1, b'b') and writer.write(2, b'c')
+    assert not writer.write(3, b'd')
+    disk.set()
+    assert writer.close() == 3
+    assert path.read_bytes() == b'abc'